@@ -9,6 +9,10 @@ import pickle
 from math import radians, sin, cos, sqrt, atan2
 import time
 from itertools import combinations
+from spatial_index import date_line_pairs, get_node_index
+from graph_utils import CSRGraph, csr_path_for, fresh_csr_path, load_csr_graph, save_csr_graph
+from pathfinder import SEARCH_METHODS, find_path_result, get_routing_engine
+from landmarks import attach_landmarks
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -17,6 +21,7 @@ CORS(app)  # Enable CORS for all routes
 graph = None
 graph_stats = None
 graph_file = None
+passage_graph = None
 
 def haversine(coord1, coord2):
     """Calculate distance between two coordinates in km with error handling"""
@@ -62,48 +67,17 @@ def connect_date_line_edges(graph):
     """
     print("Adding date line crossing connections...")
     
-    # Find nodes close to the date line
-    west_nodes = []  # Nodes near -180
-    east_nodes = []  # Nodes near +180
+    # Nodes within 5 degrees of either side, paired when within 1 degree of latitude
+    nodes = [node for node, data in graph.nodes(data=True) if 'coordinates' in data]
+    coords = [graph.nodes[node]['coordinates'][:2] for node in nodes]
+    west, east, dist = date_line_pairs(coords, buffer_degrees=5.0, max_lat_diff=1.0)
     
-    for node, data in graph.nodes(data=True):
-        if 'coordinates' not in data:
-            continue
-            
-        lon = data['coordinates'][0]
-        if -180 <= lon <= -175:
-            west_nodes.append((node, data['coordinates']))
-        elif 175 <= lon <= 180:
-            east_nodes.append((node, data['coordinates']))
-    
-    print(f"Found {len(west_nodes)} west nodes and {len(east_nodes)} east nodes near date line")
-    
-    # Connect across date line
+    # Add edges to connect across date line
     edges_added = 0
-    for west_node, west_coords in west_nodes:
-        west_lon, west_lat = west_coords
-        
-        # Find nodes at approximately the same latitude on the east side
-        for east_node, east_coords in east_nodes:
-            east_lon, east_lat = east_coords
-            
-            # Check if latitude is close enough (within 1 degree)
-            if abs(west_lat - east_lat) <= 1.0:
-                # Calculate distance as if these points were next to each other
-                # Add 360 to the west longitude to make it positive for the calculation
-                adjusted_west_lon = west_lon + 360
-                
-                # Calculate distance between points considering them adjacent
-                dist = haversine([adjusted_west_lon, west_lat], [east_lon, east_lat])
-                
-                # Add edge to connect across date line
-                if not graph.has_edge(west_node, east_node):
-                    graph.add_edge(
-                        west_node, east_node,
-                        weight=dist,
-                        date_line_crossing=True
-                    )
-                    edges_added += 1
+    for i, j, d in zip(west.tolist(), east.tolist(), dist.tolist()):
+        if not graph.has_edge(nodes[i], nodes[j]):
+            graph.add_edge(nodes[i], nodes[j], weight=d, date_line_crossing=True)
+            edges_added += 1
     
     print(f"Added {edges_added} date line crossing edges")
     return graph
@@ -126,6 +100,24 @@ def load_graph():
     ]
     
     for candidate in candidates:
+        # Prefer the compact memory-mapped sidecar when it is up to date
+        csr_path = fresh_csr_path(candidate)
+        if csr_path:
+            try:
+                start = time.time()
+                graph = load_csr_graph(csr_path)
+                graph_stats = graph.stats
+                graph_file = candidate
+                print(f"Loaded compact graph from {csr_path} in {(time.time() - start) * 1000:.1f}ms")
+                
+                # Build the nearest-node index once so requests never scan all nodes
+                index = get_node_index(graph)
+                print(f"Built spatial index over {len(index)} nodes")
+                
+                return graph
+            except Exception as e:
+                print(f"Error loading {csr_path}: {e}")
+        
         if os.path.exists(candidate):
             try:
                 print(f"Loading graph from {candidate}")
@@ -162,6 +154,18 @@ def load_graph():
                     except Exception as e:
                         print(f"Error saving graph: {e}")
                 
+                # Serve from the compact format and write it out so the next start is fast
+                graph = CSRGraph.from_networkx(graph, graph_stats)
+                try:
+                    save_csr_graph(graph, csr_path_for(candidate))
+                    print(f"Saved compact graph to {csr_path_for(candidate)}")
+                except Exception as e:
+                    print(f"Error saving compact graph: {e}")
+                
+                # Build the nearest-node index once so requests never scan all nodes
+                index = get_node_index(graph)
+                print(f"Built spatial index over {len(index)} nodes")
+                
                 return graph
                     
             except Exception as e:
@@ -172,15 +176,7 @@ def load_graph():
 
 def find_nearest_node(graph, point, max_distance=1000):  # Increased max distance to 1000 km
     """Find the nearest node in the graph to a given point"""
-    nearest_node = None
-    min_distance = float('inf')
-    
-    for node, data in graph.nodes(data=True):
-        if 'coordinates' in data:
-            dist = haversine(point, data['coordinates'])
-            if dist < min_distance:
-                min_distance = dist
-                nearest_node = node
+    nearest_node, min_distance = get_node_index(graph).nearest(point)
     
     if min_distance > max_distance:
         return None, min_distance
@@ -245,7 +241,7 @@ def load_maritime_passages():
 def add_maritime_passages(graph, passages):
     """Add maritime passage connections to the graph"""
     print("Adding maritime passages...")
-    passages_added = 0
+    passage_edges = []
     
     for passage in passages:
         # Find nearest nodes to passage endpoints
@@ -257,81 +253,62 @@ def add_maritime_passages(graph, passages):
             dist = haversine(passage['coordinates'][0], passage['coordinates'][1])
             weight = dist * passage.get('weight_multiplier', 0.8)  # Reduce weight to prefer passages
             
-            graph.add_edge(
-                start_node, end_node,
-                weight=weight,
-                passage_name=passage['name'],
-                is_passage=True
-            )
-            passages_added += 1
-            
-    print(f"Added {passages_added} maritime passages")
+            passage_edges.append((start_node, end_node, {
+                'weight': weight,
+                'passage_name': passage['name'],
+                'is_passage': True
+            }))
+    
+    # The compact graph is immutable, so passages produce a new graph
+    graph = graph.with_edges(passage_edges)
+    print(f"Added {len(passage_edges)} maritime passages")
     return graph
 
-def calculate_ocean_path(graph, source_node, dest_node, vessel_data):
-    """Calculate path using only ocean nodes and maritime passages"""
-    
-    def ocean_weight(u, v, edge_data):
-        """Custom weight function that only allows water routes"""
-        # Check if either node is not an ocean node or maritime passage
-        u_data = graph.nodes[u]
-        v_data = graph.nodes[v]
-        
-        # Allow if it's a maritime passage
-        if edge_data.get('is_passage'):
-            return edge_data['weight'] * 0.8
-            
-        # Check if both nodes are water nodes
-        if (u_data.get('type') == 'ocean' and v_data.get('type') == 'ocean'):
-            return edge_data['weight']
-            
-        # Return infinity for non-water paths
-        return float('inf')
+def load_passage_graph():
+    """Return the loaded graph with maritime passages added (built once)"""
+    global passage_graph
     
-    try:
-        # Use custom weight function with A* algorithm
-        path = nx.astar_path(
-            graph,
-            source_node,
-            dest_node,
-            weight=ocean_weight,
-            heuristic=lambda n1, n2: haversine(
-                graph.nodes[n1]['coordinates'],
-                graph.nodes[n2]['coordinates']
-            ) * 0.8
-        )
-        return path
-    except nx.NetworkXNoPath:
-        return None
+    if passage_graph is None:
+        g = load_graph()
+        if g is None:
+            return None
+        passage_graph = add_maritime_passages(g, load_maritime_passages())
+        
+        # Build its spatial index up front rather than on the first request
+        get_node_index(passage_graph)
+        
+        # The passage graph only exists in memory, so its ALT landmarks are selected here
+        attach_landmarks(get_routing_engine(passage_graph, water_only=True, passage_factor=0.8))
+        
+    return passage_graph
+
+def calculate_ocean_path(graph, source_node, dest_node, vessel_data, search=None):
+    """Calculate path using only ocean nodes and maritime passages"""
+    # Non-water edges are masked out and passages discounted by 0.8 when the
+    # engine is built, so the search itself never touches node dicts
+    return find_path_result(
+        graph, source_node, dest_node,
+        water_only=True,
+        passage_factor=0.8,
+        heuristic_scale=0.8,
+        method=search
+    )
 
 def find_nearest_ocean_node(graph, point, max_distance=1000):
     """Find the nearest ocean or port node with improved search"""
-    nearest_node = None
-    min_distance = float('inf')
-    candidates = []
+    index = get_node_index(graph)
     
-    for node, data in graph.nodes(data=True):
-        # Only consider ocean nodes and ports
-        if data.get('type') in ['ocean', 'port']:
-            dist = haversine(point, data['coordinates'])
-            if dist < min_distance:
-                min_distance = dist
-                nearest_node = node
-            # Keep track of all close nodes
-            if dist < max_distance:
-                candidates.append((node, dist, data))
+    # Only consider ocean nodes and ports
+    nearest_node, min_distance = index.nearest(point, types=('ocean', 'port'))
     
-    if not candidates:
+    if nearest_node is None or min_distance >= max_distance:
         print(f"No ocean nodes found within {max_distance}km of point {point}")
         return None, min_distance
     
-    # Sort candidates by distance
-    candidates.sort(key=lambda x: x[1])
-    
     # Try to prefer ocean nodes over ports if they're within reasonable distance
-    ocean_candidates = [c for c in candidates if c[2].get('type') == 'ocean']
-    if ocean_candidates and ocean_candidates[0][1] < min_distance * 1.2:  # Within 20% of closest distance
-        return ocean_candidates[0][0], ocean_candidates[0][1]
+    ocean_node, ocean_distance = index.nearest(point, types=('ocean',))
+    if ocean_node is not None and ocean_distance < max_distance and ocean_distance < min_distance * 1.2:  # Within 20% of closest distance
+        return ocean_node, ocean_distance
         
     # If no good ocean nodes, use the closest port or ocean node
     return nearest_node, min_distance
@@ -383,9 +360,13 @@ def shortest_ocean_path():
             'consumption_rate': 1.0,
             'type': 'generic'
         })
+        search = data.get('search')  # Optional: 'astar' (default here) or 'alt'
         
         if not source or not destination:
             return jsonify({"error": "Source and destination are required"}), 400
+        
+        if search is not None and search not in SEARCH_METHODS:
+            return jsonify({"error": f"search must be one of {', '.join(SEARCH_METHODS)}"}), 400
             
         try:
             # Validate coordinate ranges
@@ -410,11 +391,7 @@ def shortest_ocean_path():
         print(f"Finding path from {source} to {destination}")
         
         # Load graph and maritime passages
-        g = load_graph()
-        if not hasattr(g, 'has_passages'):
-            passages = load_maritime_passages()
-            g = add_maritime_passages(g, passages)
-            g.has_passages = True
+        g = load_passage_graph()
         
         # Use expanded search radius for source and destination
         source_node, source_dist = find_nearest_ocean_node(g, source, max_distance=2000)
@@ -435,10 +412,13 @@ def shortest_ocean_path():
         print(f"Found nodes - Source: {g.nodes[source_node]}, Destination: {g.nodes[dest_node]}")
         
         # Calculate path using water-only routing
-        path = calculate_ocean_path(g, source_node, dest_node, vessel)
+        search_result = calculate_ocean_path(g, source_node, dest_node, vessel, search)
         
-        if not path:
+        if not search_result:
             return jsonify({"error": "No valid ocean path found"}), 404
+        
+        path = search_result.path
+        print(f"Search: {search_result.method}, expanded {search_result.expanded} nodes")
             
         # Extract path details
         coordinates = []
@@ -478,6 +458,8 @@ def shortest_ocean_path():
             "total_distance": total_distance,
             "estimated_time": estimated_time,
             "fuel_consumption": fuel_consumption,
+            "search": search_result.method,
+            "expanded_nodes": search_result.expanded,
             "coordinates": coordinates
         }
         
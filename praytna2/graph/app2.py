@@ -1,66 +1,94 @@
 # Add CORS support to your Flask backend
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import json
-import requests
 import os
 import networkx as nx
 import pickle
-from math import radians, sin, cos, sqrt, atan2
+from math import radians, sin, cos, sqrt, atan2, isfinite
 import time
+import numpy as np
+from spatial_index import date_line_pairs, get_node_index
+from graph_utils import CSRGraph, EDGE_DATE_LINE, csr_path_for, fresh_csr_path, load_csr_graph, save_csr_graph
+from pathfinder import SEARCH_METHODS, CostOverlay, PathResult, get_routing_engine, lane_penalty_level, path_edges, distance_matrix, find_path_result, find_paths_batch
+from contraction import load_overlay
+from landmarks import ensure_landmarks
+from corridor import attach_corridor
+from weather_router import VoyageTimes, WeatherClient, get_edge_weather, leg_geometry, load_weather, wave_factor, weather_factors, weather_path_for
+from route_cache import DEFAULT_CACHE_SIZE, RouteCache, graph_file_version, profile_key
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
-weather_cache = {}
 
 # Global variables to store the graph
 graph = None
 graph_stats = None
 graph_file = None
+graph_version = None
+
+# Graph files load_graph tries, in order
+GRAPH_CANDIDATES = [
+    'models/ocean_graph_1deg_global.pkl',
+    'ocean_graph_connected.pkl',
+    'ocean_graph_1deg_updated.pkl',
+    'ocean_graph_1deg.pkl',
+    'ocean_graph_with_passages.pkl',
+    'ocean_graph.pkl'
+]
+
+# Gridded forecast sampled by optimal_path (see weather_router.py), with the meta.json mtime it was loaded at
+weather_raster = None
+weather_loaded = None
+
+# Snapped-route cache, shared between workers when ROUTE_CACHE_DB names a SQLite file
+route_cache = RouteCache(int(os.environ.get('ROUTE_CACHE_SIZE', DEFAULT_CACHE_SIZE)), os.environ.get('ROUTE_CACHE_DB'))
 
 # ---- Open-Meteo Configuration ----
 # Corrected Open-Meteo Configuration
 BASE_URL = "https://marine-api.open-meteo.com/v1/marine"
-VALID_PARAMS = {
-    'hourly': 'wave_height,wind_wave_height,wind_wave_direction,wind_wave_period',
-    'timezone': 'GMT'
-}
+
+def get_weather_raster():
+    """The forecast raster saved next to the loaded graph, reloaded when it is refreshed; None if missing"""
+    global weather_raster, weather_loaded
+    if graph_file is None:
+        return None
+    meta_path = os.path.join(weather_path_for(graph_file), 'meta.json')
+    loaded = (meta_path, os.path.getmtime(meta_path)) if os.path.exists(meta_path) else None
+    if loaded != weather_loaded:
+        try:
+            weather_raster = load_weather(graph_file) if loaded else None
+        except Exception as e:
+            print(f"Error loading weather raster: {e}")
+            weather_raster = None
+        weather_loaded = loaded
+    return weather_raster
+
+# Live lookups share one pooled, cached client (grid-snapped, deduplicated, parallel)
+weather_client = WeatherClient(BASE_URL)
+
+def marine_conditions(series, hour_index=0):
+    """Pick one hour out of a weather_client series, in get_marine_weather's format"""
+    def value(name):
+        values = series.get(name) or [None]
+        return values[min(hour_index, len(values) - 1)]
+    
+    return {
+        'wave_height': value('wave_height'),
+        'wind_wave_height': value('wind_wave_height'),
+        'wind_wave_dir': value('wind_wave_direction'),
+        'wind_wave_period': value('wind_wave_period')
+    }
 
 def get_marine_weather(lat, lon):
     """Fetch marine-specific weather data with proper parameters"""
-    print(f"\n=== Fetching marine weather for ({lat:.4f}, {lon:.4f}) ===")
-    
-    try:
-        # Validate coordinates
-        if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
-            print(f"!! Invalid coordinates ({lat}, {lon})")
-            return None
-
-        params = {**VALID_PARAMS, 'latitude': lat, 'longitude': lon}
-        print(f"API Request: {BASE_URL}?{'&'.join(f'{k}={v}' for k,v in params.items())}")
-        
-        response = requests.get(BASE_URL, params=params, timeout=10)
-        response.raise_for_status()
-        
-        json_data = response.json()
-        print("API Response Structure:", json_data.keys())  # Debug response format
-        
-        # Extract marine-specific parameters
-        return {
-            'wave_height': json_data['hourly']['wave_height'][0],
-            'wind_wave_height': json_data['hourly']['wind_wave_height'][0],
-            'wind_wave_dir': json_data['hourly']['wind_wave_direction'][0],
-            'wind_wave_period': json_data['hourly']['wind_wave_period'][0]
-        }
-        
-    except requests.exceptions.HTTPError as e:
-        print(f"!! API Error: {e}")
-        print(f"Response Content: {response.text}")
-        return None
-    except Exception as e:
-        print(f"!! Unexpected Error: {str(e)}")
+    # Validate coordinates
+    if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        print(f"!! Invalid coordinates ({lat}, {lon})")
         return None
+    
+    series = weather_client.get(lat, lon)
+    return marine_conditions(series) if series else None
 
 # Updated weight calculation using marine parameters
 def calculate_wind_penalty(wind_wave_dir, edge_dir, wind_wave_height):
@@ -92,6 +120,15 @@ def calculate_wind_penalty(wind_wave_dir, edge_dir, wind_wave_height):
 #             print(f"Blacklisting problematic coordinates ({lat}, {lon})")
 #             blacklisted_coords.add((lat, lon))
 
+def is_finite_number(value):
+    """Whether value is a finite JSON number (not a bool, NaN or Infinity)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and isfinite(value)
+
+def is_lon_lat(point):
+    """Whether point is a [lon, lat] pair of finite numbers within range"""
+    return (isinstance(point, (list, tuple)) and len(point) == 2 and all(map(is_finite_number, point))
+            and -180 <= point[0] <= 180 and -90 <= point[1] <= 90)
+
 def haversine(coord1, coord2):
     """Calculate distance between two coordinates in km"""
     lon1, lat1 = coord1
@@ -126,70 +163,88 @@ def connect_date_line_edges(graph):
     """
     print("Adding date line crossing connections...")
     
-    # Find nodes close to the date line
-    west_nodes = []  # Nodes near -180
-    east_nodes = []  # Nodes near +180
+    # Nodes within 5 degrees of either side, paired when within 1 degree of latitude
+    nodes = [node for node, data in graph.nodes(data=True) if 'coordinates' in data]
+    coords = [graph.nodes[node]['coordinates'][:2] for node in nodes]
+    west, east, dist = date_line_pairs(coords, buffer_degrees=5.0, max_lat_diff=1.0)
     
-    for node, data in graph.nodes(data=True):
-        if 'coordinates' not in data:
-            continue
-            
-        lon = data['coordinates'][0]
-        if -180 <= lon <= -175:
-            west_nodes.append((node, data['coordinates']))
-        elif 175 <= lon <= 180:
-            east_nodes.append((node, data['coordinates']))
-    
-    print(f"Found {len(west_nodes)} west nodes and {len(east_nodes)} east nodes near date line")
-    
-    # Connect across date line
+    # Add edges to connect across date line
     edges_added = 0
-    for west_node, west_coords in west_nodes:
-        west_lon, west_lat = west_coords
-        
-        # Find nodes at approximately the same latitude on the east side
-        for east_node, east_coords in east_nodes:
-            east_lon, east_lat = east_coords
-            
-            # Check if latitude is close enough (within 1 degree)
-            if abs(west_lat - east_lat) <= 1.0:
-                # Calculate distance as if these points were next to each other
-                # Add 360 to the west longitude to make it positive for the calculation
-                adjusted_west_lon = west_lon + 360
-                
-                # Calculate distance between points considering them adjacent
-                dist = haversine([adjusted_west_lon, west_lat], [east_lon, east_lat])
-                
-                # Add edge to connect across date line
-                if not graph.has_edge(west_node, east_node):
-                    graph.add_edge(
-                        west_node, east_node,
-                        weight=dist,
-                        date_line_crossing=True
-                    )
-                    edges_added += 1
+    for i, j, d in zip(west.tolist(), east.tolist(), dist.tolist()):
+        if not graph.has_edge(nodes[i], nodes[j]):
+            graph.add_edge(nodes[i], nodes[j], weight=d, date_line_crossing=True)
+            edges_added += 1
     
     print(f"Added {edges_added} date line crossing edges")
     return graph
 
+def _prepare_graph(graph, candidate):
+    """
+    Everything a freshly loaded graph needs before it serves requests;
+    returns the graph version the route cache is now keyed on
+    """
+    # Build the nearest-node index once so requests never scan all nodes
+    index = get_node_index(graph)
+    print(f"Built spatial index over {len(index)} nodes")
+    
+    # The rest only speeds searches up: a sidecar that cannot be read or
+    # written (e.g. on a read-only deploy) is logged and the graph still serves
+    # Use the contraction hierarchy overlay when one has been built
+    try:
+        if load_overlay(graph, csr_path_for(candidate)):
+            print("Loaded contraction hierarchy overlay")
+    except Exception as e:
+        print(f"Error loading contraction hierarchy overlay: {e}")
+    
+    # ALT landmark tables are cheap, so they are built on first load if missing
+    try:
+        ensure_landmarks(graph, csr_path_for(candidate))
+    except Exception as e:
+        print(f"Error preparing ALT landmarks: {e}")
+    
+    # Coarse level for two-level corridor routing (search='corridor')
+    try:
+        attach_corridor(graph)
+    except Exception as e:
+        print(f"Error attaching corridor routing: {e}")
+    
+    # Component labels make reachability checks a comparison instead of a search
+    components = len(np.unique(get_routing_engine(graph).component_labels()))
+    print(f"Labelled {components} connected components")
+    
+    # Routes cached for any other graph file are no longer valid
+    version = graph_file_version(candidate)
+    route_cache.set_version(version)
+    return version
+
 def load_graph():
     """Load the ocean routing graph"""
-    global graph, graph_stats, graph_file
+    global graph, graph_stats, graph_file, graph_version
     
-    # If graph already loaded, return it
+    # If graph already loaded, return it unless its file has since been rebuilt
     if graph is not None:
-        return graph
+        if graph_file_version(graph_file) == graph_version:
+            return graph
+        print(f"{graph_file} has changed on disk; reloading")
+        graph = None
     
     # Try to find a graph file
-    candidates = [
-        'ocean_graph_connected.pkl',
-        'ocean_graph_1deg_updated.pkl',
-        'ocean_graph_1deg.pkl',
-        'ocean_graph_with_passages.pkl',
-        'ocean_graph.pkl'
-    ]
-    
-    for candidate in candidates:
+    for candidate in GRAPH_CANDIDATES:
+        # Prefer the compact memory-mapped sidecar when it is up to date
+        csr_path = fresh_csr_path(candidate)
+        if csr_path:
+            try:
+                start = time.time()
+                graph = load_csr_graph(csr_path)
+                graph_stats = graph.stats
+                graph_file = candidate
+                print(f"Loaded compact graph from {csr_path} in {(time.time() - start) * 1000:.1f}ms")
+                
+                graph_version = _prepare_graph(graph, candidate)
+                return graph
+            except Exception as e:
+                print(f"Error loading {csr_path}: {e}")
+        
         if os.path.exists(candidate):
             try:
                 print(f"Loading graph from {candidate}")
@@ -226,6 +281,15 @@ def load_graph():
                     except Exception as e:
                         print(f"Error saving graph: {e}")
                 
+                # Serve from the compact format and write it out so the next start is fast
+                graph = CSRGraph.from_networkx(graph, graph_stats)
+                try:
+                    save_csr_graph(graph, csr_path_for(candidate))
+                    print(f"Saved compact graph to {csr_path_for(candidate)}")
+                except Exception as e:
+                    print(f"Error saving compact graph: {e}")
+                
+                graph_version = _prepare_graph(graph, candidate)
                 return graph
                     
             except Exception as e:
@@ -236,118 +300,30 @@ def load_graph():
 
 def find_nearest_node(graph, point, max_distance=5000):  # Already high enough at 5000km
     """Find the nearest node in the graph to a given point"""
-    nearest_node = None
-    min_distance = float('inf')
-    backup_node = None
-    backup_distance = float('inf')
-    
-    # Normalize the input coordinates
-    lon, lat = point
-    lon = ((lon + 180) % 360) - 180  # Normalize longitude to [-180, 180]
-    
-    for node, data in graph.nodes(data=True):
-        if 'coordinates' not in data:
-            continue
-            
-        node_lon, node_lat = data['coordinates']
-        # Normalize node longitude
-        node_lon = ((node_lon + 180) % 360) - 180
-        
-        try:
-            dist = haversine([lon, lat], [node_lon, node_lat])
-            
-            # For coastal points, prefer nodes closer to shore
-            if 'coastal' in data and data['coastal']:
-                dist *= 0.8  # Give 20% preference to coastal nodes
-            
-            if dist < min_distance:
-                min_distance = dist
-                nearest_node = node
-                
-            # Keep a backup of any node within 6000km
-            if dist < 6000 and dist < backup_distance:
-                backup_distance = dist
-                backup_node = node
-                
-        except ValueError as e:
-            print(f"Error calculating distance for node {node}: {e}")
-            continue
-    
-    # If no node found within max_distance but we have a backup, use it
-    if nearest_node is None and backup_node is not None:
-        print(f"Warning: Using backup node at {backup_distance:.2f} km")
-        return backup_node, backup_distance
+    # For coastal points, prefer nodes closer to shore (20% preference)
+    nearest_node, min_distance = get_node_index(graph).nearest(point, coastal_factor=0.8)
     
+    # Anything within 6000km is still usable as a backup node
     if min_distance > max_distance:
-        if backup_node is not None:
-            return backup_node, backup_distance
+        if nearest_node is not None and min_distance < 6000:
+            print(f"Warning: Using backup node at {min_distance:.2f} km")
+            return nearest_node, min_distance
         return None, min_distance
     
     return nearest_node, min_distance
 
 def find_nearest_water_node(graph, point, max_distance=2500):  # Increased from 500
     """Find the nearest navigable water node to a given point"""
-    nearest_node = None
-    min_distance = float('inf')
-    candidates = []
-    search_radius = max_distance
-    
-    lon, lat = point
-    lon = ((lon + 180) % 360) - 180  # Normalize longitude
-    
-    # First pass - look for nodes within initial search radius
-    for node, data in graph.nodes(data=True):
-        if 'coordinates' not in data:
-            continue
-            
-        node_lon, node_lat = data['coordinates']
-        node_lon = ((node_lon + 180) % 360) - 180
-        
-        try:
-            dist = haversine([lon, lat], [node_lon, node_lat])
-            
-            # Store candidates and track closest node
-            if dist <= search_radius:
-                candidates.append((node, dist))
-            
-            if dist < min_distance:
-                min_distance = dist
-                nearest_node = node
-                
-        except ValueError as e:
-            print(f"Error calculating distance for node {node}: {e}")
-            continue
-    
-    # If no nodes found in initial radius, gradually increase search radius
-    while not candidates and search_radius < 5000:  # Cap at 5000km
-        search_radius += 500
-        print(f"No nodes found within {search_radius-500}km, expanding search to {search_radius}km")
-        
-        for node, data in graph.nodes(data=True):
-            if 'coordinates' not in data:
-                continue
-                
-            node_lon, node_lat = data['coordinates']
-            node_lon = ((node_lon + 180) % 360) - 180
-            
-            try:
-                dist = haversine([lon, lat], [node_lon, node_lat])
-                if dist <= search_radius:
-                    candidates.append((node, dist))
-            except ValueError:
-                continue
+    nearest_node, min_distance = get_node_index(graph).nearest(point)
     
-    # Sort candidates by distance
-    candidates.sort(key=lambda x: x[1])
-    
-    # If still no candidates, return closest node found (if any)
-    if not candidates and nearest_node:
-        print(f"No nodes found within {search_radius}km, using closest at {min_distance:.2f}km")
-        return nearest_node, min_distance
-    elif not candidates:
+    if nearest_node is None:
         return None, min_distance
-        
-    return candidates[0]
+    
+    # The index always finds the closest node, however far away it is
+    if min_distance > max_distance:
+        print(f"No nodes found within {max_distance}km, using closest at {min_distance:.2f}km")
+    
+    return nearest_node, min_distance
 
 @app.route('/', methods=['GET'])
 def index():
@@ -358,10 +334,20 @@ def index():
         "endpoints": [
             "/graph_info",
             "/shortest_ocean_path",
+            "/batch_ocean_paths",
+            "/distance_matrix",
             "/optimal_ocean_path"
         ]
     })
 
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check for the load balancer (render.yaml healthCheckPath)"""
+    return jsonify({
+        "status": "healthy" if graph is not None else "loading",
+        "version": "1.0"
+    })
+
 @app.route('/graph_info', methods=['GET'])
 def get_graph_info():
     """Return information about the loaded graph"""
@@ -372,7 +358,10 @@ def get_graph_info():
     info = {
         "nodes": g.number_of_nodes(),
         "edges": g.number_of_edges(),
-        "file": graph_file
+        "file": graph_file,
+        # Lane preference needs the lane distances from shipping_lanes.py
+        "lane_distances": bool(np.isfinite(g.lane_distances).any()),
+        "route_cache": route_cache.stats()
     }
     
     if graph_stats:
@@ -392,10 +381,20 @@ def shortest_ocean_path():
         source = data.get('source')
         destination = data.get('destination')
         vessel = data.get('vessel', {})  # Add default empty vessel dict
+        search = data.get('search')  # Optional: 'astar', 'alt' or 'ch'
+        lane_preference = data.get('lane_preference', 0)  # Optional: >0 keeps routes near shipping lanes
         
         if not source or not destination:
             return jsonify({"error": "Source and destination are required"}), 400
         
+        if search is not None and search not in SEARCH_METHODS:
+            return jsonify({"error": f"search must be one of {', '.join(SEARCH_METHODS)}"}), 400
+        
+        if not is_finite_number(lane_preference) or lane_preference < 0:
+            return jsonify({"error": "lane_preference must be a non-negative number"}), 400
+        # Rounded and capped the way the engine cache keys it, so equal routes share a cache entry
+        lane_preference = lane_penalty_level(lane_preference)
+        
         # Log the received coordinates for debugging
         print(f"Finding path from {source} to {destination}")
         
@@ -427,27 +426,31 @@ def shortest_ocean_path():
         
         # Get graph edge count before path calculation for debugging
         print(f"Graph has {g.number_of_edges()} edges")
-        print(f"Date line crossings: {sum(1 for _, _, d in g.edges(data=True) if d.get('date_line_crossing', False))}")
+        print(f"Date line crossings: {g.count_flagged_edges(EDGE_DATE_LINE)}")
         
-        # Check if path exists before calculating
-        if not nx.has_path(g, source_node, dest_node):
-            # Try to find path using the date line crossing edges
-            print("No direct path found. Looking for path with date line crossing...")
-            date_line_edges = [(u, v) for u, v, d in g.edges(data=True) if d.get('date_line_crossing', True)]
-            print(f"Found {len(date_line_edges)} date line crossing edges")
-            
-            # Add temporary edges if needed for transpacific routes
-            if abs(source[0] - destination[0]) > 180:
-                print("Transpacific route detected, adding temporary connections...")
-                g = connect_transpacific_points(g, source_node, dest_node)
-            
-            if not nx.has_path(g, source_node, dest_node):
-                return jsonify({"error": "No path exists between the points"}), 404
-        
-        # Calculate shortest path
+        # Repeated lanes are answered from the route cache
         start_time = time.time()
-        path = nx.shortest_path(g, source=source_node, target=dest_node, weight='weight')
+        profile = profile_key(vessel=vessel, search=search, lane_preference=lane_preference)
+        cached = route_cache.get(source_node, dest_node, profile)
+        if cached is not None:
+            search_result = PathResult(cached['path'], cached['cost'], cached['expanded'], cached['method'])
+        elif get_routing_engine(g).reachable(g.index_of(source_node), g.index_of(dest_node)):
+            # Calculate shortest path with the array engine
+            search_result = find_path_result(g, source_node, dest_node, method=search,
+                                             lane_penalty=float(lane_preference))
+            if search_result is not None:
+                route_cache.put(source_node, dest_node, profile, search_result._asdict())
+        else:
+            # Different components: no search can succeed
+            search_result = None
+        path = search_result.path if search_result else None
+        
+        if path is None:
+            # Antimeridian crossings are ordinary graph edges, so there is nothing left to try
+            return jsonify({"error": "No path exists between the points"}), 404
+        
         end_time = time.time()
+        print(f"Search: {search_result.method}, expanded {search_result.expanded} nodes")
         
         # Extract coordinates and calculate total distance
         coordinates = []
@@ -496,6 +499,10 @@ def shortest_ocean_path():
             "path_length": len(path),
             "total_distance": total_distance,
             "computation_time": end_time - start_time,
+            "search": search_result.method,
+            "expanded_nodes": search_result.expanded,
+            "lane_preference": lane_preference,
+            "cached": cached is not None,
             "coordinates": coordinates,
             "transpacific": is_transpacific
         }
@@ -509,6 +516,127 @@ def shortest_ocean_path():
         print(f"Error processing request: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def batch_routes(g, pairs):
+    """
+    Route a list of (source, destination) [lon, lat] pairs on g. All endpoints
+    are snapped in one spatial index query and pairs sharing a source share
+    one shortest-path tree. Yields one result dict per pair, tagged with its
+    position in the input, grouped by source as each tree finishes.
+    """
+    points = [point for pair in pairs for point in pair]
+    nodes, distances = get_node_index(g).nearest_many(points)
+    node_pairs = list(zip(nodes[0::2], nodes[1::2]))
+    
+    for i, result in find_paths_batch(g, node_pairs):
+        source, destination = pairs[i]
+        line = {
+            "index": i,
+            "source": source,
+            "destination": destination,
+            "source_node": node_pairs[i][0],
+            "destination_node": node_pairs[i][1],
+            "snap_distance": [float(distances[2 * i]), float(distances[2 * i + 1])],
+        }
+        if result is None:
+            line["error"] = "No path exists between the points"
+        else:
+            line.update({
+                "path_length": len(result.path),
+                "total_distance": result.cost,
+                "coordinates": [source] + [list(g.nodes[node]['coordinates']) for node in result.path] + [destination]
+            })
+        yield line
+
+@app.route('/batch_ocean_paths', methods=['POST'])
+def batch_ocean_paths():
+    """Route many origin/destination pairs, streaming one NDJSON line per pair"""
+    data = request.get_json(silent=True)
+    if not data or not data.get('pairs'):
+        return jsonify({"error": "A non-empty 'pairs' list is required"}), 400
+    
+    pairs = []
+    for i, pair in enumerate(data['pairs']):
+        source = pair.get('source') if isinstance(pair, dict) else None
+        destination = pair.get('destination') if isinstance(pair, dict) else None
+        # Checked here, since a bad pair found while streaming would truncate a 200 response
+        if not (is_lon_lat(source) and is_lon_lat(destination)):
+            return jsonify({"error": f"Pair {i} needs [lon, lat] source and destination in degrees"}), 400
+        pairs.append((source, destination))
+    
+    g = load_graph()
+    if g is None:
+        return jsonify({"error": "Failed to load graph"}), 500
+    
+    print(f"Batch routing {len(pairs)} pairs")
+    
+    def generate():
+        for line in batch_routes(g, pairs):
+            yield json.dumps(line) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/distance_matrix', methods=['POST'])
+def distance_matrix_endpoint():
+    """
+    N x N sea distances (km) between ports or points. Body:
+    {"ports": ["port_Rotterdam", ...]} and/or {"points": [[lon, lat], ...]},
+    optional "max_distance" (km; longer entries are pruned to null), "speed"
+    (km/h; adds a time matrix in hours) and "format": "json" or "binary"
+    (row-major little-endian float32 with inf for pruned entries).
+    """
+    data = request.get_json(silent=True) or {}
+    ports = data.get('ports') or []
+    points = data.get('points') or []
+    max_distance = data.get('max_distance')
+    speed = data.get('speed')
+    output_format = data.get('format', 'json')
+    
+    if not ports and not points:
+        return jsonify({"error": "Provide 'ports' (node names) and/or 'points' ([lon, lat])"}), 400
+    if output_format not in ('json', 'binary'):
+        return jsonify({"error": "format must be 'json' or 'binary'"}), 400
+    if max_distance is not None and not (isinstance(max_distance, (int, float)) and max_distance > 0):
+        return jsonify({"error": "max_distance must be a positive number of km"}), 400
+    if speed is not None and not (isinstance(speed, (int, float)) and speed > 0):
+        return jsonify({"error": "speed must be a positive number of km/h"}), 400
+    if not isinstance(points, list) or not all(map(is_lon_lat, points)):
+        return jsonify({"error": "points must be a list of [lon, lat] pairs in degrees"}), 400
+    if not isinstance(ports, list) or not all(isinstance(port, str) for port in ports):
+        return jsonify({"error": "ports must be a list of port node names"}), 400
+    
+    g = load_graph()
+    if g is None:
+        return jsonify({"error": "Failed to load graph"}), 500
+    
+    unknown = [port for port in ports if port not in g.nodes]
+    if unknown:
+        return jsonify({"error": f"Unknown port nodes: {', '.join(map(str, unknown))}"}), 400
+    
+    nodes = list(ports)
+    if points:
+        snapped, _ = get_node_index(g).nearest_many(points)
+        nodes.extend(snapped)
+    
+    start_time = time.time()
+    matrix = distance_matrix(g, nodes, max_distance=max_distance)
+    print(f"Distance matrix {len(nodes)}x{len(nodes)} in {time.time() - start_time:.3f}s")
+    
+    if output_format == 'binary':
+        response = Response(matrix.astype('<f4').tobytes(), mimetype='application/octet-stream')
+        response.headers['X-Matrix-Shape'] = f"{len(nodes)},{len(nodes)}"
+        response.headers['X-Matrix-Nodes'] = json.dumps(nodes)
+        return response
+    
+    finite = np.isfinite(matrix)
+    result = {
+        "nodes": nodes,
+        "distances": np.where(finite, np.round(matrix, 3), None).tolist(),
+        "computation_time": time.time() - start_time
+    }
+    if speed:
+        result["times"] = np.where(finite, np.round(matrix / speed, 3), None).tolist()
+    return jsonify(result)
+
 @app.route('/optimal_path', methods=['POST'])
 def optimal_path():
     print("\n=== New Optimal Path Request ===")
@@ -518,6 +646,17 @@ def optimal_path():
     source = data['source']
     destination = data['destination']
     
+    # With a vessel speed (km/h), conditions are read at the forecast hour each leg is sailed
+    vessel = data.get('vessel') or {}
+    if not isinstance(vessel, dict):
+        return jsonify({"error": "vessel must be an object"}), 400
+    speed = vessel.get('speed')
+    departure = data.get('departure', time.time())  # unix seconds
+    if speed is not None and not (is_finite_number(speed) and speed > 0):
+        return jsonify({"error": "vessel speed must be a positive number of km/h"}), 400
+    if not is_finite_number(departure):
+        return jsonify({"error": "departure must be a unix timestamp in seconds"}), 400
+    
     print(f"Source: {source}")
     print(f"Destination: {destination}")
     
@@ -530,61 +669,73 @@ def optimal_path():
     print(f"Start Node: {source_node} ({g.nodes[source_node]['coordinates']})")
     print(f"End Node: {dest_node} ({g.nodes[dest_node]['coordinates']})")
     
+    # Sea state comes from the gridded forecast when one has been fetched
+    raster = get_weather_raster()
+    print(f"Weather source: {'forecast raster' if raster is not None else 'live API'}")
+    
+    if speed and raster is not None:
+        return time_dependent_path(g, raster, source_node, dest_node, speed, departure, start_total)
+    
+    # Re-priced edges live in a per-request overlay; the shared graph is never copied or modified
+    engine = get_routing_engine(g)
+    overlay = CostOverlay(engine)
+    source, target = g.index_of(source_node), g.index_of(dest_node)
+    coords = np.asarray(g.coords)
+    
     best_path = None
     best_cost = float('inf')
+    previous = None
     
     for iteration in range(3):
         print(f"\n--- Iteration {iteration + 1} ---")
         path_start = time.time()
         
-        try:
-            path = nx.astar_path(g, source_node, dest_node, heuristic=haversine, weight='adjusted_weight')
-        except nx.NetworkXNoPath:
+        result = engine.astar(source, target, costs=overlay.costs())
+        if result is None:
             print("!! No Path Found !!")
             break
-            
-        current_cost = sum(g[u][v]['adjusted_weight'] for u,v in zip(path[:-1], path[1:]))
-        print(f"Path Cost: {current_cost:.2f} km")
-        print(f"Path Length: {len(path)} nodes")
-        print(f"Calculation Time: {time.time() - path_start:.2f}s")
         
+        path = result.path
+        if path == previous:
+            print("Path unchanged; converged")
+            break
+        previous = path
+        print(f"Path Length: {len(path)} nodes")
+        print(f"Calculation Time: {time.time() - path_start:.2f}s, expanded {result.expanded} nodes")
+        
+        # Price this path's edges for the sea state
+        weather_start = time.time()
+        edges = path_edges(engine, path)
+        starts, ends = coords[path[:-1]], coords[path[1:]]
+        if not edges:
+            factors = []
+        elif raster is not None:
+            factors = weather_factors(raster, starts, ends, raster.hours_since_start())
+        else:
+            # One parallel batch of live lookups for the whole path
+            lons, lats, bearings = leg_geometry(starts, ends)
+            factors = []
+            for series, bearing in zip(weather_client.get_many(list(zip(lats, lons))), bearings):
+                weather = marine_conditions(series) if series else None
+                factors.append(wave_factor(weather['wind_wave_height'] or 0.0, weather['wind_wave_dir'] or 0.0, bearing)
+                               if weather else 1.0)
+        overlay.update(dict(zip(edges, factors)))
+        print(f"Priced {len(edges)} edges in {time.time() - weather_start:.2f}s")
+        
+        # Every edge of this path now carries its weather, so its cost is comparable across iterations
+        current_cost = overlay.path_cost(edges)
+        print(f"Path Cost: {current_cost:.2f} km")
         if current_cost < best_cost:
             best_cost = current_cost
-            best_path = path
+            best_path = [g.name_of(i) for i in path]
             print("New Best Path!")
+        
+        if not edges:
+            break
             
-        # Adjust weights based on weather
-        print("\nAdjusting Edge Weights:")
-        for u, v in zip(path[:-1], path[1:]):
-            edge_data = g[u][v]
-            u_coords = g.nodes[u]['coordinates']
-            v_coords = g.nodes[v]['coordinates']
-            
-            # Get midpoint weather
-            mid_lat = (u_coords[1] + v_coords[1]) / 2
-            mid_lon = (u_coords[0] + v_coords[0]) / 2
-            weather = get_marine_weather(mid_lat, mid_lon)
-            
-            if not weather:
-                print(f"Skipping edge {u}-{v} (weather data missing)")
-                continue
-                
-            # Calculate direction penalty
-            edge_dir = calculate_edge_direction(u_coords[0], u_coords[1], v_coords[0], v_coords[1])
-            wind_penalty = weather['wind_speed'] * cos(radians(weather['wind_dir'] - edge_dir))
-            
-            # Update weight
-            original = edge_data['base_weight']
-            new_weight = original * (1 + wind_penalty/20)  # 20 m/s = 40 knots max wind
-            
-            print(f"Edge {u}-{v}:")
-            print(f"Direction: {edge_dir:.1f}° vs Wind: {weather['wind_dir']:.1f}°")
-            print(f"Wind Speed: {weather['wind_speed']} m/s")
-            print(f"Penalty Factor: {wind_penalty:.2f}")
-            print(f"Weight: {original:.2f} → {new_weight:.2f}")
-            
-            g[u][v]['adjusted_weight'] = new_weight
-            
+    if best_path is None:
+        return jsonify({"error": "No path exists between the points"}), 404
+    
     print(f"\n=== Final Result ===")
     print(f"Best Path Cost: {best_cost:.2f} km")
     print(f"Total Processing Time: {time.time() - start_total:.2f}s")
@@ -592,58 +743,46 @@ def optimal_path():
     return jsonify({
         'path': convert_path_to_coordinates(g, best_path),
         'cost': best_cost,
-        'iterations': iteration + 1
+        'iterations': iteration + 1,
+        'weather': 'raster' if raster is not None else 'live'
     })
 
-def calculate_edge_direction(lon1, lat1, lon2, lat2):
-    """Calculate edge direction with wrapping"""
-    delta_lon = lon2 - lon1
-    if abs(delta_lon) > 180:
-        delta_lon = (delta_lon + 360) % 360
-        
-    direction = degrees(atan2(lat2 - lat1, delta_lon))
-    return (direction + 360) % 360
+def time_dependent_path(g, raster, source_node, dest_node, speed, departure, start_total):
+    """
+    Single time-dependent search: each edge costs its sailing time at the
+    forecast hour the vessel reaches it, so conditions days into the voyage
+    come from that day's forecast rather than today's.
+    """
+    engine = get_routing_engine(g)
+    voyage = VoyageTimes(get_edge_weather(engine, raster), engine.costs, speed)
+    result = engine.time_dependent_astar(
+        g.index_of(source_node), g.index_of(dest_node), speed, voyage, raster.hours_since_start(departure)
+    )
+    if result is None:
+        return jsonify({"error": "No path exists between the points"}), 404
+    
+    path = [g.name_of(i) for i in result.path]
+    distance = sum(g.get_edge_data(u, v)['weight'] for u, v in zip(path[:-1], path[1:]))
+    print(f"Voyage: {distance:.0f} km in {result.cost:.1f} h, expanded {result.expanded} nodes")
+    print(f"Total Processing Time: {time.time() - start_total:.2f}s")
+    
+    return jsonify({
+        'path': convert_path_to_coordinates(g, path),
+        'cost': result.cost * speed,
+        'distance': distance,
+        'duration_hours': result.cost,
+        'departure': departure,
+        'arrival': departure + result.cost * 3600,
+        'expanded_nodes': result.expanded,
+        'iterations': 1,
+        'weather': 'raster',
+        'mode': 'time_dependent'
+    })
 
 def convert_path_to_coordinates(graph, path):
     """Convert node path to coordinates"""
     return [graph.nodes[node]['coordinates'] for node in path]
 
-# ... (keep existing haversine, load_graph, find_nearest_water_node functions) ...
-
-def connect_transpacific_points(graph, source_node, dest_node):
-    """Add temporary connections for transpacific routes"""
-    source_coords = graph.nodes[source_node]['coordinates']
-    dest_coords = graph.nodes[dest_node]['coordinates']
-    
-    # Find nodes near the date line
-    date_line_nodes = []
-    for node, data in graph.nodes(data=True):
-        if 'coordinates' not in data:
-            continue
-        lon = data['coordinates'][0]
-        if abs(lon) > 175:  # Within 5 degrees of date line
-            date_line_nodes.append((node, data['coordinates']))
-    
-    # Add connections to date line nodes if needed
-    edges_added = 0
-    for node, coords in date_line_nodes:
-        # Connect to source if needed
-        if abs(source_coords[0] - coords[0]) > 180:
-            dist = haversine(source_coords, coords)
-            if not graph.has_edge(source_node, node):
-                graph.add_edge(source_node, node, weight=dist, temp=True)
-                edges_added += 1
-        
-        # Connect to destination if needed
-        if abs(dest_coords[0] - coords[0]) > 180:
-            dist = haversine(dest_coords, coords)
-            if not graph.has_edge(node, dest_node):
-                graph.add_edge(node, dest_node, weight=dist, temp=True)
-                edges_added += 1
-    
-    print(f"Added {edges_added} temporary transpacific connections")
-    return graph
-
 if __name__ == "__main__":
     # Load graph on startup
     print("Loading Ocean Graph...")
@@ -0,0 +1,277 @@
+"""
+Benchmarks for the routing server's hot paths.
+
+Each graph is measured in three stages, each reported separately:
+  load_graph               app2.load_graph on just that graph file
+  find_nearest_water_node  snapping every endpoint of the route corpus
+  search                   every route with each search method
+
+The corpus in config/benchmark_routes.json is a fixed set of origin /
+destination pairs (transatlantic, transpacific across the antimeridian,
+Suez, Panama and Malacca). Latencies are reported as p50/p95 in ms over all
+repeats, along with expanded nodes for searches. Memory is measured on a
+separate, untimed pass: the RSS growth and the peak of Python allocations
+(tracemalloc). Results are written as JSON so runs can be diffed between
+commits.
+
+Usage:
+    python benchmark.py [graph.pkl ...] [--repeat 5] [--output benchmark_results.json]
+
+With no graph files, the 5-degree and 1-degree builder outputs are used
+(models/ocean_graph_5deg.pkl, and models/ocean_graph_1deg.pkl or the bundled
+ocean_graph_connected.pkl), plus the full-globe builds
+models/ocean_graph_1deg_global.pkl, models/ocean_graph_hex.pkl and
+models/ocean_graph_quadtree.pkl (see build_hex_graph.py and
+build_quadtree_graph.py) when they exist, so grids and meshes can be
+compared on node count, search time and route cost.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+import app2
+from graph_utils import export_pickle, fresh_csr_path
+from pathfinder import SEARCH_METHODS, find_path_result
+
+BENCHMARK_FORMAT_VERSION = 1
+ROUTES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'benchmark_routes.json')
+DEFAULT_REPEAT = 5
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+# Graph label -> files tried in order
+DEFAULT_GRAPHS = (
+    ('5deg', ('models/ocean_graph_5deg.pkl', 'ocean_graph_5deg.pkl')),
+    ('1deg', ('models/ocean_graph_1deg.pkl', 'ocean_graph_1deg.pkl', 'ocean_graph_connected.pkl')),
+    ('1deg_global', ('models/ocean_graph_1deg_global.pkl',)),
+    ('hex', ('models/ocean_graph_hex.pkl',)),
+    ('quadtree', ('models/ocean_graph_quadtree.pkl',)),
+)
+
+# 'default' is whatever shortest_ocean_path uses when no search is requested
+BENCHMARK_METHODS = ('default',) + SEARCH_METHODS
+
+
+def load_routes(path=ROUTES_FILE):
+    """The origin/destination corpus as a list of {name, group, source, destination}"""
+    with open(path, 'r') as f:
+        return json.load(f)['routes']
+
+
+def summarize(samples):
+    """p50/p95/mean/max of a list of numbers (None when empty)"""
+    if not len(samples):
+        return None
+    samples = np.asarray(samples, dtype=float)
+    return {
+        'count': int(len(samples)),
+        'p50': float(np.percentile(samples, 50)),
+        'p95': float(np.percentile(samples, 95)),
+        'mean': float(samples.mean()),
+        'max': float(samples.max()),
+    }
+
+
+def rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_memory(fn):
+    """Run fn once untimed; returns (its result, {rss_delta_mb, peak_alloc_mb})"""
+    rss_before = rss_mb()
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'rss_delta_mb': rss_mb() - rss_before, 'peak_alloc_mb': peak / 2 ** 20}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def bench_load_graph(path, repeat):
+    """Time app2.load_graph with path as the only candidate; returns (graph, report)"""
+    app2.GRAPH_CANDIDATES = [path]
+
+    def load():
+        app2.graph = None
+        return app2.load_graph()
+
+    g, memory = measure_memory(load)
+    latencies = []
+    for _ in range(repeat):
+        g, ms = timed(load)
+        latencies.append(ms)
+    return g, {'latency_ms': summarize(latencies), 'memory': memory}
+
+
+def bench_snapping(g, routes, repeat):
+    """Time find_nearest_water_node on every route endpoint; returns (snapped nodes, report)"""
+    points = [point for route in routes for point in (route['source'], route['destination'])]
+
+    def snap_all():
+        return [app2.find_nearest_water_node(g, point) for point in points]
+
+    snapped, memory = measure_memory(snap_all)
+    latencies = []
+    for _ in range(repeat):
+        for point in points:
+            latencies.append(timed(lambda: app2.find_nearest_water_node(g, point))[1])
+    return snapped, {
+        'latency_ms': summarize(latencies),
+        'snap_distance_km': summarize([distance for _, distance in snapped]),
+        'memory': memory,
+    }
+
+
+def bench_search(g, routes, snapped, repeat, method):
+    """Time find_path_result for every route with one search method"""
+    search = None if method == 'default' else method
+    pairs = [(snapped[2 * i][0], snapped[2 * i + 1][0]) for i in range(len(routes))]
+
+    def search_all():
+        return [find_path_result(g, s, t, method=search) if s and t else None for s, t in pairs]
+
+    results, memory = measure_memory(search_all)
+    latencies = {route['name']: [] for route in routes}
+    for _ in range(repeat):
+        for route, (s, t) in zip(routes, pairs):
+            if s and t:
+                latencies[route['name']].append(timed(lambda: find_path_result(g, s, t, method=search))[1])
+
+    per_route = {}
+    for route, result in zip(routes, results):
+        per_route[route['name']] = {
+            'group': route['group'],
+            'found': result is not None,
+            'method': result.method if result else None,
+            'cost': result.cost if result else None,
+            'path_nodes': len(result.path) if result else None,
+            'expanded': result.expanded if result else None,
+            'latency_ms_p50': summarize(latencies[route['name']])['p50'] if latencies[route['name']] else None,
+        }
+    found = [result for result in results if result is not None]
+    return {
+        'latency_ms': summarize([ms for samples in latencies.values() for ms in samples]),
+        'expanded': summarize([result.expanded for result in found]),
+        'found': len(found),
+        'routes': per_route,
+        'memory': memory,
+    }
+
+
+def bench_graph(path, routes, repeat=DEFAULT_REPEAT, methods=BENCHMARK_METHODS):
+    """Every stage for one graph file"""
+    # load_graph converts a bare pickle on first use; do that here, outside the timings
+    if fresh_csr_path(path) is None:
+        export_pickle(path)
+
+    g, load_report = bench_load_graph(path, repeat)
+    if g is None:
+        return {'file': path, 'error': 'load_graph failed'}
+    snapped, snap_report = bench_snapping(g, routes, repeat)
+    return {
+        'file': path,
+        'nodes': g.number_of_nodes(),
+        'edges': g.number_of_edges(),
+        'spacing': (g.stats.get('parameters') or {}).get('spacing'),
+        'load_graph': load_report,
+        'find_nearest_water_node': snap_report,
+        'search': {method: bench_search(g, routes, snapped, repeat, method) for method in methods},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def default_graphs():
+    """(label, path) for the default graphs; path is None when missing"""
+    return [(label, next((path for path in paths if os.path.exists(path) or fresh_csr_path(path)), None))
+            for label, paths in DEFAULT_GRAPHS]
+
+
+def run_benchmark(graphs, routes=None, repeat=DEFAULT_REPEAT, methods=BENCHMARK_METHODS):
+    """
+    Benchmark (label, graph file) pairs and return the report. app2's loaded
+    graph is restored afterwards, so this can run inside a live process.
+    """
+    routes = routes if routes is not None else load_routes()
+    saved = (app2.GRAPH_CANDIDATES, app2.graph, app2.graph_stats, app2.graph_file, app2.graph_version)
+    report = {
+        'version': BENCHMARK_FORMAT_VERSION,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'routes': len(routes),
+        'graphs': {},
+    }
+    try:
+        for label, path in graphs:
+            if path is None:
+                print(f"Skipping {label}: graph file not found")
+                report['graphs'][label] = {'file': None, 'error': 'graph file not found'}
+                continue
+            print(f"Benchmarking {label} graph {path}")
+            report['graphs'][label] = bench_graph(path, routes, repeat, methods)
+    finally:
+        app2.GRAPH_CANDIDATES, app2.graph, app2.graph_stats, app2.graph_file, app2.graph_version = saved
+        app2.route_cache.set_version(app2.graph_version)
+    return report
+
+
+def print_summary(report):
+    for label, result in report['graphs'].items():
+        if 'error' in result:
+            print(f"{label}: {result['error']}")
+            continue
+        print(f"{label}: {result['nodes']} nodes, {result['edges']} edges")
+        for stage in ('load_graph', 'find_nearest_water_node'):
+            latency = result[stage]['latency_ms']
+            print(f"  {stage:<24} p50 {latency['p50']:9.3f}ms  p95 {latency['p95']:9.3f}ms  "
+                  f"rss +{result[stage]['memory']['rss_delta_mb']:.1f}MB")
+        for method, search in result['search'].items():
+            latency, expanded = search['latency_ms'], search['expanded']
+            if latency is None or expanded is None:
+                print(f"  search {method:<17} no routes found")
+                continue
+            print(f"  search {method:<17} p50 {latency['p50']:9.3f}ms  p95 {latency['p95']:9.3f}ms  "
+                  f"expanded p50 {expanded['p50']:.0f}  found {search['found']}/{report['routes']}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    repeat, output = DEFAULT_REPEAT, DEFAULT_OUTPUT
+    if '--repeat' in args:
+        i = args.index('--repeat')
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+    if '--output' in args:
+        i = args.index('--output')
+        output = args[i + 1]
+        del args[i:i + 2]
+
+    graphs = [(os.path.basename(path), path) for path in args] if args else default_graphs()
+    report = run_benchmark(graphs, repeat=repeat)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print_summary(report)
+    print(f"Results written to {output}")
@@ -6,15 +6,31 @@ import os
 import pickle
 import time
 import json
+import shutil
+import multiprocessing
 import networkx as nx
 from math import radians, sin, cos, sqrt, atan2
-from shapely.geometry import shape, Point
+import shapely
+from shapely.geometry import Point
+from shapely.strtree import STRtree
 import numpy as np
+from scipy.spatial import cKDTree
+from graph_utils import export_pickle
+from spatial_index import chord_to_km, to_unit_xyz
+from geojson_stream import load_geometries
+from shipping_lanes import LaneIndex, annotate_lane_distances
+from contraction import build_overlay
+from landmarks import build_landmarks
 
 # --- Constants ---
 SPACING = 5.0  # 1-degree grid spacing
 OUTPUT_FILE = 'ocean_graph_5deg.pkl'  # New output file name
 
+# Area covered by the default (regional) build
+REGION_BOUNDS = (-60, 60, -120, 120)  # lat_min, lat_max, lon_min, lon_max
+# Southern and northern latitude limits of a full-globe build
+POLAR_LIMITS = (-80, 85)
+
 def haversine(coord1, coord2):
     """
     Compute the Haversine distance between two [lon, lat] coordinates.
@@ -30,51 +46,200 @@ def haversine(coord1, coord2):
     c = 2 * atan2(sqrt(a), sqrt(1 - a))
     return R * c
 
-def load_ocean_data(ocean_file_path):
-    """Load ocean data from GeoJSON file"""
-    print(f"Loading ocean data from {ocean_file_path}")
+def haversine_array(lon1, lat1, lon2, lat2):
+    """Vectorised haversine over coordinate arrays, in kilometers"""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(a, dtype=float)) for a in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def grid_edges(coords, spacing, wrap=True):
+    """
+    All pairs (i, j), i < j, of [lon, lat] points within spacing * 1.1 of
+    each other in both lon and lat, with their haversine distances.
     
-    with open(ocean_file_path, 'r') as f:
-        ocean_data = json.load(f)
-        
-    # Check the type of the GeoJSON
-    if ocean_data.get('type') == 'FeatureCollection':
-        geometries = [feature['geometry'] for feature in ocean_data['features'] if feature.get('geometry')]
-        print(f"Extracted {len(geometries)} geometries from FeatureCollection")
-    elif ocean_data.get('type') == 'GeometryCollection':
-        geometries = ocean_data.get('geometries', [])
-        print(f"Extracted {len(geometries)} geometries from GeometryCollection")
+    Points are bucketed into spacing-sized (row, col) cells, so each point is
+    only compared with the points in the few cells around it: on a regular
+    grid that is exactly its 8 neighbours, and ports or misaligned chunk grids
+    are still matched with the same box test the old pair scan used.
+    
+    With wrap, longitude is cyclic: columns are numbered modulo 360 degrees,
+    so points either side of the antimeridian are neighbours like any other
+    and their haversine distance is the short way across it.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(coords) < 2:
+        return empty, empty, np.zeros(0)
+    
+    reach = spacing * 1.1
+    rows = np.floor(coords[:, 1] / spacing).astype(np.int64)
+    # A box of reach can span up to this many cells either way
+    window = int(np.floor(reach / spacing)) + 1
+    # Too few columns round the globe and a pair would be found from both sides
+    ring = int(np.ceil(360.0 / spacing))
+    wrap = wrap and ring > 2 * window
+    if wrap:
+        cols = np.floor(np.mod(coords[:, 0] + 180.0, 360.0) / spacing).astype(np.int64)
     else:
-        # If it's a single geometry, wrap it in a list
-        geometries = [ocean_data.get('geometry', ocean_data)]
-        print(f"Using single geometry")
-    
-    # Convert geometries to Shapely objects
-    ocean_polygons = []
-    for geom in geometries:
-        if isinstance(geom, dict):
-            try:
-                polygon = shape(geom)
-                ocean_polygons.append(polygon)
-            except Exception as e:
-                print(f"Error converting geometry to shape: {e}")
+        cols = np.floor(coords[:, 0] / spacing).astype(np.int64)
+        cols = cols - cols.min() + window
     
-    print(f"Created {len(ocean_polygons)} Shapely polygons")
-    return ocean_polygons
+    # One integer key per cell, with room for the window offsets on every side
+    width = rows.max() - rows.min() + 2 * window + 1
+    rows = rows - rows.min() + window
+    keys = cols * width + rows
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    
+    sources, targets = [], []
+    for dc in range(0, window + 1):
+        for dr in range(-window, window + 1):
+            if dc == 0 and dr < 0:
+                continue  # Each pair of cells is visited once
+            # Range of points in the neighbouring cell, for every point
+            if wrap:
+                wanted = np.mod(cols + dc, ring) * width + rows + dr
+            else:
+                wanted = keys + dc * width + dr
+            start = np.searchsorted(sorted_keys, wanted, side='left')
+            end = np.searchsorted(sorted_keys, wanted, side='right')
+            counts = end - start
+            i = np.repeat(np.arange(len(coords)), counts)
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(start, counts) + within]
+            if dc == 0 and dr == 0:
+                keep = i < j  # Same cell: each pair once, no self loops
+                i, j = i[keep], j[keep]
+            sources.append(i)
+            targets.append(j)
+    
+    i, j = np.concatenate(sources), np.concatenate(targets)
+    delta = np.abs(coords[i] - coords[j])
+    if wrap:
+        delta[:, 0] = np.minimum(delta[:, 0], 360.0 - delta[:, 0])
+    close = (delta[:, 0] <= reach) & (delta[:, 1] <= reach) & (i != j)
+    i, j = i[close], j[close]
+    swap = i > j
+    i, j = np.where(swap, j, i), np.where(swap, i, j)
+    dist = haversine_array(coords[i, 0], coords[i, 1], coords[j, 0], coords[j, 1])
+    return i, j, dist
 
-def load_shipping_lanes(shipping_lanes_file):
-    """Load shipping lanes data from GeoJSON file"""
-    print(f"Loading shipping lanes from {shipping_lanes_file}")
+def lon_cells(lats, spacing):
+    """
+    Number of longitude cells round the globe at each latitude when the
+    longitude spacing is scaled by 1/cos(lat): spacing degrees at the
+    equator, the same ground distance as a spacing step of latitude
+    everywhere else, and at least one cell at the poles
+    """
+    cells = np.rint(360.0 * np.cos(np.radians(np.asarray(lats, dtype=float))) / spacing)
+    return np.maximum(cells, 1).astype(np.int64)
+
+def scaled_grid_points(lat_min, lat_max, lon_min, lon_max, spacing):
+    """
+    [lon, lat] points of a latitude-scaled grid inside a box, row by row in
+    latitude. Every row is a whole number of equal cells round the globe
+    starting at -180, so chunks of the same grid line up with each other
+    """
+    lons, lats = [], []
+    for lat in np.arange(lat_min, lat_max, spacing):
+        row = -180.0 + np.arange(lon_cells(lat, spacing)) * (360.0 / lon_cells(lat, spacing))
+        row = row[(row >= lon_min) & (row < lon_max)]
+        lons.append(row)
+        lats.append(np.full(len(row), lat))
+    if not lons:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(lons), np.concatenate(lats)
+
+def scaled_grid_edges(coords, spacing):
+    """
+    grid_edges for a latitude-scaled grid: pairs of [lon, lat] points within
+    spacing * 1.1 in latitude and 1.1 local longitude steps in longitude
+    (the larger of the two points' steps), longitude wrapping at the
+    antimeridian. Points are sorted by latitude row and then longitude, so
+    each point finds its partners in the rows around it by binary search.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(coords) < 2:
+        return empty, empty, np.zeros(0)
     
-    with open(shipping_lanes_file, 'r') as f:
-        lanes_data = json.load(f)
+    reach = spacing * 1.1
+    window = int(np.floor(reach / spacing)) + 1
+    rows = np.floor(coords[:, 1] / spacing).astype(np.int64)
+    rows = rows - rows.min() + window
+    lons = np.mod(coords[:, 0] + 180.0, 360.0)
+    steps = 360.0 / lon_cells(coords[:, 1], spacing)
+    # Widest step in each row bounds the longitude search from any other row
+    row_steps = np.zeros(rows.max() + window + 1)
+    np.maximum.at(row_steps, rows, steps)
     
-    lanes_geometries = []
-    if lanes_data.get('type') == 'FeatureCollection':
-        for feature in lanes_data['features']:
-            if feature.get('geometry'):
-                lanes_geometries.append(shape(feature['geometry']))
+    # Rows are 1000 apart in key space, so a search of at most 540 degrees stays in its row
+    keys = rows * 1000.0 + lons
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
     
+    sources, targets = [], []
+    for dr in range(0, window + 1):
+        other = rows + dr
+        span = np.minimum(1.1 * np.maximum(steps, row_steps[other]), 180.0)
+        for shift in (-360.0, 0.0, 360.0):
+            centre = other * 1000.0 + lons + shift
+            start = np.searchsorted(sorted_keys, centre - span, side='left')
+            end = np.searchsorted(sorted_keys, centre + span, side='right')
+            counts = end - start
+            i = np.repeat(np.arange(len(coords)), counts)
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(start, counts) + within]
+            if dr == 0:
+                keep = i < j  # Same row: each pair once, no self loops
+                i, j = i[keep], j[keep]
+            sources.append(i)
+            targets.append(j)
+    
+    i, j = np.concatenate(sources), np.concatenate(targets)
+    dlon = np.abs(lons[i] - lons[j])
+    dlon = np.minimum(dlon, 360.0 - dlon)
+    dlat = np.abs(coords[i, 1] - coords[j, 1])
+    close = (dlat <= reach) & (dlon <= 1.1 * np.maximum(steps[i], steps[j])) & (i != j)
+    i, j = i[close], j[close]
+    # Near the poles a row's search windows overlap, so the same pair can turn up twice
+    pairs = np.unique(np.minimum(i, j) * len(coords) + np.maximum(i, j))
+    i, j = pairs // len(coords), pairs % len(coords)
+    dist = haversine_array(coords[i, 0], coords[i, 1], coords[j, 0], coords[j, 1])
+    return i, j, dist
+
+def add_grid_edges(G, spacing, lon_scaled=False):
+    """
+    Connect every pair of nodes in G that grid_edges (scaled_grid_edges with
+    lon_scaled) selects, flagging the ones that wrap across the
+    antimeridian; returns the number of new edges
+    """
+    nodes = list(G.nodes)
+    before = G.number_of_edges()
+    coords = np.asarray([G.nodes[n]['coordinates'][:2] for n in nodes], dtype=float).reshape(-1, 2)
+    i, j, dist = (scaled_grid_edges if lon_scaled else grid_edges)(coords, spacing)
+    crossing = np.abs(coords[i, 0] - coords[j, 0]) > 180
+    G.add_edges_from(
+        (nodes[a], nodes[b], {'weight': float(d), 'date_line_crossing': True} if c else {'weight': float(d)})
+        for a, b, d, c in zip(i.tolist(), j.tolist(), dist, crossing.tolist())
+    )
+    return G.number_of_edges() - before
+
+def load_ocean_data(ocean_file_path, cache=True):
+    """
+    Load ocean polygons from a GeoJSON file, streamed one feature at a time.
+    With cache=True the polygons are kept in a WKB sidecar next to the file
+    so later builds skip the JSON parsing.
+    """
+    print(f"Loading ocean data from {ocean_file_path}")
+    ocean_polygons = load_geometries(ocean_file_path, cache=cache)
+    print(f"Created {len(ocean_polygons)} Shapely polygons")
+    return ocean_polygons
+
+def load_shipping_lanes(shipping_lanes_file, cache=True):
+    """Load shipping lanes from a GeoJSON file, streamed like load_ocean_data"""
+    print(f"Loading shipping lanes from {shipping_lanes_file}")
+    lanes_geometries = load_geometries(shipping_lanes_file, cache=cache)
     print(f"Loaded {len(lanes_geometries)} shipping lanes")
     return lanes_geometries
 
@@ -100,21 +265,48 @@ def load_ports(ports_file):
     print(f"Loaded {len(ports)} ports")
     return ports
 
-def is_valid_location(coord, ocean_polygons, shipping_lanes):
-    """Check if a coordinate is in ocean or near shipping lanes"""
-    pt = Point(coord)
+def join_ports(G, ports, radius_degrees):
+    """
+    Add ports as nodes of a graph whose nodes are not on a regular grid,
+    linked to every node within radius_degrees of arc of them, or to the
+    nearest node when none is that close. Returns the port node names.
+    """
+    port_nodes = []
+    for port in ports:
+        node_name = f'port_{port["name"].replace(" ", "_")}'
+        G.add_node(node_name, coordinates=port['coordinates'], type='port', properties=port['properties'])
+        port_nodes.append(node_name)
+    if not port_nodes or G.number_of_nodes() < 2:
+        return port_nodes
     
+    nodes = list(G.nodes)
+    coords = np.asarray([G.nodes[n]['coordinates'][:2] for n in nodes], dtype=float)
+    points = to_unit_xyz(coords[:, 0], coords[:, 1])
+    tree = cKDTree(points)
+    radius = 2 * np.sin(np.radians(radius_degrees) / 2)
+    ids = {node: i for i, node in enumerate(nodes)}
+    for node_name in set(port_nodes):
+        k = ids[node_name]
+        others = [other for other in tree.query_ball_point(points[k], radius) if other != k]
+        if not others:
+            others = [other for other in tree.query(points[k], k=2)[1] if other != k][:1]
+        for other in others:
+            G.add_edge(node_name, nodes[other], weight=float(chord_to_km(np.linalg.norm(points[k] - points[other]))))
+    return port_nodes
+
+def is_valid_location(coord, ocean_polygons, shipping_lanes, ocean_tree=None, lane_index=None):
+    """
+    Check if a coordinate is in ocean or near shipping lanes. Pass the
+    STRtree / LaneIndex when checking many points so they are built once.
+    """
     # Check if point is in ocean
-    for poly in ocean_polygons:
-        if poly.contains(pt):
-            return True
-            
-    # Check if point is near shipping lanes (within ~5km buffer)
-    for lane in shipping_lanes:
-        if lane.distance(pt) < 0.05:  # Approximate 5km in degrees
-            return True
-            
-    return False
+    if water_mask([coord[0]], [coord[1]], ocean_polygons, ocean_tree)[0]:
+        return True
+    
+    # Check if point is near shipping lanes (within ~5km)
+    if lane_index is None:
+        lane_index = LaneIndex(shipping_lanes)
+    return lane_index.near(coord)
 
 def is_ocean(coord, ocean_polygons):
     """
@@ -142,28 +334,58 @@ def is_water_node(coord, ocean_polygons):
         print(f"Error checking water node: {e}")
         return False
 
-def build_ocean_graph_chunk(ocean_polygons, shipping_lanes, ports, lat_min, lat_max, lon_min, lon_max, spacing, node_id_offset=0):
-    """Build graph using only water nodes"""
+def water_mask(lons, lats, ocean_polygons, ocean_tree=None):
+    """
+    Vectorised is_water_node: a boolean array saying which [lon, lat] points
+    lie inside an ocean polygon. Only polygons whose bounding box overlaps
+    the points are tested, each one prepared and checked with a single
+    contains_xy call over every point not yet known to be water.
+    """
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    mask = np.zeros(lons.shape, dtype=bool)
+    if lons.size == 0 or not len(ocean_polygons):
+        return mask
+    
+    if ocean_tree is None:
+        ocean_tree = STRtree(ocean_polygons)
+    bounds = shapely.box(lons.min(), lats.min(), lons.max(), lats.max())
+    for i in ocean_tree.query(bounds):
+        polygon = ocean_tree.geometries[i]
+        shapely.prepare(polygon)  # Cached on the geometry, so later chunks reuse it
+        todo = ~mask
+        mask[todo] = shapely.contains_xy(polygon, lons[todo], lats[todo])
+    return mask
+
+def build_ocean_graph_chunk(ocean_polygons, shipping_lanes, ports, lat_min, lat_max, lon_min, lon_max, spacing, node_id_offset=0,
+                            ocean_tree=None, lon_scaled=False):
+    """
+    Build the water nodes (and ports) of one chunk, without edges: the
+    merged graph is wired in one pass (see build_1deg_graph). With
+    lon_scaled the longitude spacing grows with latitude (see
+    scaled_grid_points) instead of being spacing degrees everywhere.
+    """
     chunk_start_time = time.time()
     print(f"Building chunk: lat {lat_min} to {lat_max}, lon {lon_min} to {lon_max}")
     
     G = nx.Graph()
     node_id = node_id_offset
-    ocean_count = 0
-    total_points = 0
     
-    # Create grid nodes within the chunk bounding box
-    for lat in np.arange(lat_min, lat_max, spacing):
-        for lon in np.arange(lon_min, lon_max, spacing):
-            total_points += 1
-            coord = (lon, lat)
-            
-            # Only add water nodes
-            if is_water_node(coord, ocean_polygons):
-                ocean_count += 1
-                node_name = f'node_{node_id}'
-                G.add_node(node_name, coordinates=coord, type='ocean')
-                node_id += 1
+    # Classify the whole chunk grid in one pass (row by row in latitude, as before)
+    if lon_scaled:
+        lons, lats = scaled_grid_points(lat_min, lat_max, lon_min, lon_max, spacing)
+    else:
+        lon_grid, lat_grid = np.meshgrid(np.arange(lon_min, lon_max, spacing), np.arange(lat_min, lat_max, spacing))
+        lons, lats = lon_grid.ravel(), lat_grid.ravel()
+    water = water_mask(lons, lats, ocean_polygons, ocean_tree)
+    total_points = lons.size
+    ocean_count = int(water.sum())
+    
+    # Create grid nodes for the water cells only
+    for lon, lat in zip(lons[water], lats[water]):
+        node_name = f'node_{node_id}'
+        G.add_node(node_name, coordinates=(lon, lat), type='ocean')
+        node_id += 1
 
     # Add ports as special nodes
     for port in ports:
@@ -171,37 +393,162 @@ def build_ocean_graph_chunk(ocean_polygons, shipping_lanes, ports, lat_min, lat_
         G.add_node(node_name, coordinates=port['coordinates'], type='port', properties=port['properties'])
         node_id += 1
     
-    node_time = time.time() - chunk_start_time
-    print(f"Created {ocean_count} ocean nodes out of {total_points} grid points in {node_time:.2f}s")
-    
-    # Connect nodes within the chunk
-    edge_start_time = time.time()
-    nodes = list(G.nodes(data=True))
-    edge_count = 0
-    
-    # Process nodes in batches for better progress reporting
-    total_nodes = len(nodes)
-    for i, (node1, data1) in enumerate(nodes):
-        if i % 100 == 0:  # Progress reporting
-            print(f"Processing edges: node {i}/{total_nodes}")
-            
-        coord1 = data1['coordinates']
-        for node2, data2 in nodes[i+1:]:  # Only process each pair once
-            coord2 = data2['coordinates']
-            if abs(coord1[0] - coord2[0]) <= spacing * 1.1 and abs(coord1[1] - coord2[1]) <= spacing * 1.1:
-                dist = haversine(coord1, coord2)
-                G.add_edge(node1, node2, weight=dist)
-                edge_count += 1
-    
-    edge_time = time.time() - edge_start_time
     chunk_time = time.time() - chunk_start_time
-    print(f"Added {edge_count} edges in {edge_time:.2f}s")
-    print(f"Chunk completed in {chunk_time:.2f}s: {G.number_of_nodes()} nodes, {edge_count} edges")
+    print(f"Created {ocean_count} ocean nodes out of {total_points} grid points in {chunk_time:.2f}s")
     return G
 
+# Inputs for chunk workers, loaded once per process by _init_chunk_worker
+_worker_data = {}
+
+def _init_chunk_worker(ocean_file, ports_file):
+    """Pool initializer: load the ocean polygons and ports once per worker"""
+    ocean_polygons = load_ocean_data(ocean_file)
+    _worker_data.update(
+        ocean_polygons=ocean_polygons,
+        ocean_tree=STRtree(ocean_polygons),
+        ports=load_ports(ports_file),
+    )
+
+def _build_chunk(task):
+    """Build one chunk with node ids starting at node_0; returns (chunk index, graph)"""
+    i, (lat_min, lat_max, lon_min, lon_max), spacing, lon_scaled = task
+    print(f"Processing chunk {i+1}")
+    # Chunks do not use the lanes; they are measured against the merged graph
+    chunk_graph = build_ocean_graph_chunk(
+        _worker_data['ocean_polygons'], [], _worker_data['ports'],
+        lat_min, lat_max, lon_min, lon_max,
+        spacing=spacing, ocean_tree=_worker_data['ocean_tree'], lon_scaled=lon_scaled
+    )
+    return i, chunk_graph
+
+def _chunk_file(checkpoint_dir, i):
+    return os.path.join(checkpoint_dir, f'chunk_{i:04d}.pkl')
+
+def _input_stamp(path):
+    """[path, size, mtime] of a build input, so checkpoints notice when it is edited"""
+    if not os.path.exists(path):
+        return [path, None, None]
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+def build_chunks(chunks, spacing, ocean_file, lanes_file, ports_file, workers=1, checkpoint_dir=None,
+                 lon_scaled=False):
+    """
+    Build the graph for every (lat_min, lat_max, lon_min, lon_max) chunk,
+    fanning out to a process pool when workers > 1. Each finished chunk is
+    pickled to checkpoint_dir, and chunks found there are loaded instead of
+    rebuilt, so an interrupted build resumes. Returns graphs in chunk order.
+    """
+    chunk_graphs = [None] * len(chunks)
+    
+    if checkpoint_dir:
+        # Checkpoints from a build with different parameters or edited inputs cannot be reused
+        meta = {'spacing': spacing, 'lon_scaled': lon_scaled, 'chunks': [list(chunk) for chunk in chunks],
+                'inputs': [_input_stamp(path) for path in (ocean_file, lanes_file, ports_file)]}
+        meta_file = os.path.join(checkpoint_dir, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file, 'r') as f:
+                if json.load(f) != meta:
+                    print(f"Discarding checkpoints in {checkpoint_dir} from a different build")
+                    shutil.rmtree(checkpoint_dir)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        with open(meta_file, 'w') as f:
+            json.dump(meta, f)
+        
+        for i in range(len(chunks)):
+            if os.path.exists(_chunk_file(checkpoint_dir, i)):
+                with open(_chunk_file(checkpoint_dir, i), 'rb') as f:
+                    chunk_graphs[i] = pickle.load(f)
+        resumed = sum(chunk_graph is not None for chunk_graph in chunk_graphs)
+        if resumed:
+            print(f"Resuming: {resumed}/{len(chunks)} chunks already built")
+    
+    def finish(i, chunk_graph):
+        chunk_graphs[i] = chunk_graph
+        if checkpoint_dir:
+            # Write then rename, so an interrupted build never leaves half a chunk behind
+            path = _chunk_file(checkpoint_dir, i)
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(chunk_graph, f)
+            os.replace(path + '.tmp', path)
+        done = sum(chunk_graph is not None for chunk_graph in chunk_graphs)
+        print(f"Finished chunk {i+1} ({done}/{len(chunks)} done)")
+    
+    tasks = [(i, chunk, spacing, lon_scaled) for i, chunk in enumerate(chunks) if chunk_graphs[i] is None]
+    initargs = (ocean_file, ports_file)
+    if tasks and workers > 1:
+        print(f"Building {len(tasks)} chunks with {workers} worker processes...")
+        with multiprocessing.Pool(workers, initializer=_init_chunk_worker, initargs=initargs) as pool:
+            for i, chunk_graph in pool.imap_unordered(_build_chunk, tasks):
+                finish(i, chunk_graph)
+    elif tasks:
+        _init_chunk_worker(*initargs)
+        for task in tasks:
+            finish(*_build_chunk(task))
+        _worker_data.clear()
+    
+    return chunk_graphs
+
+def merge_chunks(chunk_graphs):
+    """
+    Merge chunk graphs in chunk order. Every chunk numbers its grid nodes
+    from node_0, so each is shifted by the node count of the chunks before
+    it: the ids a sequential build assigns, whatever the worker count.
+    """
+    G = nx.Graph()
+    node_id_offset = 0
+    for chunk_graph in chunk_graphs:
+        mapping = {node: f'node_{int(node[5:]) + node_id_offset}' for node in chunk_graph if node.startswith('node_')}
+        chunk_graph = nx.relabel_nodes(chunk_graph, mapping)
+        G.add_nodes_from(chunk_graph.nodes(data=True))
+        G.add_edges_from(chunk_graph.edges(data=True))
+        node_id_offset += chunk_graph.number_of_nodes()
+    return G
+
+def prune_small_components(G, min_size):
+    """
+    Drop connected components of fewer than min_size water nodes: lakes and
+    enclosed seas no route can reach, which would otherwise bloat the graph
+    and be picked as snap targets. Components holding a port are kept.
+    Returns the number of nodes removed.
+    """
+    small = [
+        component for component in nx.connected_components(G)
+        if len(component) < min_size and all(G.nodes[n].get('type') != 'port' for n in component)
+    ]
+    removed = sum(len(component) for component in small)
+    for component in small:
+        G.remove_nodes_from(component)
+    print(f"Pruned {len(small)} components under {min_size} nodes ({removed} nodes)")
+    return removed
+
+def chunk_bounds(lat_min, lat_max, lon_min, lon_max, chunk_size=20):
+    """
+    (lat_min, lat_max, lon_min, lon_max) chunks tiling a build area. The
+    last latitude row and longitude column are included, except that a full
+    circle of longitude stops short of +180, which is the -180 column again.
+    """
+    lat_end = lat_max + 1
+    lon_end = lon_max if lon_max - lon_min >= 360 else lon_max + 1
+    chunks = []
+    for chunk_lat in range(lat_min, lat_end, chunk_size):
+        for chunk_lon in range(lon_min, lon_end, chunk_size):
+            chunks.append((chunk_lat, min(chunk_lat + chunk_size, lat_end),
+                           chunk_lon, min(chunk_lon + chunk_size, lon_end)))
+    return chunks
+
 def build_1deg_graph(output_file=OUTPUT_FILE, ocean_file='converter/ocean.geojson', 
-                    lanes_file='converter/Shipping_Lanes_v1.geojson', ports_file='converter/ports.geojson', spacing=SPACING):
-    """Build a 1-degree ocean graph by processing the world in chunks"""
+                    lanes_file='converter/Shipping_Lanes_v1.geojson', ports_file='converter/ports.geojson', spacing=SPACING,
+                    build_hierarchy=True, workers=1, min_component_size=0, full_globe=False, polar_limits=POLAR_LIMITS):
+    """
+    Build a 1-degree ocean graph by processing the world in chunks. With
+    min_component_size, water components smaller than that are pruned.
+    
+    By default the graph covers REGION_BOUNDS on a regular grid. With
+    full_globe it covers every longitude between the polar_limits latitudes,
+    and the longitude spacing is scaled by 1/cos(lat) so high latitudes are
+    not oversampled (about half the nodes of a regular grid at 1 degree).
+    """
     start_time = time.time()
     
     print(f"Building {spacing}-degree ocean graph - output will be saved to {output_file}")
@@ -222,90 +569,44 @@ def build_1deg_graph(output_file=OUTPUT_FILE, ocean_file='converter/ocean.geojso
     os.makedirs('models', exist_ok=True)
     output_file = os.path.join('models', output_file)
 
-    # Load all data sources
-    ocean_polygons = load_ocean_data(ocean_file)
-    shipping_lanes = load_shipping_lanes(lanes_file)
-    ports = load_ports(ports_file)
-    
-    # Define smaller chunks for 1-degree processing to avoid memory issues
-    chunks = []
-    # Smaller chunks (20-degree) for finer resolution
-    chunk_size = 20
-    for lat_min in range(-60, 61, chunk_size):
-        for lon_min in range(-120, 121, chunk_size):
-            lat_max = min(lat_min + chunk_size, 61)
-            lon_max = min(lon_min + chunk_size, 121)
-            chunks.append((lat_min, lat_max, lon_min, lon_max))
+    # Define smaller chunks (20-degree) for 1-degree processing to avoid memory issues
+    if full_globe:
+        bounds = (polar_limits[0], polar_limits[1], -180, 180)
+    else:
+        bounds = REGION_BOUNDS
+    lon_scaled = full_globe
+    chunks = chunk_bounds(*bounds, chunk_size=20)
     
     print(f"Processing in {len(chunks)} chunks...")
     
-    # Build graph for each chunk
-    chunk_graphs = []
-    node_id_offset = 0
-    
-    for i, (lat_min, lat_max, lon_min, lon_max) in enumerate(chunks):
-        print(f"Processing chunk {i+1}/{len(chunks)}")
-        chunk_graph = build_ocean_graph_chunk(
-            ocean_polygons, shipping_lanes, ports,
-            lat_min, lat_max, lon_min, lon_max, 
-            spacing=spacing, node_id_offset=node_id_offset
-        )
-        node_id_offset += chunk_graph.number_of_nodes()
-        chunk_graphs.append(chunk_graph)
-        
-        # Save intermediate results every few chunks
-        if (i+1) % 5 == 0:
-            temp_file = f"{output_file}.temp{i+1}"
-            print(f"Saving intermediate results to {temp_file}")
-            try:
-                with open(temp_file, 'wb') as f:
-                    pickle.dump(chunk_graphs, f)
-            except Exception as e:
-                print(f"Warning: Failed to save intermediate results: {e}")
+    # Build graph for each chunk, checkpointing each one so a rerun resumes
+    checkpoint_dir = f"{output_file}.chunks"
+    chunk_graphs = build_chunks(chunks, spacing, ocean_file, lanes_file, ports_file,
+                                workers=workers, checkpoint_dir=checkpoint_dir, lon_scaled=lon_scaled)
     
     # Merge all chunks into one graph
     print("\nMerging all chunks into one graph...")
-    G = nx.Graph()
-    for chunk_graph in chunk_graphs:
-        G.add_nodes_from(chunk_graph.nodes(data=True))
-        G.add_edges_from(chunk_graph.edges(data=True))
-    
-    print(f"Initial merge: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
-    print("Connecting nodes between chunks...")
+    G = merge_chunks(chunk_graphs)
     
-    # Connect nodes at chunk boundaries - process in batches to reduce memory pressure
-    nodes = list(G.nodes(data=True))
-    total_nodes = len(nodes)
-    boundary_edges = 0
-    batch_size = 500
+    print(f"Initial merge: {G.number_of_nodes()} nodes")
+    print("Connecting nodes...")
     
-    for i in range(0, total_nodes, batch_size):
-        batch_end = min(i + batch_size, total_nodes)
-        print(f"Processing boundary connections: nodes {i}-{batch_end}/{total_nodes}")
-        
-        for j in range(i, batch_end):
-            node1, data1 = nodes[j]
-            coord1 = data1['coordinates']
-            
-            # Check only against nodes we haven't checked yet
-            for k in range(j+1, total_nodes):
-                node2, data2 = nodes[k]
-                
-                # Skip if already connected
-                if G.has_edge(node1, node2):
-                    continue
-                    
-                coord2 = data2['coordinates']
-                # Check if nodes are close enough to be neighbors
-                if abs(coord1[0] - coord2[0]) <= spacing * 1.1 and abs(coord1[1] - coord2[1]) <= spacing * 1.1:
-                    dist = haversine(coord1, coord2)
-                    G.add_edge(node1, node2, weight=dist)
-                    boundary_edges += 1
+    # Chunks only hold nodes, so the whole grid (chunk boundaries included) is wired once here
+    edge_start = time.time()
+    edge_count = add_grid_edges(G, spacing, lon_scaled)
     
     # Save the merged graph
-    print(f"Added {boundary_edges} edges between chunk boundaries")
+    print(f"Added {edge_count} edges in {time.time() - edge_start:.2f}s")
+    if min_component_size > 1:
+        prune_small_components(G, min_component_size)
     print(f"Final graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
     
+    # Distance from every edge to the nearest shipping lane, for lane-preference routing
+    lane_start = time.time()
+    lane_index = LaneIndex(load_shipping_lanes(lanes_file))
+    annotate_lane_distances(G, lane_index)
+    print(f"Measured lane distances against {len(lane_index)} lane segments in {time.time() - lane_start:.2f}s")
+    
     # Save the graph
     try:
         with open(output_file, 'wb') as f:
@@ -314,17 +615,29 @@ def build_1deg_graph(output_file=OUTPUT_FILE, ocean_file='converter/ocean.geojso
                 'edge_count': G.number_of_edges(),
                 'build_time': time.time() - start_time,
                 'parameters': {
-                    'lat_min': -60, 
-                    'lat_max': 60,
-                    'lon_min': -120, 
-                    'lon_max': 120,
-                    'spacing': spacing
+                    'lat_min': bounds[0], 
+                    'lat_max': bounds[1],
+                    'lon_min': bounds[2], 
+                    'lon_max': bounds[3],
+                    'spacing': spacing,
+                    'lon_scaled': lon_scaled,
+                    'min_component_size': min_component_size
                 }
             }
             pickle.dump((G, stats), f)
         
-        total_time = time.time() - start_time
         print(f"Graph saved to {output_file}")
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        
+        # Export the compact format the server loads, plus the ALT landmark
+        # tables and the contraction hierarchy overlay
+        _, csr_path = export_pickle(output_file)
+        print(f"Compact graph saved to {csr_path}")
+        build_landmarks(csr_path)
+        if build_hierarchy:
+            build_overlay(csr_path)
+        
+        total_time = time.time() - start_time
         print(f"Total time: {total_time:.1f} seconds")
         return True
     except Exception as e:
@@ -334,17 +647,41 @@ def build_1deg_graph(output_file=OUTPUT_FILE, ocean_file='converter/ocean.geojso
 if __name__ == "__main__":
     import sys
     
+    # --no-ch skips the (slow) contraction hierarchy preprocessing
+    build_hierarchy = '--no-ch' not in sys.argv
+    # --workers N builds chunks in N processes
+    workers = 1
+    if '--workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('--workers') + 1])
+    # --min-component N prunes water components of fewer than N nodes
+    min_component_size = 0
+    if '--min-component' in sys.argv:
+        min_component_size = int(sys.argv[sys.argv.index('--min-component') + 1])
+    # --global covers every longitude between the polar limits, --polar-limits S N
+    full_globe = '--global' in sys.argv
+    polar_limits = POLAR_LIMITS
+    if '--polar-limits' in sys.argv:
+        i = sys.argv.index('--polar-limits')
+        polar_limits = (int(sys.argv[i + 1]), int(sys.argv[i + 2]))
+    options = dict(build_hierarchy=build_hierarchy, workers=workers, min_component_size=min_component_size,
+                   full_globe=full_globe, polar_limits=polar_limits)
+    default_output = OUTPUT_FILE.replace('.pkl', '_global.pkl') if full_globe else OUTPUT_FILE
+    # Values taken by the options above are not positional arguments
+    values = {i + 1 for i, arg in enumerate(sys.argv) if arg in ('--workers', '--min-component', '--polar-limits')}
+    values |= {i + 2 for i, arg in enumerate(sys.argv) if arg == '--polar-limits'}
+    args = [arg for i, arg in enumerate(sys.argv[1:], 1) if not arg.startswith('--') and i not in values]
+    
     # Check for command line arguments for custom spacing
-    if len(sys.argv) > 1:
+    if args:
         try:
-            custom_spacing = float(sys.argv[1])
+            custom_spacing = float(args[0])
             print(f"Using custom spacing: {custom_spacing}°")
-            output_file = f'ocean_graph_{custom_spacing}deg.pkl'
-            build_1deg_graph(output_file=output_file, spacing=custom_spacing)
+            output_file = f'ocean_graph_{custom_spacing}deg{"_global" if full_globe else ""}.pkl'
+            build_1deg_graph(output_file=output_file, spacing=custom_spacing, **options)
         except ValueError:
-            print(f"Invalid spacing argument: {sys.argv[1]}. Using default: {SPACING}°")
-            build_1deg_graph()
+            print(f"Invalid spacing argument: {args[0]}. Using default: {SPACING}°")
+            build_1deg_graph(output_file=default_output, **options)
     else:
         # Use default 1-degree spacing
         print(f"Building ocean graph with {SPACING}° spacing")
-        build_1deg_graph()
+        build_1deg_graph(output_file=default_output, **options)
@@ -0,0 +1,240 @@
+"""
+Script to build an ocean graph on an icosahedral geodesic mesh instead of a
+lat/lon grid. The faces of an icosahedron are split into frequency^2
+triangles and their corners projected onto the sphere: nodes are spread
+evenly over the globe (the hexagonal cells around them are within about 8%
+of the same area, where lat/lon grid cells shrink with cos(lat)), and every
+node has 6 neighbours at about the same distance (12 have 5). The mesh is clipped to the ocean polygons and saved in the same
+pickle + compact format as build_1deg_graph, so the server loads it as is.
+
+Usage:
+    python build_hex_graph.py [spacing] [--no-ch] [--min-component N]
+"""
+import os
+import pickle
+import time
+import networkx as nx
+import numpy as np
+from graph_utils import export_pickle
+from shipping_lanes import LaneIndex, annotate_lane_distances
+from spatial_index import chord_to_km
+from contraction import build_overlay
+from landmarks import build_landmarks
+from build_1deg_graph import (POLAR_LIMITS, load_ocean_data, load_shipping_lanes, load_ports, join_ports, water_mask,
+                              prune_small_components)
+
+# --- Constants ---
+SPACING = 1.0  # Mean node spacing in degrees of arc
+OUTPUT_FILE = 'ocean_graph_hex.pkl'
+
+# Mean mesh edge length in degrees times the subdivision frequency
+MESH_EDGE_DEGREES = 69.3
+# Barycentric weights w are warped to sin(w * EQUAL_AREA_WARP) before
+# projection; this value keeps cell areas within about 8% of each other,
+# against a factor of 2 for a plain projection of the flat face lattice
+EQUAL_AREA_WARP = 1.25
+# Tilt about the x axis and turn about the z axis applied to the icosahedron.
+# Unrotated, whole lines of mesh vertices sit exactly on the antimeridian,
+# where ocean polygons are split and contains() excludes boundary points.
+MESH_ROTATION_DEGREES = (11.0, 7.0)
+
+def icosahedron():
+    """Unit vertices (12 x 3) and faces (20 x 3 vertex indices) of an icosahedron, rotated off the axes"""
+    phi = (1 + 5 ** 0.5) / 2
+    vertices = np.array([
+        (-1, phi, 0), (1, phi, 0), (-1, -phi, 0), (1, -phi, 0),
+        (0, -1, phi), (0, 1, phi), (0, -1, -phi), (0, 1, -phi),
+        (phi, 0, -1), (phi, 0, 1), (-phi, 0, -1), (-phi, 0, 1),
+    ], dtype=float)
+    faces = np.array([
+        (0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11),
+        (1, 5, 9), (5, 11, 4), (11, 10, 2), (10, 7, 6), (7, 1, 8),
+        (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9),
+        (4, 9, 5), (2, 4, 11), (6, 2, 10), (8, 6, 7), (9, 8, 1),
+    ])
+    tilt, turn = np.radians(MESH_ROTATION_DEGREES)
+    rotate_x = np.array([[1, 0, 0], [0, np.cos(tilt), -np.sin(tilt)], [0, np.sin(tilt), np.cos(tilt)]])
+    rotate_z = np.array([[np.cos(turn), -np.sin(turn), 0], [np.sin(turn), np.cos(turn), 0], [0, 0, 1]])
+    vertices = vertices @ (rotate_z @ rotate_x).T
+    return vertices / np.linalg.norm(vertices, axis=1, keepdims=True), faces
+
+def frequency_for_spacing(spacing):
+    """Subdivision frequency whose edges are spacing degrees of arc long on average"""
+    return max(1, int(round(MESH_EDGE_DEGREES / spacing)))
+
+def geodesic_mesh(frequency):
+    """
+    Vertices (unit xyz) and edges (i < j index pairs) of an icosahedron with
+    every face split into frequency^2 triangles: 10 f^2 + 2 vertices and
+    30 f^2 edges. A lattice point on a face is identified by its nonzero
+    (corner, weight) pairs, so the copies of a point on a shared edge or
+    corner get the same exact key in every face and are merged. Weights are
+    warped before projecting (see EQUAL_AREA_WARP) so cells are close to
+    equal-area.
+    """
+    n = frequency
+    corners, faces = icosahedron()
+
+    # Barycentric lattice of one face: weights (a, b, n - a - b) on its three corners
+    a, b = [grid.ravel() for grid in np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing='ij')]
+    inside = a + b <= n
+    a, b = a[inside], b[inside]
+    weights = np.stack([a, b, n - a - b], axis=1)
+    local = -np.ones((n + 1, n + 1), dtype=np.int64)
+    local[a, b] = np.arange(len(a))
+
+    # Exact key per face point: its (corner, weight) codes sorted, zero weights last
+    none = len(corners) * (n + 1)
+    codes = np.where(weights[None, :, :] > 0, faces[:, None, :] * (n + 1) + weights[None, :, :], none)
+    codes = np.sort(codes, axis=2)
+    keys = (codes[:, :, 0] * (none + 1) + codes[:, :, 1]) * (none + 1) + codes[:, :, 2]
+    _, first, inverse = np.unique(keys.ravel(), return_index=True, return_inverse=True)
+
+    warped = np.sin(weights / n * EQUAL_AREA_WARP)
+    points = np.einsum('pk,fkd->fpd', warped, corners[faces]).reshape(-1, 3)
+    vertices = points[first]
+    vertices /= np.linalg.norm(vertices, axis=1, keepdims=True)
+    ids = inverse.reshape(len(faces), -1)
+
+    # Each lattice point links to the next point along a, along b, and the (a+1, b) - (a, b+1) diagonal
+    pairs = []
+    for (da1, db1), (da2, db2) in (((0, 0), (1, 0)), ((0, 0), (0, 1)), ((1, 0), (0, 1))):
+        ok = a + b + max(da1 + db1, da2 + db2) <= n
+        u, v = local[a[ok] + da1, b[ok] + db1], local[a[ok] + da2, b[ok] + db2]
+        pairs.append(np.stack([ids[:, u].ravel(), ids[:, v].ravel()], axis=1))
+    pairs = np.concatenate(pairs)
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+    return vertices, pairs
+
+def xyz_to_lonlat(xyz):
+    """[lon, lat] degrees of unit vectors"""
+    lons = np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0]))
+    lats = np.degrees(np.arcsin(np.clip(xyz[:, 2], -1.0, 1.0)))
+    return lons, lats
+
+def build_hex_ocean_graph(ocean_polygons, ports, spacing, polar_limits=POLAR_LIMITS):
+    """
+    Graph of the geodesic mesh nodes that lie in water between the polar
+    limits, numbered node_0.. in mesh order, with mesh edges weighted by
+    great-circle km. Ports are joined to the nodes within 1.1 spacing of
+    them (see join_ports).
+    """
+    start_time = time.time()
+    frequency = frequency_for_spacing(spacing)
+    xyz, pairs = geodesic_mesh(frequency)
+    lons, lats = xyz_to_lonlat(xyz)
+
+    keep = water_mask(lons, lats, ocean_polygons)
+    if polar_limits:
+        keep &= (lats >= polar_limits[0]) & (lats <= polar_limits[1])
+    print(f"Kept {int(keep.sum())} water nodes of {len(xyz)} mesh vertices (frequency {frequency}) "
+          f"in {time.time() - start_time:.2f}s")
+
+    G = nx.Graph()
+    index = -np.ones(len(xyz), dtype=np.int64)
+    index[keep] = np.arange(int(keep.sum()))
+    names = [f'node_{i}' for i in range(int(keep.sum()))]
+    for name, lon, lat in zip(names, lons[keep].tolist(), lats[keep].tolist()):
+        G.add_node(name, coordinates=(lon, lat), type='ocean')
+
+    pairs = pairs[keep[pairs[:, 0]] & keep[pairs[:, 1]]]
+    dist = chord_to_km(np.linalg.norm(xyz[pairs[:, 0]] - xyz[pairs[:, 1]], axis=1))
+    crossing = np.abs(lons[pairs[:, 0]] - lons[pairs[:, 1]]) > 180
+    G.add_edges_from(
+        (names[index[u]], names[index[v]], {'weight': float(d), 'date_line_crossing': True} if c else {'weight': float(d)})
+        for u, v, d, c in zip(pairs[:, 0].tolist(), pairs[:, 1].tolist(), dist.tolist(), crossing.tolist())
+    )
+
+    # Ports join the mesh through every node around them
+    join_ports(G, ports, 1.1 * spacing)
+
+    print(f"Mesh graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges in {time.time() - start_time:.2f}s")
+    return G
+
+def build_hex_graph(output_file=OUTPUT_FILE, ocean_file='converter/ocean.geojson',
+                    lanes_file='converter/Shipping_Lanes_v1.geojson', ports_file='converter/ports.geojson', spacing=SPACING,
+                    build_hierarchy=True, min_component_size=0, polar_limits=POLAR_LIMITS):
+    """
+    Build a full-globe ocean graph on the geodesic mesh, with the same
+    post-processing and outputs as build_1deg_graph
+    """
+    start_time = time.time()
+
+    print(f"Building {spacing}-degree geodesic ocean graph - output will be saved to {output_file}")
+
+    if os.path.exists(output_file):
+        user_input = input(f"{output_file} already exists. Overwrite? (y/n): ")
+        if user_input.lower() != 'y':
+            print("Aborted.")
+            return False
+
+    if not os.path.exists(ocean_file):
+        print(f"Ocean file {ocean_file} not found!")
+        return False
+
+    os.makedirs('models', exist_ok=True)
+    output_file = os.path.join('models', output_file)
+
+    G = build_hex_ocean_graph(load_ocean_data(ocean_file), load_ports(ports_file), spacing, polar_limits)
+    if min_component_size > 1:
+        prune_small_components(G, min_component_size)
+    print(f"Final graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
+
+    # Distance from every edge to the nearest shipping lane, for lane-preference routing
+    lane_start = time.time()
+    lane_index = LaneIndex(load_shipping_lanes(lanes_file))
+    annotate_lane_distances(G, lane_index)
+    print(f"Measured lane distances against {len(lane_index)} lane segments in {time.time() - lane_start:.2f}s")
+
+    try:
+        with open(output_file, 'wb') as f:
+            stats = {
+                'node_count': G.number_of_nodes(),
+                'edge_count': G.number_of_edges(),
+                'build_time': time.time() - start_time,
+                'parameters': {
+                    'mesh': 'icosahedral',
+                    'frequency': frequency_for_spacing(spacing),
+                    'lat_min': polar_limits[0] if polar_limits else -90,
+                    'lat_max': polar_limits[1] if polar_limits else 90,
+                    'lon_min': -180,
+                    'lon_max': 180,
+                    'spacing': spacing,
+                    'min_component_size': min_component_size
+                }
+            }
+            pickle.dump((G, stats), f)
+
+        print(f"Graph saved to {output_file}")
+
+        _, csr_path = export_pickle(output_file)
+        print(f"Compact graph saved to {csr_path}")
+        build_landmarks(csr_path)
+        if build_hierarchy:
+            build_overlay(csr_path)
+
+        total_time = time.time() - start_time
+        print(f"Total time: {total_time:.1f} seconds")
+        return True
+    except Exception as e:
+        print(f"Error saving graph: {e}")
+        return False
+
+if __name__ == "__main__":
+    import sys
+
+    # --no-ch skips the (slow) contraction hierarchy preprocessing
+    build_hierarchy = '--no-ch' not in sys.argv
+    # --min-component N prunes water components of fewer than N nodes
+    min_component_size = 0
+    if '--min-component' in sys.argv:
+        min_component_size = int(sys.argv[sys.argv.index('--min-component') + 1])
+    args = [arg for i, arg in enumerate(sys.argv[1:], 1)
+            if not arg.startswith('--') and sys.argv[i - 1] != '--min-component']
+
+    if args:
+        spacing = float(args[0])
+        build_hex_graph(output_file=f'ocean_graph_hex_{spacing}deg.pkl', spacing=spacing,
+                        build_hierarchy=build_hierarchy, min_component_size=min_component_size)
+    else:
+        build_hex_graph(build_hierarchy=build_hierarchy, min_component_size=min_component_size)
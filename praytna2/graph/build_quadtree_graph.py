@@ -0,0 +1,284 @@
+"""
+Script to build a coast-adaptive ocean graph from a quadtree of cells. The
+globe is tiled with max_cell-degree cells; cells that straddle a coastline
+(or carry a maritime passage) are split into four, down to min_cell, while
+cells entirely in open water are kept whole. Every water leaf becomes a node
+at its centre, linked to the leaves it shares an edge or corner with,
+whatever their sizes. Near land the graph is as fine as a uniform min_cell
+grid, in open ocean it is as coarse as a max_cell grid, and it is saved in
+the same pickle + compact format as build_1deg_graph.
+
+Usage:
+    python build_quadtree_graph.py [min_cell] [--max-cell D] [--no-ch] [--min-component N]
+"""
+import os
+import json
+import pickle
+import time
+import networkx as nx
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+from shapely.strtree import STRtree
+from graph_utils import export_pickle
+from shipping_lanes import LaneIndex, annotate_lane_distances
+from contraction import build_overlay
+from landmarks import build_landmarks, PASSAGES_FILE
+from build_1deg_graph import (POLAR_LIMITS, haversine_array, load_ocean_data, load_shipping_lanes, load_ports, join_ports,
+                              water_mask, prune_small_components)
+
+# --- Constants ---
+MAX_CELL = 4.0  # Open-ocean cell size in degrees; must divide 180 (see quadtree_depth)
+MIN_CELL = 0.25  # Coastal cell size in degrees; must be MAX_CELL / 2^k
+OUTPUT_FILE = 'ocean_graph_quadtree.pkl'
+
+# Neighbour offsets sharing an edge or a corner
+NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+def load_passage_lines(passages_file=PASSAGES_FILE):
+    """Maritime passages from config/maritime_passages.json as LineStrings"""
+    try:
+        with open(passages_file, 'r') as f:
+            passages = json.load(f).get('passages', [])
+    except (OSError, ValueError):
+        return []
+    return [LineString(passage['coordinates']) for passage in passages if len(passage.get('coordinates', [])) >= 2]
+
+def quadtree_depth(max_cell, min_cell):
+    """
+    Number of times max_cell is halved to reach min_cell. Raises ValueError
+    unless max_cell divides 180 (so whole cells tile the globe and wrap at
+    the antimeridian) and min_cell is max_cell / 2^k.
+    """
+    if not max_cell > 0 or abs(180.0 / max_cell - round(180.0 / max_cell)) > 1e-9:
+        raise ValueError(f"max_cell must divide 180 degrees, got {max_cell}")
+    halvings = np.log2(max_cell / min_cell) if min_cell > 0 else -1.0
+    if halvings < 0 or abs(halvings - round(halvings)) > 1e-9:
+        raise ValueError(f"min_cell must be max_cell / 2^k, got {min_cell} for max_cell {max_cell}")
+    return int(round(halvings))
+
+def quadtree_cells(ocean_polygons, max_cell=MAX_CELL, min_cell=MIN_CELL, polar_limits=POLAR_LIMITS, refine_lines=()):
+    """
+    Water leaves of the quadtree as (level, ix, iy) arrays: a leaf at level L
+    is max_cell / 2^L degrees wide, its south-west corner at
+    (-180 + ix * size, -90 + iy * size). A cell is kept whole when it lies
+    within an ocean polygon and touches no refine line, dropped when it
+    touches no ocean polygon, and split otherwise; at the deepest level a
+    straddling cell is kept when its centre is water.
+    """
+    depth = quadtree_depth(max_cell, min_cell)
+    ocean_tree = STRtree(ocean_polygons)
+    line_tree = STRtree(list(refine_lines)) if len(refine_lines) else None
+
+    lat_min, lat_max = polar_limits if polar_limits else (-90, 90)
+    rows = np.arange(int(np.floor((lat_min + 90) / max_cell)), int(np.ceil((lat_max + 90) / max_cell)))
+    ix, iy = [grid.ravel() for grid in np.meshgrid(np.arange(int(round(360 / max_cell))), rows)]
+
+    leaves = []
+    for level in range(depth + 1):
+        size = max_cell / 2 ** level
+        x0, y0 = -180.0 + ix * size, -90.0 + iy * size
+        boxes = shapely.box(x0, y0, x0 + size, y0 + size)
+
+        wet = np.zeros(len(boxes), dtype=bool)
+        wet[ocean_tree.query(boxes, predicate='intersects')[0]] = True
+        inside = np.zeros(len(boxes), dtype=bool)
+        inside[ocean_tree.query(boxes, predicate='within')[0]] = True
+        if line_tree is not None:
+            inside[line_tree.query(boxes, predicate='intersects')[0]] = False
+
+        if level == depth:
+            keep = inside | (wet & water_mask(x0 + size / 2, y0 + size / 2, ocean_polygons, ocean_tree))
+            split = np.zeros(len(boxes), dtype=bool)
+        else:
+            keep, split = inside, wet & ~inside
+        leaves.append((np.full(int(keep.sum()), level), ix[keep], iy[keep]))
+        print(f"Level {level} ({size:g} degree cells): {int(keep.sum())} water leaves, {int(split.sum())} split")
+
+        ix = (2 * ix[split, None] + np.array([0, 1, 0, 1])).ravel()
+        iy = (2 * iy[split, None] + np.array([0, 0, 1, 1])).ravel()
+
+    levels, ix, iy = (np.concatenate(parts) for parts in zip(*leaves))
+    # Leaves straddling a polar limit stay only if their centre is inside it
+    lat = -90.0 + (iy + 0.5) * max_cell / 2.0 ** levels
+    keep = (lat >= lat_min) & (lat <= lat_max)
+    return levels[keep], ix[keep], iy[keep]
+
+def quadtree_edges(levels, ix, iy, max_cell=MAX_CELL, min_cell=MIN_CELL):
+    """
+    Pairs (i, j), i < j, of leaves that share an edge or a corner, with
+    longitude wrapping at the antimeridian. Each leaf looks at the 8 cells
+    of its own size around it: a neighbour is that cell if it is a leaf, or
+    the larger leaf containing it. Smaller leaves along a leaf's border find
+    it from their side, so every pair turns up.
+    """
+    depth = quadtree_depth(max_cell, min_cell)
+    columns = int(round(360 / max_cell)) << depth
+    rows = int(round(180 / max_cell)) << depth
+
+    def key(level, x, y):
+        return (level * rows + y) * columns + x
+
+    keys = key(levels, ix, iy)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    sources, targets = [], []
+    for level in range(depth + 1):
+        at_level = np.flatnonzero(levels == level)
+        for dx, dy in NEIGHBOURS:
+            x = np.mod(ix[at_level] + dx, int(round(360 / max_cell)) << level)
+            y = iy[at_level] + dy
+            pending = (y >= 0) & (y < int(round(180 / max_cell)) << level)
+            # Same-size cell first, then each larger cell containing it
+            for coarser in range(level, -1, -1):
+                shift = level - coarser
+                wanted = key(coarser, x >> shift, y >> shift)
+                pos = np.minimum(np.searchsorted(sorted_keys, wanted), len(sorted_keys) - 1)
+                found = pending & (sorted_keys[pos] == wanted)
+                sources.append(at_level[found])
+                targets.append(order[pos[found]])
+                pending &= ~found
+
+    i, j = np.concatenate(sources), np.concatenate(targets)
+    pairs = np.unique(np.minimum(i, j) * len(keys) + np.maximum(i, j))
+    return pairs // len(keys), pairs % len(keys)
+
+def build_quadtree_ocean_graph(ocean_polygons, ports, max_cell=MAX_CELL, min_cell=MIN_CELL, polar_limits=POLAR_LIMITS,
+                               refine_lines=()):
+    """
+    Graph of the quadtree water leaves, numbered node_0.. row by row in
+    latitude, with edges between touching leaves weighted by great-circle km
+    between their centres. Ports are joined to the nodes around them (see
+    join_ports).
+    """
+    start_time = time.time()
+    levels, ix, iy = quadtree_cells(ocean_polygons, max_cell, min_cell, polar_limits, refine_lines)
+    size = max_cell / 2.0 ** levels
+    lons, lats = -180.0 + (ix + 0.5) * size, -90.0 + (iy + 0.5) * size
+    order = np.lexsort((lons, lats))
+    levels, ix, iy, lons, lats = levels[order], ix[order], iy[order], lons[order], lats[order]
+
+    # Size of the uniform min_cell grid with the same coastal detail
+    depth = quadtree_depth(max_cell, min_cell)
+    uniform = int(np.sum(4 ** (depth - levels)))
+    print(f"{len(levels)} water cells, against {uniform} for a uniform {max_cell / 2 ** depth:g} degree grid "
+          f"({uniform / max(len(levels), 1):.1f}x) in {time.time() - start_time:.2f}s")
+
+    G = nx.Graph()
+    names = [f'node_{i}' for i in range(len(levels))]
+    for name, lon, lat in zip(names, lons.tolist(), lats.tolist()):
+        G.add_node(name, coordinates=(lon, lat), type='ocean')
+
+    i, j = quadtree_edges(levels, ix, iy, max_cell, min_cell)
+    dist = haversine_array(lons[i], lats[i], lons[j], lats[j])
+    crossing = np.abs(lons[i] - lons[j]) > 180
+    G.add_edges_from(
+        (names[a], names[b], {'weight': float(d), 'date_line_crossing': True} if c else {'weight': float(d)})
+        for a, b, d, c in zip(i.tolist(), j.tolist(), dist.tolist(), crossing.tolist())
+    )
+
+    join_ports(G, ports, 1.5 * max_cell / 2 ** depth)
+    print(f"Quadtree graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges in {time.time() - start_time:.2f}s")
+    return G
+
+def build_quadtree_graph(output_file=OUTPUT_FILE, ocean_file='converter/ocean.geojson',
+                         lanes_file='converter/Shipping_Lanes_v1.geojson', ports_file='converter/ports.geojson',
+                         max_cell=MAX_CELL, min_cell=MIN_CELL, build_hierarchy=True, min_component_size=0,
+                         polar_limits=POLAR_LIMITS, passages_file=PASSAGES_FILE):
+    """
+    Build a full-globe coast-adaptive ocean graph, with the same
+    post-processing and outputs as build_1deg_graph
+    """
+    start_time = time.time()
+
+    try:
+        quadtree_depth(max_cell, min_cell)
+    except ValueError as e:
+        print(f"Invalid cell sizes: {e}")
+        return False
+
+    print(f"Building {min_cell}-{max_cell} degree quadtree ocean graph - output will be saved to {output_file}")
+
+    if os.path.exists(output_file):
+        user_input = input(f"{output_file} already exists. Overwrite? (y/n): ")
+        if user_input.lower() != 'y':
+            print("Aborted.")
+            return False
+
+    if not os.path.exists(ocean_file):
+        print(f"Ocean file {ocean_file} not found!")
+        return False
+
+    os.makedirs('models', exist_ok=True)
+    output_file = os.path.join('models', output_file)
+
+    G = build_quadtree_ocean_graph(load_ocean_data(ocean_file), load_ports(ports_file), max_cell, min_cell,
+                                   polar_limits, load_passage_lines(passages_file))
+    if min_component_size > 1:
+        prune_small_components(G, min_component_size)
+    print(f"Final graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
+
+    # Distance from every edge to the nearest shipping lane, for lane-preference routing
+    lane_start = time.time()
+    lane_index = LaneIndex(load_shipping_lanes(lanes_file))
+    annotate_lane_distances(G, lane_index)
+    print(f"Measured lane distances against {len(lane_index)} lane segments in {time.time() - lane_start:.2f}s")
+
+    try:
+        with open(output_file, 'wb') as f:
+            stats = {
+                'node_count': G.number_of_nodes(),
+                'edge_count': G.number_of_edges(),
+                'build_time': time.time() - start_time,
+                'parameters': {
+                    'mesh': 'quadtree',
+                    'max_cell': max_cell,
+                    'min_cell': max_cell / 2 ** quadtree_depth(max_cell, min_cell),
+                    'lat_min': polar_limits[0] if polar_limits else -90,
+                    'lat_max': polar_limits[1] if polar_limits else 90,
+                    'lon_min': -180,
+                    'lon_max': 180,
+                    'spacing': max_cell / 2 ** quadtree_depth(max_cell, min_cell),
+                    'min_component_size': min_component_size
+                }
+            }
+            pickle.dump((G, stats), f)
+
+        print(f"Graph saved to {output_file}")
+
+        _, csr_path = export_pickle(output_file)
+        print(f"Compact graph saved to {csr_path}")
+        build_landmarks(csr_path)
+        if build_hierarchy:
+            build_overlay(csr_path)
+
+        total_time = time.time() - start_time
+        print(f"Total time: {total_time:.1f} seconds")
+        return True
+    except Exception as e:
+        print(f"Error saving graph: {e}")
+        return False
+
+if __name__ == "__main__":
+    import sys
+
+    # --no-ch skips the (slow) contraction hierarchy preprocessing
+    build_hierarchy = '--no-ch' not in sys.argv
+    # --min-component N prunes water components of fewer than N nodes
+    min_component_size = 0
+    if '--min-component' in sys.argv:
+        min_component_size = int(sys.argv[sys.argv.index('--min-component') + 1])
+    # --max-cell D sets the open-ocean cell size
+    max_cell = MAX_CELL
+    if '--max-cell' in sys.argv:
+        max_cell = float(sys.argv[sys.argv.index('--max-cell') + 1])
+    args = [arg for i, arg in enumerate(sys.argv[1:], 1)
+            if not arg.startswith('--') and sys.argv[i - 1] not in ('--min-component', '--max-cell')]
+
+    if args:
+        min_cell = float(args[0])
+        build_quadtree_graph(output_file=f'ocean_graph_quadtree_{min_cell}deg.pkl', max_cell=max_cell, min_cell=min_cell,
+                             build_hierarchy=build_hierarchy, min_component_size=min_component_size)
+    else:
+        build_quadtree_graph(max_cell=max_cell, build_hierarchy=build_hierarchy, min_component_size=min_component_size)
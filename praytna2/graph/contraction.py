@@ -0,0 +1,384 @@
+"""
+Contraction Hierarchies for the ocean routing graph.
+
+Ocean graphs only change when a builder is re-run, so the expensive work can
+be done offline: nodes are contracted one at a time in order of importance,
+adding shortcut edges wherever a shortest path would otherwise be lost. The
+result is an "upward" graph that is saved as an overlay next to the compact
+graph. A query is then a tiny bidirectional Dijkstra over upward edges only,
+and shortcuts are unpacked back into the original node path.
+
+Grid graphs turn into a near-complete graph at the top of the hierarchy, so
+contraction stops at a small dense "core" whose nodes keep all their edges
+to each other; queries simply search the core in both directions.
+
+Usage:
+    python contraction.py ocean_graph_connected.csr [--water-only] [--passage-factor 0.8]
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import numpy as np
+from graph_utils import load_csr_graph
+from pathfinder import PathResult, RoutingEngine, flat_array, get_routing_engine
+
+CH_SUFFIX = '.ch'
+CH_FORMAT_VERSION = 1
+
+# Witness searches give up after relaxing this many edges; a failed search
+# only adds a redundant shortcut, never a wrong one. Bounding edges rather
+# than settled nodes keeps the dense top of the hierarchy affordable.
+WITNESS_EDGE_LIMIT = 600
+WITNESS_TOLERANCE = 1e-9
+
+# Contraction stops once the next node has this many neighbours left
+CORE_DEGREE_LIMIT = 32
+
+CH_ARRAY_NAMES = ('rank', 'up_offsets', 'up_targets', 'up_weights', 'up_middle')
+
+
+def ch_path_for(graph_path):
+    """Return the overlay directory that sits next to a graph file or directory"""
+    base, _ = os.path.splitext(graph_path.rstrip('/'))
+    return base + CH_SUFFIX
+
+
+def graph_fingerprint(engine):
+    """Cheap identity check so an overlay is never used with a different graph"""
+    return {
+        'node_count': int(len(engine.offsets) - 1),
+        'edge_count': int(len(engine.targets)),
+        'cost_sum': round(float(np.sum(engine.costs)), 3),
+    }
+
+
+def _witness_search(adj, source, skip, limit, targets):
+    """
+    Bounded Dijkstra from source that ignores node skip. Stops once every
+    target is settled; returns cost upper bounds for the nodes it reached.
+    """
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    remaining = len(targets)
+    relaxed = 0
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > limit or relaxed >= WITNESS_EDGE_LIMIT:
+            break
+        if u in targets:
+            remaining -= 1
+            if not remaining:
+                break
+        relaxed += len(adj[u])
+        for x, w in adj[u].items():
+            if x == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(x, float('inf')):
+                dist[x] = nd
+                heapq.heappush(heap, (nd, x))
+    return dist
+
+
+def _shortcuts_for(adj, v):
+    """Return the (u, w, cost) shortcuts needed if v were contracted now"""
+    neighbours = list(adj[v].items())
+    shortcuts = []
+    for i, (u, cost_uv) in enumerate(neighbours):
+        others = neighbours[i + 1:]
+        if not others:
+            continue
+        limit = cost_uv + max(cost_vw for _, cost_vw in others)
+        witness = _witness_search(adj, u, v, limit, {w for w, _ in others})
+        for w, cost_vw in others:
+            # Grid graphs are full of equal-length detours, so allow for float noise
+            if witness.get(w, float('inf')) > (cost_uv + cost_vw) * (1 + WITNESS_TOLERANCE):
+                shortcuts.append((u, w, cost_uv + cost_vw))
+    return shortcuts
+
+
+def build_contraction_hierarchy(engine):
+    """
+    Contract a RoutingEngine's cost graph down to its dense core.
+    Returns a dict of upward-graph arrays plus build statistics.
+    """
+    n = len(engine.offsets) - 1
+    offsets, targets, costs = engine._offsets, engine._targets, engine._costs
+
+    # Working undirected adjacency over uncontracted nodes, keeping the cheapest parallel edge
+    adj = [{} for _ in range(n)]
+    for u in range(n):
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            if v != u and costs[e] < adj[u].get(v, float('inf')):
+                adj[u][v] = costs[e]
+                adj[v][u] = costs[e]
+
+    middle = {}
+    deleted_neighbours = [0] * n
+
+    # Weighted edge difference plus a term that spreads contraction evenly over the graph
+    heap = [(2 * len(_shortcuts_for(adj, v)) - len(adj[v]), v) for v in range(n)]
+    heapq.heapify(heap)
+
+    rank = [0] * n
+    up_edges = [None] * n
+    next_rank = 0
+    shortcut_count = 0
+
+    while heap:
+        _, v = heapq.heappop(heap)
+
+        # Lazy update: re-queue v if its priority has grown past the next candidate
+        shortcuts = _shortcuts_for(adj, v)
+        current = 2 * len(shortcuts) - len(adj[v]) + deleted_neighbours[v]
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+        if len(adj[v]) > CORE_DEGREE_LIMIT:
+            heapq.heappush(heap, (current, v))
+            break
+
+        for u, w, cost in shortcuts:
+            if cost < adj[u].get(w, float('inf')):
+                adj[u][w] = cost
+                adj[w][u] = cost
+                middle[(u, w)] = middle[(w, u)] = v
+                shortcut_count += 1
+
+        # Every remaining neighbour is contracted later, so these edges all point upward
+        up_edges[v] = [(x, cost, middle.get((v, x), -1)) for x, cost in adj[v].items()]
+        for x in adj[v]:
+            del adj[x][v]
+            deleted_neighbours[x] += 1
+        adj[v] = {}
+
+        rank[v] = next_rank
+        next_rank += 1
+        if next_rank % 1000 == 0:  # Progress reporting
+            print(f"Contracted {next_rank}/{n} nodes, {shortcut_count} shortcuts, "
+                  f"current degree {len(up_edges[v])}")
+
+    # Core nodes rank above everything else and keep their edges in both directions
+    core = [v for _, v in heap]
+    for v in core:
+        up_edges[v] = [(x, cost, middle.get((v, x), -1)) for x, cost in adj[v].items()]
+        rank[v] = next_rank
+        next_rank += 1
+
+    up_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(edges) for edges in up_edges], out=up_offsets[1:])
+    flat = [edge for edges in up_edges for edge in edges]
+    return {
+        'rank': np.asarray(rank, dtype=np.int32),
+        'up_offsets': up_offsets,
+        'up_targets': np.asarray([x for x, _, _ in flat], dtype=np.int32),
+        'up_weights': np.asarray([c for _, c, _ in flat], dtype=np.float64),
+        'up_middle': np.asarray([m for _, _, m in flat], dtype=np.int32),
+        'shortcut_count': shortcut_count,
+        'core_size': len(core),
+    }
+
+
+class _Zero:
+    """Stand-in heuristic table for plain (undirected) CH queries"""
+
+    def __getitem__(self, node):
+        return 0.0
+
+
+class ContractionHierarchy:
+    """Bidirectional CH queries over a saved upward graph"""
+
+    def __init__(self, rank, up_offsets, up_targets, up_weights, up_middle, meta=None):
+        self.meta = meta or {}
+        self.rank = np.asarray(rank)
+        self._offsets = flat_array(up_offsets, 'q')
+        self._targets = flat_array(up_targets, 'q')
+        self._weights = flat_array(up_weights, 'd')
+
+        # Shortcut (lower-rank end, higher-rank end) -> contracted middle node;
+        # edges inside the core are stored both ways round
+        up_middle = np.asarray(up_middle)
+        sources = np.repeat(np.arange(len(self.rank)), np.diff(up_offsets))
+        shortcut = up_middle >= 0
+        self._middle = dict(zip(
+            zip(sources[shortcut].tolist(), np.asarray(up_targets)[shortcut].tolist()),
+            up_middle[shortcut].tolist(),
+        ))
+
+    def matches(self, engine):
+        """Whether this overlay was built for the given engine's costs"""
+        return self.meta.get('fingerprint') == graph_fingerprint(engine)
+
+    def _upward_search(self, dist, parent, heap, h, bound):
+        """Settle one node of an upward search; returns it, or None once past bound"""
+        while heap:
+            key, u = heapq.heappop(heap)
+            d = dist[u]
+            if key > d + h[u]:
+                continue
+            if key >= bound:
+                heap.clear()
+                return None
+            for e in range(self._offsets[u], self._offsets[u + 1]):
+                v = self._targets[e]
+                nd = d + self._weights[e]
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(heap, (nd + h[v], v))
+            return u
+        return None
+
+    def query(self, source, target, h_target=None, h_source=None):
+        """
+        Shortest path between integer node ids, or None when unreachable.
+        h_target / h_source are optional admissible lower bounds on the
+        distance from each node to target / source (see heuristic_table);
+        they steer both searches through the core towards the other end.
+        """
+        if source == target:
+            return PathResult([source], 0.0, 1, 'ch')
+
+        h = (h_target or _Zero(), h_source or _Zero())
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        heaps = ([(h[0][source], source)], [(h[1][target], target)])
+        best, meeting = float('inf'), -1
+        expanded = 0
+
+        # Alternate directions. A better meeting node v needs dist_s(v) + dist_t(v) < best,
+        # and dist_t(v) >= h_target(v), so the forward search can stop once its smallest
+        # A* key reaches best (and likewise backwards).
+        while heaps[0] or heaps[1]:
+            for side in (0, 1):
+                if not heaps[side]:
+                    continue
+                u = self._upward_search(dist[side], parent[side], heaps[side], h[side], best)
+                if u is None:
+                    continue
+                expanded += 1
+                other = dist[1 - side].get(u)
+                if other is not None and dist[side][u] + other < best:
+                    best, meeting = dist[side][u] + other, u
+
+        if meeting < 0:
+            return None
+
+        # Upward path source..meeting..target, then unpack every shortcut
+        up_path = []
+        node = meeting
+        while node != -1:
+            up_path.append(node)
+            node = parent[0][node]
+        up_path.reverse()
+        node = parent[1][meeting]
+        while node != -1:
+            up_path.append(node)
+            node = parent[1][node]
+
+        path = [up_path[0]]
+        for a, b in zip(up_path[:-1], up_path[1:]):
+            path.extend(self._unpack(a, b)[1:])
+        return PathResult(path, best, expanded, 'ch')
+
+    def _unpack(self, a, b):
+        """Expand a (possibly shortcut) edge into the original node sequence"""
+        path = [a]
+        stack = [(a, b)]
+        while stack:
+            u, v = stack.pop()
+            key = (u, v) if self.rank[u] < self.rank[v] else (v, u)
+            m = self._middle.get(key)
+            if m is None:
+                path.append(v)
+            else:
+                # Expand (u, m) before (m, v)
+                stack.append((m, v))
+                stack.append((u, m))
+        return path
+
+
+def save_contraction_hierarchy(ch_arrays, path, meta):
+    """Write the upward-graph arrays and meta.json to an overlay directory"""
+    os.makedirs(path, exist_ok=True)
+    for name in CH_ARRAY_NAMES:
+        np.save(os.path.join(path, f'{name}.npy'), ch_arrays[name])
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def load_contraction_hierarchy(path, mmap=True):
+    """Load an overlay written by save_contraction_hierarchy"""
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != CH_FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {CH_FORMAT_VERSION} contraction hierarchy")
+    arrays = {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None)
+        for name in CH_ARRAY_NAMES
+    }
+    return ContractionHierarchy(meta=meta, **arrays)
+
+
+def load_overlay(graph, graph_path):
+    """
+    Attach the saved overlay for a compact graph to the matching routing
+    engine so find_path answers with CH queries. Returns the hierarchy, or
+    None when there is no overlay or it was built for a different graph.
+    """
+    path = ch_path_for(graph_path)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+
+    hierarchy = load_contraction_hierarchy(path)
+    engine = get_routing_engine(
+        graph,
+        water_only=hierarchy.meta.get('water_only', False),
+        passage_factor=hierarchy.meta.get('passage_factor', 1.0)
+    )
+    if not hierarchy.matches(engine):
+        print(f"Ignoring stale contraction hierarchy {path}; rebuild it with contraction.py")
+        return None
+
+    engine.hierarchy = hierarchy
+    return hierarchy
+
+
+def build_overlay(graph_path, water_only=False, passage_factor=1.0):
+    """Build and save the CH overlay for a compact graph directory"""
+    start = time.time()
+    graph = load_csr_graph(graph_path)
+    engine = RoutingEngine(graph, water_only=water_only, passage_factor=passage_factor)
+    print(f"Contracting {graph.number_of_nodes()} nodes...")
+
+    ch_arrays = build_contraction_hierarchy(engine)
+    meta = {
+        'version': CH_FORMAT_VERSION,
+        'fingerprint': graph_fingerprint(engine),
+        'water_only': water_only,
+        'passage_factor': passage_factor,
+        'shortcut_count': ch_arrays['shortcut_count'],
+        'core_size': ch_arrays['core_size'],
+        'build_time': time.time() - start,
+    }
+    path = ch_path_for(graph_path)
+    save_contraction_hierarchy(ch_arrays, path, meta)
+    print(f"Added {meta['shortcut_count']} shortcuts ({meta['core_size']} core nodes) in {meta['build_time']:.1f}s, saved to {path}")
+    return path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    passage_factor = 1.0
+    if '--passage-factor' in sys.argv:
+        passage_factor = float(sys.argv[sys.argv.index('--passage-factor') + 1])
+    build_overlay(sys.argv[1], water_only='--water-only' in sys.argv, passage_factor=passage_factor)
@@ -0,0 +1,205 @@
+"""
+Streaming GeoJSON reader for the graph builders.
+
+json.load keeps the whole dict tree of a GeoJSON file in memory next to the
+shapely geometries built from it, which for high-resolution coastlines runs
+to gigabytes. iter_geometries walks the top-level "features" (or
+"geometries") array instead, decoding one member at a time from a small
+read buffer, so only the feature being converted is ever held as dicts.
+
+load_geometries turns the stream into shapely geometries and can cache them
+as WKB in a binary sidecar next to the source file. The sidecar records the
+source's size and modification time, so a changed source is re-parsed and
+an unchanged one skips JSON entirely on the next build.
+"""
+import os
+import json
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+WKB_SUFFIX = '.wkb'
+WKB_FORMAT_VERSION = 1
+READ_SIZE = 1 << 20  # Characters read per refill
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _Reader:
+    """Buffered text reader that decodes one JSON value at a time"""
+
+    def __init__(self, f, read_size=READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        data = self.f.read(size or self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        # Drop what has been consumed so the buffer stays around one feature long
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character ('' at end of file), without consuming it"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of chars; returns it"""
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Expected one of {chars!r} at offset {self.pos}, found {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self, decoder=json.JSONDecoder()):
+        """Decode the next complete JSON value"""
+        self.peek()
+        size = self.read_size
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Incomplete: read more, doubling each time so one huge feature
+                # is re-scanned a logarithmic number of times
+                if self._fill(size):
+                    size *= 2
+                    continue
+                raise
+            # A number can be cut short at the end of the buffer; make sure it is complete
+            if end == len(self.buf) and not self.eof and self._fill(size):
+                continue
+            self.pos = end
+            return value
+
+
+def _geometry(member):
+    """The geometry dict of a feature or bare geometry, or None"""
+    if isinstance(member, dict) and member.get('type') == 'Feature':
+        member = member.get('geometry')
+    return member if isinstance(member, dict) else None
+
+
+def iter_geometries(path, read_size=READ_SIZE):
+    """
+    Yield the geometry dicts of a GeoJSON file one at a time. Members of a
+    FeatureCollection's "features" or a GeometryCollection's "geometries"
+    are decoded one by one; any other document is a single geometry (or
+    feature) and is yielded whole.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f, read_size)
+        reader.expect('{')
+        document = {}
+        streamed = False
+        while reader.peek() != '}':
+            if document or streamed:
+                reader.expect(',')
+            key = reader.value()
+            reader.expect(':')
+            if key in ('features', 'geometries') and reader.peek() == '[':
+                streamed = True
+                reader.expect('[')
+                first = True
+                while reader.peek() != ']':
+                    if not first:
+                        reader.expect(',')
+                    first = False
+                    geometry = _geometry(reader.value())
+                    if geometry is not None:
+                        yield geometry
+                reader.expect(']')
+            else:
+                document[key] = reader.value()
+        reader.expect('}')
+
+    if not streamed:
+        geometry = _geometry(document)
+        if geometry is not None:
+            yield geometry
+
+
+def geometry_cache_path(path):
+    """Return the WKB sidecar that sits next to a GeoJSON file"""
+    return path + WKB_SUFFIX
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def save_geometry_cache(geometries, source_path, cache_path=None):
+    """Write geometries as WKB with the source file's stamp; returns the sidecar path"""
+    cache_path = cache_path or geometry_cache_path(source_path)
+    blobs = shapely.to_wkb(np.asarray(geometries, dtype=object)) if len(geometries) else np.array([], dtype=object)
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+    meta = dict(_source_stamp(source_path), version=WKB_FORMAT_VERSION)
+
+    # Write to a per-process temporary file first, so neither a crashed build nor
+    # pool workers parsing the same file at once can leave a truncated sidecar
+    temp_path = f"{cache_path}.temp{os.getpid()}"
+    with open(temp_path, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), offsets=offsets,
+                 data=np.frombuffer(b''.join(blobs), dtype=np.uint8))
+    os.replace(temp_path, cache_path)
+    return cache_path
+
+
+def load_geometry_cache(source_path, cache_path=None):
+    """Geometries from the WKB sidecar, or None when it is missing or stale"""
+    cache_path = cache_path or geometry_cache_path(source_path)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path, allow_pickle=False) as cached:
+            meta = json.loads(str(cached['meta']))
+            if meta != dict(_source_stamp(source_path), version=WKB_FORMAT_VERSION):
+                return None
+            offsets, data = cached['offsets'], cached['data'].tobytes()
+    except Exception as e:
+        print(f"Warning: Could not read geometry cache {cache_path}: {e}")
+        return None
+    blobs = [data[a:b] for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    return list(shapely.from_wkb(blobs)) if blobs else []
+
+
+def load_geometries(path, cache=True):
+    """
+    Shapely geometries from a GeoJSON file, converted one feature at a time.
+    With cache=True a fresh WKB sidecar is used instead of the JSON, and one
+    is written after parsing.
+    """
+    if cache:
+        geometries = load_geometry_cache(path)
+        if geometries is not None:
+            print(f"Loaded {len(geometries)} geometries from {geometry_cache_path(path)}")
+            return geometries
+
+    geometries = []
+    for geometry in iter_geometries(path):
+        try:
+            geometries.append(shape(geometry))
+        except Exception as e:
+            print(f"Error converting geometry to shape: {e}")
+
+    if cache:
+        try:
+            save_geometry_cache(geometries, path)
+        except OSError as e:
+            print(f"Warning: Could not write geometry cache for {path}: {e}")
+    return geometries
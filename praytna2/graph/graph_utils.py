@@ -0,0 +1,390 @@
+"""
+Compact on-disk graph format for the ocean routing server.
+
+A graph is stored as a directory of plain .npy arrays (node coordinates, node
+type codes and CSR offsets/targets/weights) plus a small meta.json holding the
+string table for port and passage names. Every array can be opened with
+np.load(mmap_mode='r'), so loading is near-instant and gunicorn workers share
+the same page-cache pages instead of each unpickling a networkx graph.
+
+Usage:
+    python graph_utils.py ocean_graph_connected.pkl [output_dir]
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import numpy as np
+import networkx as nx
+
+FORMAT_NAME = 'ocean-csr'
+FORMAT_VERSION = 1
+CSR_SUFFIX = '.csr'
+
+# Node type codes; code 0 is kept for nodes built before types were recorded
+NODE_TYPES = (None, 'ocean', 'port', 'passage')
+NODE_TYPE_CODES = {name: code for code, name in enumerate(NODE_TYPES)}
+
+# Edge flag bits
+EDGE_PASSAGE = 1
+EDGE_DATE_LINE = 2
+
+ARRAY_NAMES = ('coords', 'node_types', 'offsets', 'targets', 'weights', 'edge_flags', 'edge_names', 'lane_distances',
+               'coastal')
+
+# Arrays that graphs exported before they existed do not have
+OPTIONAL_ARRAY_NAMES = ('lane_distances', 'coastal')
+
+
+def csr_path_for(pickle_path):
+    """Return the compact-format directory that sits next to a pickle file"""
+    base, _ = os.path.splitext(pickle_path)
+    return base + CSR_SUFFIX
+
+
+def _encode_edges(edges, ids, strings):
+    """
+    Turn (u, v, data) edges into source/target/weight/flag/name/lane distance
+    arrays holding both directions of each undirected edge. Passage names are
+    appended to the shared string table.
+    """
+    string_ids = {name: i for i, name in enumerate(strings)}
+    sources, targets, weights, flags, edge_names, lane_distances = [], [], [], [], [], []
+    for u, v, data in edges:
+        flag = 0
+        if data.get('is_passage'):
+            flag |= EDGE_PASSAGE
+        if data.get('date_line_crossing') or data.get('antimeridian'):
+            flag |= EDGE_DATE_LINE
+
+        name_id = -1
+        if data.get('passage_name'):
+            if data['passage_name'] not in string_ids:
+                string_ids[data['passage_name']] = len(strings)
+                strings.append(data['passage_name'])
+            name_id = string_ids[data['passage_name']]
+
+        # Store both directions of the undirected edge
+        for a, b in ((u, v), (v, u)):
+            sources.append(ids[a])
+            targets.append(ids[b])
+            weights.append(data.get('weight', 0.0))
+            flags.append(flag)
+            edge_names.append(name_id)
+            lane_distances.append(data.get('lane_distance', np.nan))
+
+    return (
+        np.asarray(sources, dtype=np.int64),
+        np.asarray(targets, dtype=np.int32),
+        np.asarray(weights, dtype=np.float64),
+        np.asarray(flags, dtype=np.uint8),
+        np.asarray(edge_names, dtype=np.int32),
+        np.asarray(lane_distances, dtype=np.float32),
+    )
+
+
+def _assemble(n, sources, *edge_arrays):
+    """Sort directed edge arrays by source and return offsets followed by the sorted arrays"""
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+    return (offsets,) + tuple(array[order] for array in edge_arrays)
+
+
+class _NodeView:
+    """Read-only stand-in for networkx's G.nodes over CSR arrays"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        if not data:
+            return iter(self)
+        return ((self._graph.name_of(i), self._graph.node_data(i)) for i in range(len(self)))
+
+    def __getitem__(self, node):
+        return self._graph.node_data(self._graph.index_of(node))
+
+    def __iter__(self):
+        return (self._graph.name_of(i) for i in range(len(self)))
+
+    def __len__(self):
+        return self._graph.number_of_nodes()
+
+    def __contains__(self, node):
+        try:
+            self._graph.index_of(node)
+            return True
+        except KeyError:
+            return False
+
+
+class CSRGraph:
+    """
+    Immutable undirected graph in compressed sparse row form.
+
+    Every undirected edge is stored once per direction, so the neighbours of
+    node i are targets[offsets[i]:offsets[i + 1]]. Nodes are addressed by
+    integer id internally and keep their original names (node_123,
+    port_Singapore, ...) for the HTTP API.
+    """
+
+    def __init__(self, coords, node_types, offsets, targets, weights, edge_flags=None,
+                 edge_names=None, strings=None, named_nodes=None, stats=None, lane_distances=None, coastal=None):
+        self.coords = coords
+        self.node_types = node_types
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.edge_flags = edge_flags if edge_flags is not None else np.zeros(len(targets), dtype=np.uint8)
+        self.edge_names = edge_names if edge_names is not None else np.full(len(targets), -1, dtype=np.int32)
+        # Distance in km from each edge to the nearest shipping lane (NaN when unknown)
+        self.lane_distances = (lane_distances if lane_distances is not None
+                               else np.full(len(targets), np.nan, dtype=np.float32))
+        # Per-node coastal flag, preferred when snapping points to the graph
+        self.coastal = coastal if coastal is not None else np.zeros(len(coords), dtype=bool)
+        self.strings = list(strings or [])
+        self.stats = stats or {}
+        self.nodes = _NodeView(self)
+
+        # Only nodes whose name is not simply node_<id> need a string table entry
+        self._names = {int(i): name for i, name in (named_nodes or [])}
+        self._ids = {name: i for i, name in self._names.items()}
+        self._nx_graph = None
+
+    # --- Construction ---
+
+    @classmethod
+    def from_networkx(cls, G, stats=None):
+        """Convert a networkx graph built by the graph builders"""
+        names = list(G.nodes())
+        ids = {name: i for i, name in enumerate(names)}
+        n = len(names)
+
+        coords = np.zeros((n, 2), dtype=np.float64)
+        node_types = np.zeros(n, dtype=np.uint8)
+        coastal = np.zeros(n, dtype=bool)
+        named_nodes = []
+        for i, (name, data) in enumerate(G.nodes(data=True)):
+            coords[i] = data.get('coordinates', (np.nan, np.nan))[:2]
+            node_types[i] = NODE_TYPE_CODES.get(data.get('type'), 0)
+            coastal[i] = bool(data.get('coastal', False))
+            if name != f'node_{i}':
+                named_nodes.append([i, name])
+
+        strings = []
+        *arrays, lane_distances = _assemble(n, *_encode_edges(G.edges(data=True), ids, strings))
+        return cls(coords, node_types, *arrays, strings, named_nodes, stats, lane_distances=lane_distances,
+                   coastal=coastal)
+
+    def with_edges(self, edges):
+        """
+        Return a new graph with extra (u, v, data) edges added, e.g. maritime
+        passages. Like nx.Graph.add_edge, an edge that already exists is
+        replaced. The arrays are rebuilt once, so this is meant for startup.
+        """
+        n = self.number_of_nodes()
+        ids = {node: self.index_of(node) for u, v, _ in edges for node in (u, v)}
+        strings = list(self.strings)
+        new_edges = _encode_edges(edges, ids, strings)
+
+        sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.offsets))
+        replaced = np.isin(sources * n + self.targets, new_edges[0] * n + new_edges[1])
+        old_edges = [
+            array[~replaced]
+            for array in (sources, self.targets, self.weights, self.edge_flags, self.edge_names, self.lane_distances)
+        ]
+        merged = [np.concatenate([old, new]) for old, new in zip(old_edges, new_edges)]
+        named_nodes = [[i, name] for i, name in sorted(self._names.items())]
+        *arrays, lane_distances = _assemble(n, *merged)
+        return CSRGraph(self.coords, self.node_types, *arrays, strings, named_nodes, self.stats,
+                        lane_distances=lane_distances, coastal=self.coastal)
+
+    def to_networkx(self):
+        """Return a networkx copy for code paths that still need one (cached)"""
+        if self._nx_graph is None:
+            G = nx.Graph()
+            for i in range(self.number_of_nodes()):
+                G.add_node(self.name_of(i), **self.node_data(i))
+            for u, v, data in self.edges(data=True):
+                G.add_edge(u, v, **data)
+            self._nx_graph = G
+        return self._nx_graph
+
+    # --- networkx-style read API ---
+
+    def number_of_nodes(self):
+        return len(self.coords)
+
+    def number_of_edges(self):
+        return len(self.targets) // 2
+
+    def name_of(self, i):
+        """Return the node name for an integer id"""
+        return self._names.get(int(i), f'node_{i}')
+
+    def index_of(self, node):
+        """Return the integer id for a node name"""
+        if node in self._ids:
+            return self._ids[node]
+        if isinstance(node, str) and node.startswith('node_'):
+            try:
+                i = int(node[5:])
+            except ValueError:
+                raise KeyError(node)
+            if 0 <= i < self.number_of_nodes() and i not in self._names:
+                return i
+        raise KeyError(node)
+
+    def node_type(self, i):
+        return NODE_TYPES[self.node_types[i]]
+
+    def node_data(self, i):
+        """Return the attribute dict networkx would hold for node i"""
+        data = {'coordinates': (float(self.coords[i, 0]), float(self.coords[i, 1]))}
+        node_type = self.node_type(i)
+        if node_type is not None:
+            data['type'] = node_type
+        if self.coastal[i]:
+            data['coastal'] = True
+        return data
+
+    def edge_ids(self, i):
+        """Return the CSR slice holding the outgoing edges of node i"""
+        return range(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def neighbors(self, node):
+        i = self.index_of(node)
+        return (self.name_of(j) for j in self.targets[self.offsets[i]:self.offsets[i + 1]])
+
+    def _edge_id(self, u, v):
+        """Return the CSR position of edge u->v (integer ids), or -1"""
+        start, end = int(self.offsets[u]), int(self.offsets[u + 1])
+        hits = np.flatnonzero(self.targets[start:end] == v)
+        return start + int(hits[0]) if len(hits) else -1
+
+    def edge_data(self, e):
+        """Return the attribute dict networkx would hold for CSR edge e"""
+        data = {'weight': float(self.weights[e])}
+        if self.edge_flags[e] & EDGE_PASSAGE:
+            data['is_passage'] = True
+        if self.edge_flags[e] & EDGE_DATE_LINE:
+            data['date_line_crossing'] = True
+        if self.edge_names[e] >= 0:
+            data['passage_name'] = self.strings[self.edge_names[e]]
+        if np.isfinite(self.lane_distances[e]):
+            data['lane_distance'] = float(self.lane_distances[e])
+        return data
+
+    def has_edge(self, u, v):
+        try:
+            return self._edge_id(self.index_of(u), self.index_of(v)) >= 0
+        except KeyError:
+            return False
+
+    def get_edge_data(self, u, v, default=None):
+        try:
+            e = self._edge_id(self.index_of(u), self.index_of(v))
+        except KeyError:
+            return default
+        return self.edge_data(e) if e >= 0 else default
+
+    def edges(self, data=False):
+        """Iterate each undirected edge once"""
+        for u in range(self.number_of_nodes()):
+            for e in self.edge_ids(u):
+                v = int(self.targets[e])
+                if u < v:
+                    if data:
+                        yield self.name_of(u), self.name_of(v), self.edge_data(e)
+                    else:
+                        yield self.name_of(u), self.name_of(v)
+
+    def count_flagged_edges(self, flag):
+        """Count undirected edges carrying a flag bit"""
+        return int(np.count_nonzero(self.edge_flags & flag)) // 2
+
+
+def save_csr_graph(graph, path):
+    """Write a CSRGraph to a directory of .npy arrays plus meta.json"""
+    os.makedirs(path, exist_ok=True)
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(getattr(graph, name)))
+
+    meta = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'strings': graph.strings,
+        'named_nodes': [[i, name] for i, name in sorted(graph._names.items())],
+        'stats': graph.stats,
+    }
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, default=str)
+
+
+def load_csr_graph(path, mmap=True):
+    """Load a graph written by save_csr_graph, memory-mapping the arrays by default"""
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT_NAME or meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} {FORMAT_NAME} graph")
+
+    arrays = {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None)
+        for name in ARRAY_NAMES
+        if name not in OPTIONAL_ARRAY_NAMES or os.path.exists(os.path.join(path, f'{name}.npy'))
+    }
+    return CSRGraph(strings=meta['strings'], named_nodes=meta['named_nodes'], stats=meta['stats'], **arrays)
+
+
+def export_pickle(pickle_path, output_path=None):
+    """Convert a pickled (graph, stats) tuple or bare nx.Graph to the compact format"""
+    output_path = output_path or csr_path_for(pickle_path)
+    with open(pickle_path, 'rb') as f:
+        data = pickle.load(f)
+
+    if isinstance(data, tuple) and len(data) == 2:
+        G, stats = data
+    elif isinstance(data, nx.Graph):
+        G, stats = data, {}
+    else:
+        raise ValueError(f"Unrecognised graph pickle {pickle_path}")
+
+    stats = dict(stats or {})
+    stats.setdefault('node_count', G.number_of_nodes())
+    stats.setdefault('edge_count', G.number_of_edges())
+    stats['source_file'] = os.path.basename(pickle_path)
+
+    graph = CSRGraph.from_networkx(G, stats)
+    save_csr_graph(graph, output_path)
+    return graph, output_path
+
+
+def fresh_csr_path(pickle_path):
+    """
+    Return the compact sidecar for a pickle if it exists and is at least as new
+    as the pickle (or the pickle is gone), otherwise None.
+    """
+    csr_path = csr_path_for(pickle_path)
+    meta_path = os.path.join(csr_path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    if os.path.exists(pickle_path) and os.path.getmtime(meta_path) < os.path.getmtime(pickle_path):
+        return None
+    return csr_path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    start = time.time()
+    graph, path = export_pickle(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"Exported {graph.number_of_nodes()} nodes and {graph.number_of_edges()} edges to {path} "
+          f"in {time.time() - start:.1f}s")
+
+    start = time.time()
+    load_csr_graph(path)
+    print(f"Reloaded in {(time.time() - start) * 1000:.1f}ms")
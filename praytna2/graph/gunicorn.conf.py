@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for the routing API.
+
+The app (and with it the graph, spatial index and routing tables) is loaded
+once in the master and shared copy-on-write with the forked workers.
+"""
+import gc
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    # Keep the collector out of the preloaded objects so that GC passes in the
+    # workers do not write to (and so privately copy) the shared pages
+    gc.freeze()
@@ -0,0 +1,221 @@
+"""
+ALT (A*, Landmarks, Triangle inequality) tables for the ocean routing graph.
+
+A handful of landmark nodes -- the major chokepoints from
+config/maritime_passages.json plus the ocean extremes farthest from them --
+get exact shortest-path distances to every node. For any node v and target
+t, |d(L, t) - d(L, v)| is a lower bound on d(v, t), and unlike the
+great-circle bound it already "knows" that NY -> LA has to go round Panama.
+The tables are built once per graph and saved next to it.
+
+Usage:
+    python landmarks.py ocean_graph_connected.csr [--water-only] [--passage-factor 0.8] [--count 16]
+"""
+import os
+import sys
+import json
+import time
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from graph_utils import load_csr_graph
+from pathfinder import RoutingEngine, get_routing_engine
+from contraction import graph_fingerprint
+from spatial_index import get_node_index
+
+LANDMARK_SUFFIX = '.alt'
+LANDMARK_FORMAT_VERSION = 1
+DEFAULT_LANDMARK_COUNT = 16
+PASSAGES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'maritime_passages.json')
+
+
+def landmark_path_for(graph_path):
+    """Return the landmark directory that sits next to a graph file or directory"""
+    base, _ = os.path.splitext(graph_path.rstrip('/'))
+    return base + LANDMARK_SUFFIX
+
+
+def landmark_distances(engine, sources):
+    """Exact distances from each source to every node (inf when unreachable)"""
+    return np.atleast_2d(dijkstra(engine.cost_matrix(), directed=True, indices=list(sources)))
+
+
+def passage_landmarks(engine, passages_file=PASSAGES_FILE):
+    """Nodes nearest the maritime passages, skipping any the engine cannot route through"""
+    try:
+        with open(passages_file, 'r') as f:
+            passages = json.load(f)['passages']
+    except Exception as e:
+        print(f"Warning: Could not load maritime passages: {e}")
+        return []
+
+    index = get_node_index(engine.graph)
+    degree = np.diff(engine.offsets)
+    landmarks = []
+    for passage in passages:
+        node, _ = index.nearest(passage['coordinates'][0])
+        if node is None:
+            continue
+        i = engine.graph.index_of(node)
+        if degree[i] and i not in landmarks:
+            landmarks.append(i)
+    return landmarks
+
+
+def select_landmarks(engine, count=DEFAULT_LANDMARK_COUNT, passages_file=PASSAGES_FILE):
+    """
+    Chokepoint landmarks first, then farthest-point selection: each new
+    landmark is the reachable node farthest from all landmarks so far.
+    Returns (landmark ids, distance table).
+    """
+    landmarks = passage_landmarks(engine, passages_file)[:count]
+    if not landmarks:
+        landmarks = [int(np.argmax(np.diff(engine.offsets) > 0))]
+    rows = list(landmark_distances(engine, landmarks))
+
+    while len(landmarks) < count:
+        closest = np.min(rows, axis=0)
+        closest[~np.isfinite(closest)] = -1.0
+        v = int(np.argmax(closest))
+        if closest[v] <= 0:
+            break  # Every reachable node is already a landmark
+        landmarks.append(v)
+        rows.append(landmark_distances(engine, [v])[0])
+
+    return np.asarray(landmarks, dtype=np.int32), np.asarray(rows, dtype=np.float64)
+
+
+class LandmarkTable:
+    """Landmark distance tables and the ALT lower bound they give"""
+
+    def __init__(self, landmarks, distances, meta=None):
+        self.meta = meta or {}
+        self.landmarks = np.asarray(landmarks)
+        self.distances = np.asarray(distances)
+
+    def __len__(self):
+        return len(self.landmarks)
+
+    def matches(self, engine):
+        """Whether these tables were built for the given engine's costs"""
+        return self.meta.get('fingerprint') == graph_fingerprint(engine)
+
+    def heuristic_table(self, target):
+        """Lower bound on the distance from every node to target (edge weights are symmetric)"""
+        to_target = self.distances[:, target][:, None]
+        with np.errstate(invalid='ignore'):
+            bounds = np.abs(to_target - self.distances)
+        # A landmark that cannot reach both nodes says nothing about them
+        bounds[~np.isfinite(bounds)] = 0.0
+        return bounds.max(axis=0)
+
+
+def save_landmarks(table, path):
+    """Write landmark ids, distances and meta.json to a landmark directory"""
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'landmarks.npy'), table.landmarks)
+    np.save(os.path.join(path, 'distances.npy'), table.distances)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(table.meta, f)
+
+
+def load_landmark_table(path, mmap=True):
+    """Load tables written by save_landmarks"""
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != LANDMARK_FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {LANDMARK_FORMAT_VERSION} landmark table")
+    mode = 'r' if mmap else None
+    return LandmarkTable(
+        np.load(os.path.join(path, 'landmarks.npy'), mmap_mode=mode),
+        np.load(os.path.join(path, 'distances.npy'), mmap_mode=mode),
+        meta
+    )
+
+
+def build_landmark_table(engine, count=DEFAULT_LANDMARK_COUNT):
+    """Select landmarks for an engine and return its LandmarkTable"""
+    start = time.time()
+    landmarks, distances = select_landmarks(engine, count)
+    meta = {
+        'version': LANDMARK_FORMAT_VERSION,
+        'fingerprint': graph_fingerprint(engine),
+        'water_only': engine.water_only,
+        'passage_factor': engine.passage_factor,
+        'landmark_count': len(landmarks),
+        'build_time': time.time() - start,
+    }
+    return LandmarkTable(landmarks, distances, meta)
+
+
+def attach_landmarks(engine, count=DEFAULT_LANDMARK_COUNT):
+    """Build landmarks in memory for an engine that has none (e.g. a runtime passage graph)"""
+    if engine.landmarks is None:
+        engine.landmarks = build_landmark_table(engine, count)
+        print(f"Selected {len(engine.landmarks)} ALT landmarks in {engine.landmarks.meta['build_time']:.2f}s")
+    return engine.landmarks
+
+
+def build_landmarks(graph_path, water_only=False, passage_factor=1.0, count=DEFAULT_LANDMARK_COUNT):
+    """Build and save the landmark tables for a compact graph directory"""
+    graph = load_csr_graph(graph_path)
+    engine = RoutingEngine(graph, water_only=water_only, passage_factor=passage_factor)
+    table = build_landmark_table(engine, count)
+    path = landmark_path_for(graph_path)
+    save_landmarks(table, path)
+    print(f"Selected {len(table)} ALT landmarks in {table.meta['build_time']:.2f}s, saved to {path}")
+    return path
+
+
+def load_landmarks(graph, graph_path):
+    """
+    Attach the saved landmark tables for a compact graph to the matching
+    routing engine so ALT searches can use them. Returns the table, or None
+    when there are no tables or they were built for a different graph.
+    """
+    path = landmark_path_for(graph_path)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+
+    table = load_landmark_table(path)
+    engine = get_routing_engine(
+        graph,
+        water_only=table.meta.get('water_only', False),
+        passage_factor=table.meta.get('passage_factor', 1.0)
+    )
+    if not table.matches(engine):
+        print(f"Ignoring stale landmark tables {path}; rebuild them with landmarks.py")
+        return None
+
+    engine.landmarks = table
+    return table
+
+
+def ensure_landmarks(graph, graph_path):
+    """
+    Load the saved landmark tables, building and saving them first if
+    missing or stale. Tables that cannot be saved are still used in memory.
+    """
+    table = load_landmarks(graph, graph_path)
+    if table is None:
+        engine = get_routing_engine(graph)
+        engine.landmarks = None
+        table = attach_landmarks(engine)
+        try:
+            save_landmarks(table, landmark_path_for(graph_path))
+        except OSError as e:
+            print(f"Could not save landmark tables: {e}")
+    return table
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    passage_factor = 1.0
+    if '--passage-factor' in sys.argv:
+        passage_factor = float(sys.argv[sys.argv.index('--passage-factor') + 1])
+    count = DEFAULT_LANDMARK_COUNT
+    if '--count' in sys.argv:
+        count = int(sys.argv[sys.argv.index('--count') + 1])
+    build_landmarks(sys.argv[1], water_only='--water-only' in sys.argv, passage_factor=passage_factor, count=count)
@@ -0,0 +1,415 @@
+"""
+Array-native shortest-path engine for the ocean routing server.
+
+The engine works on the CSR arrays of a CSRGraph rather than on networkx
+dicts: edge costs (with the water-only mask and passage discounts) are
+precomputed once per graph, the A* heap is keyed on integer node ids, and the
+great-circle heuristic for a target is computed for every node in a single
+vectorised pass.
+"""
+import heapq
+import weakref
+from array import array
+from collections import OrderedDict, namedtuple
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from graph_utils import EDGE_PASSAGE, NODE_TYPE_CODES
+from spatial_index import EARTH_RADIUS_KM, to_unit_xyz
+
+# Untyped nodes come from builders that only ever emitted water grid nodes
+WATER_TYPE_CODES = (NODE_TYPE_CODES[None], NODE_TYPE_CODES['ocean'])
+
+PathResult = namedtuple('PathResult', ['path', 'cost', 'expanded', 'method'])
+
+# Per-request search choices: great-circle A*, landmark A*, the CH overlay
+# and coarse-to-fine corridor routing
+SEARCH_METHODS = ('astar', 'alt', 'ch', 'corridor')
+
+# Lane preference: an edge's cost grows with its distance to the nearest
+# shipping lane, up to (1 + lane_penalty) times its length at this distance
+LANE_RADIUS_KM = 200.0
+# Lane penalties are rounded to this step and capped, and only the most
+# recently used lane engines are kept, so clients cannot grow the cache
+LANE_PENALTY_STEP = 0.1
+MAX_LANE_PENALTY = 10.0
+MAX_LANE_ENGINES = 4
+
+# One engine per (graph, cost options), built on first use and dropped with the graph
+_engine_cache = weakref.WeakKeyDictionary()
+
+
+def lane_cost_factors(lane_distances, lane_penalty):
+    """
+    Edge cost multipliers for a lane preference: 1 on a lane, rising linearly
+    to 1 + lane_penalty at LANE_RADIUS_KM and beyond. Edges without a lane
+    distance are not penalised. The factors are never below 1, so the
+    great-circle and landmark bounds stay admissible.
+    """
+    distances = np.nan_to_num(np.asarray(lane_distances, dtype=np.float64), nan=0.0, posinf=LANE_RADIUS_KM)
+    return 1.0 + lane_penalty * np.clip(distances / LANE_RADIUS_KM, 0.0, 1.0)
+
+
+def lane_penalty_level(lane_penalty):
+    """lane_penalty rounded to LANE_PENALTY_STEP and capped at MAX_LANE_PENALTY"""
+    steps = round(min(float(lane_penalty), MAX_LANE_PENALTY) / LANE_PENALTY_STEP)
+    return round(steps * LANE_PENALTY_STEP, 6)
+
+
+def flat_array(values, typecode):
+    """
+    Copy a numpy array into an array.array for the search loops. Indexing one
+    is as fast as indexing a list, but the values are raw machine numbers
+    rather than Python objects, so reading them never writes refcounts into
+    memory a forked gunicorn worker shares with the master.
+    """
+    dtype = np.int64 if typecode == 'q' else np.float64
+    return array(typecode, np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+
+class RoutingEngine:
+    """Precomputed edge costs and A* search over a CSRGraph"""
+
+    def __init__(self, graph, water_only=False, passage_factor=1.0, lane_penalty=0.0):
+        self.graph = graph
+        self.water_only = water_only
+        self.passage_factor = passage_factor
+        self.lane_penalty = lane_penalty
+        n = graph.number_of_nodes()
+        offsets = np.asarray(graph.offsets)
+        targets = np.asarray(graph.targets)
+        sources = np.repeat(np.arange(n), np.diff(offsets))
+
+        costs = np.array(graph.weights, dtype=np.float64)
+        passage = (np.asarray(graph.edge_flags) & EDGE_PASSAGE) != 0
+        costs[passage] *= passage_factor
+        if lane_penalty:
+            costs *= lane_cost_factors(graph.lane_distances, lane_penalty)
+
+        # Mask out non-water edges once here instead of in a per-edge callback
+        keep = np.isfinite(costs)
+        if water_only:
+            water = np.isin(np.asarray(graph.node_types), WATER_TYPE_CODES)
+            keep &= passage | (water[sources] & water[targets])
+
+        # edge_map takes an engine edge back to its CSRGraph edge id
+        self.edge_map = np.flatnonzero(keep)
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources[keep], minlength=n), out=self.offsets[1:])
+        self.targets = targets[keep]
+        self.costs = costs[keep]
+        self.xyz = to_unit_xyz(graph.coords[:, 0], graph.coords[:, 1])
+
+        # Optional contraction hierarchy, ALT landmark tables and corridor
+        # router over these costs (see contraction.py, landmarks.py, corridor.py)
+        self.hierarchy = None
+        self.landmarks = None
+        self.corridor = None
+        self._matrix = None
+        self._components = None
+
+        # The search loop indexes flat arrays, which is far cheaper than numpy scalars
+        self._offsets = flat_array(self.offsets, 'q')
+        self._targets = flat_array(self.targets, 'q')
+        self._costs = flat_array(self.costs, 'd')
+
+    def cost_matrix(self):
+        """The engine's edge costs as a scipy sparse matrix, built on first use"""
+        if self._matrix is None:
+            n = len(self.offsets) - 1
+            self._matrix = csr_matrix((self.costs, self.targets, self.offsets), shape=(n, n))
+        return self._matrix
+
+    def component_labels(self):
+        """Connected-component label of every node over the engine's edges, computed on first use"""
+        if self._components is None:
+            _, self._components = connected_components(self.cost_matrix(), directed=False)
+        return self._components
+
+    def reachable(self, source, target):
+        """Whether any path joins two nodes (integer ids): one label comparison, no search"""
+        labels = self.component_labels()
+        return labels[source] == labels[target]
+
+    def shortest_path_tree(self, source):
+        """
+        Single-source Dijkstra to every node (run in C by scipy).
+        Returns (distance array, predecessor array); unreachable nodes have
+        an infinite distance and a negative predecessor.
+        """
+        return dijkstra(self.cost_matrix(), directed=True, indices=source, return_predecessors=True)
+
+    def heuristic_table(self, target, scale=1.0):
+        """Great-circle distance in km from every node to target, times scale"""
+        chord = np.linalg.norm(self.xyz - self.xyz[target], axis=1)
+        return (scale * 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))).tolist()
+
+    def alt_table(self, target, scale=1.0):
+        """Landmark lower bounds to target, never weaker than the great-circle table"""
+        bounds = self.landmarks.heuristic_table(target)
+        if scale:
+            bounds = np.maximum(bounds, self.heuristic_table(target, scale))
+        return bounds.tolist()
+
+    def astar(self, source, target, heuristic_scale=1.0, landmarks=False, allowed=None, costs=None):
+        """
+        A* from source to target (integer ids). With heuristic_scale <= 1 the
+        heuristic is admissible for haversine edge weights, and 0 gives plain
+        Dijkstra. With landmarks, the attached ALT tables tighten the bound.
+        allowed optionally restricts the search to nodes whose entry is true,
+        and costs replaces the edge costs (e.g. CostOverlay.costs()).
+        Returns a PathResult or None when the target is unreachable.
+        """
+        if landmarks:
+            h = self.alt_table(target, heuristic_scale)
+        else:
+            h = self.heuristic_table(target, heuristic_scale) if heuristic_scale else None
+        method = 'alt' if landmarks else 'astar'
+        offsets, targets = self._offsets, self._targets
+        costs = self._costs if costs is None else costs
+
+        dist = {source: 0.0}
+        prev = {source: -1}
+        closed = set()
+        heap = [(h[source] if h else 0.0, source)]
+        expanded = 0
+
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            closed.add(u)
+            expanded += 1
+
+            if u == target:
+                path = [u]
+                while prev[path[-1]] != -1:
+                    path.append(prev[path[-1]])
+                return PathResult(path[::-1], dist[target], expanded, method)
+
+            du = dist[u]
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                if allowed is not None and not allowed[v]:
+                    continue
+                nd = du + costs[e]
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd + h[v] if h else nd, v))
+
+        return None
+
+    def time_dependent_astar(self, source, target, speed, edge_times, departure=0.0, heuristic_scale=1.0):
+        """
+        Earliest-arrival A* where edge costs depend on when an edge is entered.
+        edge_times[k] holds every edge's travel time in hours when leaving at
+        hour k * edge_times.step_hours, interpolated linearly in between, and
+        must be FIFO (see weather_router.VoyageTimes). departure is in the
+        same hours; the heuristic is great-circle distance at speed (km/h).
+        Returns a PathResult whose cost is the voyage time in hours, or None.
+        """
+        h = self.heuristic_table(target, heuristic_scale / speed) if heuristic_scale else None
+        offsets, targets, step = self._offsets, self._targets, edge_times.step_hours
+
+        arrival = {source: departure}
+        prev = {source: -1}
+        closed = set()
+        heap = [(departure + (h[source] if h else 0.0), source)]
+        expanded = 0
+
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            closed.add(u)
+            expanded += 1
+
+            if u == target:
+                path = [u]
+                while prev[path[-1]] != -1:
+                    path.append(prev[path[-1]])
+                return PathResult(path[::-1], arrival[target] - departure, expanded, 'time_dependent')
+
+            au = arrival[u]
+            k = max(int(au // step), 0)
+            frac = min(max(au / step - k, 0.0), 1.0)
+            now, later = edge_times[k], edge_times[k + 1]
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                t = au + now[e] + (later[e] - now[e]) * frac
+                if t < arrival.get(v, float('inf')):
+                    arrival[v] = t
+                    prev[v] = u
+                    heapq.heappush(heap, (t + h[v] if h else t, v))
+
+        return None
+
+    def shortest_path(self, source, target, heuristic_scale=1.0, method=None):
+        """
+        Answer with the requested search method. By default the contraction
+        hierarchy is used when one is attached, otherwise A*; methods whose
+        tables are not attached fall back to great-circle A*.
+        """
+        if method not in (None,) + SEARCH_METHODS:
+            raise ValueError(f"Unknown search method {method!r}; expected one of {', '.join(SEARCH_METHODS)}")
+        if method == 'alt' and self.landmarks is not None:
+            return self.astar(source, target, heuristic_scale, landmarks=True)
+        if method == 'corridor' and self.corridor is not None:
+            return self.corridor.query(source, target, heuristic_scale)
+        if method in (None, 'ch') and self.hierarchy is not None:
+            if not heuristic_scale:
+                return self.hierarchy.query(source, target)
+            return self.hierarchy.query(
+                source, target,
+                self.heuristic_table(target, heuristic_scale),
+                self.heuristic_table(source, heuristic_scale)
+            )
+        return self.astar(source, target, heuristic_scale)
+
+
+class CostOverlay:
+    """
+    Per-request edge cost multipliers (engine edge id -> factor) layered on
+    an engine's immutable costs, so a request can re-price edges without
+    copying or mutating the shared graph.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.factors = {}
+        self._costs = None
+
+    def update(self, factors):
+        """Set multipliers from an {edge id: factor} dict"""
+        self.factors.update((int(e), float(f)) for e, f in factors.items())
+        self._costs = None
+
+    def cost(self, e):
+        return self.engine._costs[e] * self.factors.get(e, 1.0)
+
+    def path_cost(self, edges):
+        return sum(self.cost(e) for e in edges)
+
+    def costs(self):
+        """Dense overlaid edge costs for RoutingEngine.astar, rebuilt after each update"""
+        if self._costs is None:
+            costs = self.engine.costs.copy()
+            if self.factors:
+                edges = np.fromiter(self.factors.keys(), dtype=np.int64, count=len(self.factors))
+                costs[edges] *= np.fromiter(self.factors.values(), dtype=np.float64, count=len(self.factors))
+            self._costs = flat_array(costs, 'd')
+        return self._costs
+
+
+def path_edges(engine, path):
+    """Engine edge ids along a path of integer node ids"""
+    offsets, targets = engine._offsets, engine._targets
+    edges = []
+    for u, v in zip(path[:-1], path[1:]):
+        for e in range(offsets[u], offsets[u + 1]):
+            if targets[e] == v:
+                edges.append(e)
+                break
+        else:
+            raise ValueError(f"No edge between nodes {u} and {v}")
+    return edges
+
+
+def get_routing_engine(graph, water_only=False, passage_factor=1.0, lane_penalty=0.0):
+    """
+    Return the routing engine for a graph and cost options, building it once.
+    lane_penalty is quantised with lane_penalty_level, and only the
+    MAX_LANE_ENGINES most recently used lane engines are kept.
+    """
+    engines = _engine_cache.setdefault(graph, OrderedDict())
+    lane_penalty = lane_penalty_level(lane_penalty) if lane_penalty else 0.0
+    key = (water_only, passage_factor, lane_penalty)
+    if key in engines:
+        engines.move_to_end(key)
+        return engines[key]
+    
+    engine = RoutingEngine(graph, water_only=water_only, passage_factor=passage_factor, lane_penalty=lane_penalty)
+    if lane_penalty:
+        # Lane factors only raise costs, so the plain engine's landmark bounds still hold
+        engine.landmarks = get_routing_engine(graph, water_only, passage_factor).landmarks
+    engines[key] = engine
+    lane_keys = [cached for cached in engines if cached[2]]
+    for stale in lane_keys[:-MAX_LANE_ENGINES]:
+        del engines[stale]
+    return engine
+
+
+def _tree_path(predecessors, source, target):
+    path = [target]
+    while path[-1] != source:
+        path.append(int(predecessors[path[-1]]))
+    return path[::-1]
+
+
+def find_paths_batch(graph, pairs, water_only=False, passage_factor=1.0):
+    """
+    Route many (source_node, dest_node) name pairs, running one shortest-path
+    tree per unique source instead of one search per pair. Yields
+    (pair index, PathResult with node names or None) grouped by source, so
+    results can be streamed as each tree finishes.
+    """
+    engine = get_routing_engine(graph, water_only=water_only, passage_factor=passage_factor)
+    by_source = {}
+    for i, (source_node, dest_node) in enumerate(pairs):
+        by_source.setdefault(source_node, []).append((i, dest_node))
+
+    for source_node, targets in by_source.items():
+        source = graph.index_of(source_node)
+        dist, predecessors = engine.shortest_path_tree(source)
+        settled = int(np.isfinite(dist).sum())
+        for i, dest_node in targets:
+            target = graph.index_of(dest_node)
+            if not np.isfinite(dist[target]):
+                yield i, None
+                continue
+            path = [graph.name_of(n) for n in _tree_path(predecessors, source, target)]
+            yield i, PathResult(path, float(dist[target]), settled, 'tree')
+
+
+def distance_matrix(graph, source_nodes, target_nodes=None, max_distance=None, water_only=False, passage_factor=1.0):
+    """
+    Shortest-path distances from every source to every target (node names),
+    as a float64 array of shape (sources, targets). One one-to-many search
+    runs per source; with max_distance each search stops there and farther
+    (or unreachable) entries are inf.
+    """
+    engine = get_routing_engine(graph, water_only=water_only, passage_factor=passage_factor)
+    target_nodes = source_nodes if target_nodes is None else target_nodes
+    sources = [graph.index_of(node) for node in source_nodes]
+    targets = [graph.index_of(node) for node in target_nodes]
+    if not sources or not targets:
+        return np.zeros((len(sources), len(targets)))
+
+    dist = dijkstra(engine.cost_matrix(), directed=True, indices=sources,
+                    limit=np.inf if max_distance is None else max_distance)
+    return np.atleast_2d(dist)[:, targets]
+
+
+def find_path_result(graph, source_node, dest_node, water_only=False, passage_factor=1.0,
+                     heuristic_scale=1.0, method=None, lane_penalty=0.0):
+    """
+    Like find_path, but returns the whole PathResult (with node names) so
+    callers can report the search method and expanded-node count. With
+    lane_penalty the search prefers edges near shipping lanes; its cost is
+    then in lane-weighted km.
+    """
+    engine = get_routing_engine(graph, water_only=water_only, passage_factor=passage_factor, lane_penalty=lane_penalty)
+    result = engine.shortest_path(graph.index_of(source_node), graph.index_of(dest_node), heuristic_scale, method)
+    if result is None:
+        return None
+    return result._replace(path=[graph.name_of(i) for i in result.path])
+
+
+def find_path(graph, source_node, dest_node, water_only=False, passage_factor=1.0, heuristic_scale=1.0, method=None):
+    """
+    Drop-in replacement for nx.astar_path / nx.shortest_path on a CSRGraph.
+    Takes and returns node names; returns None when no path exists.
+    """
+    result = find_path_result(graph, source_node, dest_node, water_only, passage_factor, heuristic_scale, method)
+    return result.path if result is not None else None
@@ -0,0 +1,158 @@
+"""
+Route cache for the ocean routing server.
+
+Requests repeat the same lanes over and over, so once both endpoints are
+snapped to graph nodes the search result is cached, keyed on
+(source node, destination node, routing profile, graph version). The
+in-process level is a bounded LRU. An optional SQLite file (ROUTE_CACHE_DB)
+sits behind it, so every gunicorn worker on a host shares the routes any
+one of them has computed.
+
+The graph version comes from the graph file's size and modification time,
+so a rebuilt graph never serves routes computed on the old one.
+"""
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from graph_utils import csr_path_for
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+def graph_file_version(graph_path):
+    """
+    Version string for a graph pickle (or its compact sidecar when the pickle
+    is gone); None when neither exists.
+    """
+    for path in (graph_path, os.path.join(csr_path_for(graph_path), 'meta.json')):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            return f"{os.path.basename(graph_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return None
+
+
+def profile_key(**options):
+    """Canonical string for the routing options a route depends on (vessel, search method, ...)"""
+    return json.dumps(options, sort_keys=True, separators=(',', ':'), default=str)
+
+
+class RouteCache:
+    """Bounded LRU of route results with hit/miss counters and an optional SQLite backend"""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, db_path=None):
+        self.max_size = max_size
+        self.db_path = db_path
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if db_path:
+            with self._connect() as db:
+                db.execute('CREATE TABLE IF NOT EXISTS routes (version TEXT, key TEXT, value TEXT, '
+                           'PRIMARY KEY (version, key))')
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the backend safe across forked workers and threads.
+        # sqlite3's own context manager only commits, so the connection is closed here.
+        with closing(sqlite3.connect(self.db_path, timeout=5)) as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            with db:
+                yield db
+
+    def _key(self, source_node, dest_node, profile):
+        return f"{source_node}|{dest_node}|{profile}"
+
+    def set_version(self, version):
+        """
+        Switch to a new graph version. The in-process entries are dropped, and so
+        are shared entries from other versions.
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+        if self.db_path:
+            try:
+                with self._connect() as db:
+                    db.execute('DELETE FROM routes WHERE version != ?', (version,))
+            except sqlite3.Error as e:
+                print(f"Warning: Could not prune route cache {self.db_path}: {e}")
+
+    def get(self, source_node, dest_node, profile):
+        """Return the cached value for a route, or None"""
+        key = self._key(source_node, dest_node, profile)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.db_path:
+            try:
+                with self._connect() as db:
+                    row = db.execute('SELECT value FROM routes WHERE version = ? AND key = ?',
+                                     (self.version, key)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Warning: Could not read route cache {self.db_path}: {e}")
+                row = None
+            if row is not None:
+                value = json.loads(row[0])
+                with self._lock:
+                    self.hits += 1
+                    self._store(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, source_node, dest_node, profile, value):
+        """Cache a JSON-serialisable route value"""
+        key = self._key(source_node, dest_node, profile)
+        with self._lock:
+            self._store(key, value)
+        if self.db_path:
+            try:
+                with self._connect() as db:
+                    db.execute('INSERT OR REPLACE INTO routes VALUES (?, ?, ?)',
+                               (self.version, key, json.dumps(value)))
+            except sqlite3.Error as e:
+                print(f"Warning: Could not write route cache {self.db_path}: {e}")
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached route, shared ones included, and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+        if self.db_path:
+            with self._connect() as db:
+                db.execute('DELETE FROM routes')
+
+    def stats(self):
+        """Counters for /graph_info"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "shared": bool(self.db_path),
+            "graph_version": self.version
+        }
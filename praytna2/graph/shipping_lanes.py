@@ -0,0 +1,144 @@
+"""
+Shipping lane proximity for the ocean routing graph.
+
+The lanes in converter/Shipping_Lanes_v1.geojson are a few huge
+MultiLineStrings, so they are split into their individual segments and
+indexed in an STRtree, where each segment's bounding box is small. At build
+time every graph edge gets the distance in km to the nearest lane segment,
+computed for all edges in one bulk nearest-neighbour query and stored as the
+edge's lane_distance (the lane_distances array of the compact format). The
+router turns those distances into a lane-preference cost (see
+RoutingEngine's lane_penalty), so a query never touches lane geometry.
+
+Usage:
+    python shipping_lanes.py ocean_graph_connected.csr [lanes.geojson]
+"""
+import os
+import sys
+import time
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+from geojson_stream import load_geometries
+from graph_utils import load_csr_graph
+from spatial_index import EARTH_RADIUS_KM
+
+LANES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'converter', 'Shipping_Lanes_v1.geojson')
+
+# is_valid_location's "near a lane" test, roughly 5 km in degrees
+LANE_NEAR_DEGREES = 0.05
+
+
+def lane_segments(lanes):
+    """Split lane (Multi)LineStrings into an array of two-point segment LineStrings"""
+    parts = shapely.get_parts(np.asarray(lanes, dtype=object))
+    coords, owner = shapely.get_coordinates(parts, return_index=True)
+    # Consecutive vertices of the same part form a segment
+    keep = owner[:-1] == owner[1:]
+    return shapely.linestrings(np.stack([coords[:-1][keep], coords[1:][keep]], axis=1))
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """Great-circle distance in km between lon/lat arrays in degrees"""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(a, dtype=float)) for a in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class LaneIndex:
+    """STRtree over shipping lane segments"""
+
+    def __init__(self, lanes):
+        self.segments = lane_segments(lanes)
+        self.tree = STRtree(self.segments)
+
+    def __len__(self):
+        return len(self.segments)
+
+    def near(self, coord, max_degrees=LANE_NEAR_DEGREES):
+        """Whether a [lon, lat] point lies within max_degrees of a lane"""
+        hits = self.tree.query(shapely.points(coord[:2]), predicate='dwithin', distance=max_degrees)
+        return len(hits) > 0
+
+    def segment_distances(self, starts, ends):
+        """
+        Distance in km from each start -> end segment ([lon, lat] rows) to the
+        nearest lane. The nearest segment is found in degrees, then the gap
+        between the closest points is measured along the great circle.
+        """
+        starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+        distances = np.full(len(starts), np.nan)
+        if not len(starts) or not len(self.segments):
+            return distances
+
+        edges = shapely.linestrings(np.stack([starts, ends], axis=1))
+        edge_ids, segment_ids = self.tree.query_nearest(edges)
+        gaps = shapely.get_coordinates(shapely.shortest_line(edges[edge_ids], self.segments[segment_ids]))
+        km = haversine_km(gaps[0::2, 0], gaps[0::2, 1], gaps[1::2, 0], gaps[1::2, 1])
+        # Ties return several segments for one edge; they are equally near
+        distances[edge_ids] = np.inf
+        np.minimum.at(distances, edge_ids, km)
+        return distances
+
+
+def edge_lane_distances(coords, sources, targets, index):
+    """
+    Lane distance in km for each edge given as source/target rows into coords.
+    Edges across the antimeridian are measured on both sides of it, since
+    either end may be the one near a lane.
+    """
+    coords = np.asarray(coords, dtype=float)
+    starts, ends = coords[sources], coords[targets].copy()
+    wrap = np.abs(ends[:, 0] - starts[:, 0]) > 180
+    if not wrap.any():
+        return index.segment_distances(starts, ends)
+
+    ends[wrap, 0] -= 360 * np.sign(ends[wrap, 0] - starts[wrap, 0])
+    distances = index.segment_distances(starts, ends)
+    # The same edge seen from its other end
+    flipped_starts, flipped_ends = coords[targets][wrap], coords[sources][wrap].copy()
+    flipped_ends[:, 0] -= 360 * np.sign(flipped_ends[:, 0] - flipped_starts[:, 0])
+    distances[wrap] = np.minimum(distances[wrap], index.segment_distances(flipped_starts, flipped_ends))
+    return distances
+
+
+def annotate_lane_distances(G, index):
+    """Set lane_distance (km) on every edge of a networkx graph built by the builders"""
+    edges = list(G.edges())
+    if not edges:
+        return 0
+    nodes = list(G.nodes())
+    ids = {node: i for i, node in enumerate(nodes)}
+    coords = [G.nodes[node].get('coordinates', (np.nan, np.nan))[:2] for node in nodes]
+    sources = np.array([ids[u] for u, _ in edges])
+    targets = np.array([ids[v] for _, v in edges])
+    distances = edge_lane_distances(coords, sources, targets, index)
+    for (u, v), distance in zip(edges, distances.tolist()):
+        G.edges[u, v]['lane_distance'] = distance
+    return len(edges)
+
+
+def add_lane_distances(graph_path, lanes_file=LANES_FILE):
+    """Compute lane distances for an exported compact graph and save them next to its arrays"""
+    start = time.time()
+    graph = load_csr_graph(graph_path)
+    index = LaneIndex(load_geometries(lanes_file))
+    n = graph.number_of_nodes()
+    sources = np.repeat(np.arange(n), np.diff(np.asarray(graph.offsets)))
+    targets = np.asarray(graph.targets)
+    # Both directions of an edge are the same segment, so measure each pair once
+    pairs, inverse = np.unique(np.minimum(sources, targets) * n + np.maximum(sources, targets), return_inverse=True)
+    distances = edge_lane_distances(graph.coords, pairs // n, pairs % n, index)[inverse]
+    np.save(os.path.join(graph_path, 'lane_distances.npy'), distances.astype(np.float32))
+    print(f"Measured {len(distances)} edge lane distances against {len(index)} lane segments "
+          f"in {time.time() - start:.2f}s")
+    return distances
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    add_lane_distances(sys.argv[1], *sys.argv[2:3])
@@ -0,0 +1,193 @@
+"""
+Spatial index over graph node coordinates for fast nearest-node lookups.
+
+Nodes are projected onto the unit sphere and stored in a KD-tree, so the
+chord distance used by the tree is monotonic with great-circle distance and
+k-nearest / radius queries are exact, logarithmic and antimeridian-safe.
+"""
+import weakref
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+# One index per loaded graph, built on first use and dropped with the graph
+_index_cache = weakref.WeakKeyDictionary()
+
+
+def to_unit_xyz(lons, lats):
+    """Convert lon/lat arrays in degrees to points on the unit sphere"""
+    lons = np.radians(np.asarray(lons, dtype=float))
+    lats = np.radians(np.asarray(lats, dtype=float))
+    cos_lat = np.cos(lats)
+    return np.stack([cos_lat * np.cos(lons), cos_lat * np.sin(lons), np.sin(lats)], axis=-1)
+
+
+def km_to_chord(km):
+    """Convert a great-circle distance in km to a unit-sphere chord length"""
+    angle = np.minimum(np.asarray(km, dtype=float) / EARTH_RADIUS_KM, np.pi)
+    return 2.0 * np.sin(angle / 2.0)
+
+
+def chord_to_km(chord):
+    """Convert a unit-sphere chord length back to great-circle km"""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2.0, 0.0, 1.0))
+
+
+class NodeIndex:
+    """KD-tree over node coordinates with optional node-type filtering"""
+
+    def __init__(self, nodes, coordinates, types=None, coastal=None):
+        self.nodes = list(nodes)
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        self.xyz = to_unit_xyz(coordinates[:, 0], coordinates[:, 1])
+        self.types = np.asarray(types if types is not None else [None] * len(self.nodes), dtype=object)
+        self.coastal = np.asarray(coastal if coastal is not None else np.zeros(len(self.nodes)), dtype=bool)
+        self._trees = {}
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Build an index from every node that carries coordinates"""
+        if getattr(graph, 'coords', None) is not None:
+            return cls.from_csr(graph)
+
+        nodes, coordinates, types, coastal = [], [], [], []
+        for node, data in graph.nodes(data=True):
+            if 'coordinates' not in data:
+                continue
+            nodes.append(node)
+            coordinates.append(data['coordinates'][:2])
+            types.append(data.get('type'))
+            coastal.append(bool(data.get('coastal', False)))
+        return cls(nodes, coordinates, types, coastal)
+
+    @classmethod
+    def from_csr(cls, graph):
+        """Build an index straight from a CSRGraph's coordinate, type and coastal arrays"""
+        from graph_utils import NODE_TYPES
+        nodes = [graph.name_of(i) for i in range(graph.number_of_nodes())]
+        types = np.asarray(NODE_TYPES, dtype=object)[np.asarray(graph.node_types)]
+        return cls(nodes, np.asarray(graph.coords), types, np.asarray(graph.coastal))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _tree_for(self, types=None, coastal_only=False):
+        """Return (tree, member positions) for a type filter, building it once"""
+        key = (tuple(sorted(types, key=str)) if types is not None else None, coastal_only)
+        if key not in self._trees:
+            mask = np.ones(len(self.nodes), dtype=bool)
+            if types is not None:
+                type_mask = np.zeros(len(self.nodes), dtype=bool)
+                for node_type in types:
+                    type_mask |= self.types == node_type
+                mask &= type_mask
+            if coastal_only:
+                mask &= self.coastal
+            members = np.flatnonzero(mask)
+            tree = cKDTree(self.xyz[members]) if len(members) else None
+            self._trees[key] = (tree, members)
+        return self._trees[key]
+
+    def query(self, point, k=1, types=None):
+        """Return up to k (node, distance_km) pairs nearest to a [lon, lat] point"""
+        tree, members = self._tree_for(types)
+        if tree is None:
+            return []
+        k = min(k, len(members))
+        chords, positions = tree.query(to_unit_xyz(point[0], point[1]), k=k)
+        chords, positions = np.atleast_1d(chords), np.atleast_1d(positions)
+        return [(self.nodes[members[p]], float(d)) for p, d in zip(positions, chord_to_km(chords))]
+
+    def nearest_many(self, points, types=None):
+        """Nearest node and distance_km for each of many [lon, lat] points, in one tree query"""
+        tree, members = self._tree_for(types)
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if tree is None:
+            return [None] * len(points), np.full(len(points), np.inf)
+        chords, positions = tree.query(to_unit_xyz(points[:, 0], points[:, 1]), k=1)
+        return [self.nodes[members[p]] for p in np.atleast_1d(positions)], chord_to_km(np.atleast_1d(chords))
+
+    def query_radius(self, point, radius_km, types=None):
+        """Return all (node, distance_km) pairs within radius_km, nearest first"""
+        tree, members = self._tree_for(types)
+        if tree is None:
+            return []
+        xyz = to_unit_xyz(point[0], point[1])
+        positions = tree.query_ball_point(xyz, float(km_to_chord(radius_km)))
+        if not positions:
+            return []
+        positions = np.asarray(positions)
+        dists = chord_to_km(np.linalg.norm(self.xyz[members[positions]] - xyz, axis=1))
+        order = np.argsort(dists, kind='stable')
+        return [(self.nodes[members[positions[i]]], float(dists[i])) for i in order]
+
+    def within(self, points, radius_km, types=None):
+        """Boolean mask over all indexed nodes: within radius_km of any of the [lon, lat] points"""
+        mask = np.zeros(len(self.nodes), dtype=bool)
+        tree, members = self._tree_for(types)
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if tree is None or not len(points):
+            return mask
+        other = cKDTree(to_unit_xyz(points[:, 0], points[:, 1]))
+        hits = other.query_ball_tree(tree, float(km_to_chord(radius_km)))
+        positions = [p for hit in hits for p in hit]
+        mask[members[np.asarray(positions, dtype=np.int64)]] = True
+        return mask
+
+    def nearest(self, point, types=None, coastal_factor=None):
+        """
+        Return (node, distance_km) for the best node near a point.
+        With coastal_factor, coastal nodes have their distance scaled by that
+        factor before comparison, matching the old per-node scoring.
+        """
+        hits = self.query(point, k=1, types=types)
+        if not hits:
+            return None, float('inf')
+        best_node, best_dist = hits[0]
+
+        if coastal_factor is not None and coastal_factor < 1.0:
+            tree, members = self._tree_for(types, coastal_only=True)
+            if tree is not None:
+                # The nearest coastal node has the best scaled score of all coastal
+                # nodes, so it only has to beat the nearest node overall
+                chord, position = tree.query(to_unit_xyz(point[0], point[1]), k=1)
+                coastal_dist = float(chord_to_km(chord)) * coastal_factor
+                if coastal_dist < best_dist:
+                    return self.nodes[members[position]], coastal_dist
+        return best_node, best_dist
+
+
+def get_node_index(graph):
+    """Return the spatial index for a graph, building and caching it on first use"""
+    index = _index_cache.get(graph)
+    if index is None:
+        index = NodeIndex.from_graph(graph)
+        _index_cache[graph] = index
+    return index
+
+
+def date_line_pairs(coords, buffer_degrees=5.0, max_lat_diff=1.0):
+    """
+    Pairs (i, j) of [lon, lat] points facing each other across the
+    antimeridian: i within buffer_degrees of -180, j within buffer_degrees
+    of +180, latitudes at most max_lat_diff apart. Returns index arrays and
+    the great-circle distances between the pairs (the short way, across the
+    line). The east side is sorted by latitude, so each west point finds its
+    partners by binary search instead of scanning every east point.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    lons, lats = coords[:, 0], coords[:, 1]
+    west = np.flatnonzero((lons >= -180) & (lons <= -180 + buffer_degrees))
+    east = np.flatnonzero((lons >= 180 - buffer_degrees) & (lons <= 180))
+    east = east[np.argsort(lats[east], kind='stable')]
+
+    start = np.searchsorted(lats[east], lats[west] - max_lat_diff, side='left')
+    end = np.searchsorted(lats[east], lats[west] + max_lat_diff, side='right')
+    counts = end - start
+    i = np.repeat(west, counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    j = east[np.repeat(start, counts) + within]
+
+    xyz = to_unit_xyz(lons, lats)
+    return i, j, chord_to_km(np.linalg.norm(xyz[i] - xyz[j], axis=1))
@@ -0,0 +1,20 @@
+"""
+Graphs shared by the routing tests.
+"""
+import networkx as nx
+from app2 import haversine
+
+def grid_graph(rows=12, cols=20, land=()):
+    """Small 1-degree grid with 8-neighbour haversine edges; land cells are typed 'port'"""
+    G = nx.Graph()
+    for r in range(rows):
+        for c in range(cols):
+            G.add_node(f'node_{r * cols + c}', coordinates=(float(c), float(r)),
+                       type='port' if (r, c) in land else 'ocean')
+    for r in range(rows):
+        for c in range(cols):
+            for dr, dc in ((0, 1), (1, -1), (1, 0), (1, 1)):
+                if 0 <= r + dr < rows and 0 <= c + dc < cols:
+                    u, v = f'node_{r * cols + c}', f'node_{(r + dr) * cols + c + dc}'
+                    G.add_edge(u, v, weight=haversine(G.nodes[u]['coordinates'], G.nodes[v]['coordinates']))
+    return G
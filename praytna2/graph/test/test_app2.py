@@ -1,6 +1,8 @@
 import unittest
 from app2 import app, load_graph, find_nearest_water_node, haversine
 import json
+import numpy as np
+from unittest import mock
 
 class TestNYToLARoute(unittest.TestCase):
     def setUp(self):
@@ -74,5 +76,152 @@ class TestNYToLARoute(unittest.TestCase):
             dist = haversine(coords[i], coords[i+1])
             self.assertLess(dist, 500, "Consecutive points should not be more than 500km apart")
 
+    def test_batch_paths(self):
+        """Batch routes should stream one NDJSON line per pair, matching single requests"""
+        lisbon = [-9.1393, 38.7223]
+        pairs = [
+            {'source': self.ny_coords, 'destination': self.la_coords},
+            {'source': self.ny_coords, 'destination': lisbon},
+            {'source': lisbon, 'destination': self.la_coords},
+        ]
+        response = self.app.post('/batch_ocean_paths',
+                               data=json.dumps({'pairs': pairs}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(sorted(line['index'] for line in lines), [0, 1, 2])
+        
+        for line in lines:
+            single = json.loads(self.app.post('/shortest_ocean_path',
+                                              data=json.dumps(pairs[line['index']]),
+                                              content_type='application/json').data)
+            self.assertAlmostEqual(line['total_distance'], single['total_distance'], places=6)
+            self.assertEqual(line['path_length'], single['path_length'])
+        
+        response = self.app.post('/batch_ocean_paths', data=json.dumps({'pairs': [{'source': [1]}]}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        bad = [{'source': self.ny_coords, 'destination': self.la_coords},
+               {'source': ['a', 'b'], 'destination': self.la_coords}]
+        response = self.app.post('/batch_ocean_paths', data=json.dumps({'pairs': bad}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Pair 1', json.loads(response.data)['error'])
+        response = self.app.post('/batch_ocean_paths', content_type='application/json',
+                               data=json.dumps({'pairs': [{'source': [200, 0], 'destination': self.la_coords}]}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_distance_matrix(self):
+        """The matrix should agree with single routes, in JSON and binary form"""
+        lisbon = [-9.1393, 38.7223]
+        body = {'points': [self.ny_coords, self.la_coords, lisbon], 'speed': 30}
+        data = json.loads(self.app.post('/distance_matrix', data=json.dumps(body),
+                                        content_type='application/json').data)
+        single = json.loads(self.app.post('/shortest_ocean_path',
+                                          data=json.dumps({'source': self.ny_coords, 'destination': self.la_coords}),
+                                          content_type='application/json').data)
+        self.assertAlmostEqual(data['distances'][0][1], single['total_distance'], places=2)
+        self.assertAlmostEqual(data['times'][0][1], single['total_distance'] / 30, places=2)
+        self.assertEqual(data['distances'][1][1], 0)
+        
+        body.update({'format': 'binary', 'max_distance': 6000})
+        response = self.app.post('/distance_matrix', data=json.dumps(body), content_type='application/json')
+        self.assertEqual(response.headers['X-Matrix-Shape'], '3,3')
+        matrix = np.frombuffer(response.data, dtype='<f4').reshape(3, 3)
+        self.assertTrue(np.isinf(matrix[0, 1]))  # NY -> LA is longer than the cap
+        self.assertAlmostEqual(float(matrix[0, 2]), data['distances'][0][2], places=0)
+        
+        for points in ([self.ny_coords, 'x'], [self.ny_coords, ['a', 1]], 'x', [[10, 95]]):
+            response = self.app.post('/distance_matrix', data=json.dumps({'points': points}),
+                                     content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('points', json.loads(response.data)['error'])
+
+    def test_repeated_route_is_cached(self):
+        """A repeated lane should come from the route cache with the same answer"""
+        test_data = json.dumps({'source': self.ny_coords, 'destination': self.la_coords, 'vessel': {'speed': 21}})
+        first = json.loads(self.app.post('/shortest_ocean_path', data=test_data, content_type='application/json').data)
+        second = json.loads(self.app.post('/shortest_ocean_path', data=test_data, content_type='application/json').data)
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['coordinates'], first['coordinates'])
+        self.assertAlmostEqual(second['total_distance'], first['total_distance'])
+        
+        info = json.loads(self.app.get('/graph_info').data)
+        self.assertGreaterEqual(info['route_cache']['hits'], 1)
+
+    def test_unreachable_route(self):
+        """Separate water bodies are rejected from their component labels"""
+        caspian, black_sea = [51.0, 41.5], [34.0, 43.5]
+        response = self.app.post('/shortest_ocean_path', content_type='application/json',
+                                 data=json.dumps({'source': caspian, 'destination': black_sea}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_lane_preference(self):
+        """Lane preference is validated, echoed and never makes the route shorter"""
+        post = lambda body: self.app.post('/shortest_ocean_path', data=json.dumps(body), content_type='application/json')
+        bad = post({'source': self.ny_coords, 'destination': self.la_coords, 'lane_preference': -1})
+        self.assertEqual(bad.status_code, 400)
+        for value in (float('inf'), float('nan'), True, 'high'):
+            bad = post({'source': self.ny_coords, 'destination': self.la_coords, 'lane_preference': value})
+            self.assertEqual(bad.status_code, 400)
+
+        plain = json.loads(post({'source': self.ny_coords, 'destination': self.la_coords}).data)
+        laned = json.loads(post({'source': self.ny_coords, 'destination': self.la_coords, 'lane_preference': 2}).data)
+        self.assertEqual(laned['lane_preference'], 2)
+        self.assertGreaterEqual(laned['total_distance'], plain['total_distance'] - 1e-6)
+        self.assertIn('lane_distances', json.loads(self.app.get('/graph_info').data))
+
+    def test_optimal_path_leaves_graph_untouched(self):
+        """Weather re-pricing should not copy or modify the shared graph"""
+        from weather_stub import WeatherStub
+        import app2
+        weights = np.array(self.graph.weights)
+        with WeatherStub() as stub:
+            base_url, app2.weather_client.base_url = app2.weather_client.base_url, stub.url
+            try:
+                response = self.app.post('/optimal_path', content_type='application/json',
+                                         data=json.dumps({'source': self.ny_coords, 'destination': [-9.1393, 38.7223]}))
+            finally:
+                app2.weather_client.base_url = base_url
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['weather'], 'live')
+        self.assertGreater(len(data['path']), 2)
+        self.assertIs(load_graph(), self.graph)
+        self.assertTrue(np.array_equal(np.array(self.graph.weights), weights))
+
+    def test_optimal_path_validates_departure(self):
+        for departure in ('tomorrow', None, [1]):
+            response = self.app.post('/optimal_path', content_type='application/json', data=json.dumps({
+                'source': self.ny_coords, 'destination': [-9.1393, 38.7223],
+                'vessel': {'speed': 30}, 'departure': departure}))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('departure', json.loads(response.data)['error'])
+
+    def test_optimal_path_validates_vessel(self):
+        for vessel in (5, 'fast', [30]):
+            response = self.app.post('/optimal_path', content_type='application/json', data=json.dumps({
+                'source': self.ny_coords, 'destination': [-9.1393, 38.7223], 'vessel': vessel}))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('vessel', json.loads(response.data)['error'])
+
+class TestLoadGraph(unittest.TestCase):
+    def test_optional_sidecars_do_not_fail_the_load(self):
+        """Unwritable landmark, overlay or corridor sidecars are logged and the graph still loads"""
+        import app2
+        app2.graph = None
+        try:
+            with mock.patch.object(app2, 'ensure_landmarks', side_effect=OSError('Read-only file system')), \
+                    mock.patch.object(app2, 'load_overlay', side_effect=OSError('Read-only file system')), \
+                    mock.patch.object(app2, 'attach_corridor', side_effect=OSError('Read-only file system')):
+                g = load_graph()
+            self.assertIsNotNone(g)
+            self.assertEqual(app2.graph_file, next(c for c in app2.GRAPH_CANDIDATES if app2.fresh_csr_path(c)))
+        finally:
+            app2.graph = None
+            load_graph()
+
 if __name__ == '__main__':
     unittest.main()
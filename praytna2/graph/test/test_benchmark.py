@@ -0,0 +1,60 @@
+import unittest
+import os
+import json
+import pickle
+import tempfile
+import app2
+from benchmark import load_routes, run_benchmark, summarize
+from fixtures import grid_graph
+
+class TestBenchmark(unittest.TestCase):
+    def test_corpus(self):
+        """The fixed corpus should cover every route group the benchmark is meant to track"""
+        routes = load_routes()
+        self.assertEqual({route['group'] for route in routes},
+                         {'transatlantic', 'transpacific', 'suez', 'panama', 'malacca'})
+        # Transpacific routes have to cross the antimeridian
+        for route in routes:
+            if route['group'] == 'transpacific':
+                self.assertGreater(abs(route['source'][0] - route['destination'][0]), 180)
+
+    def test_summarize(self):
+        stats = summarize(list(range(1, 101)))
+        self.assertEqual(stats['count'], 100)
+        self.assertAlmostEqual(stats['p50'], 50.5)
+        self.assertAlmostEqual(stats['p95'], 95.05)
+        self.assertIsNone(summarize([]))
+
+    def test_report(self):
+        """A run should give JSON-ready stats for every stage and leave app2's graph alone"""
+        saved = (app2.graph, app2.graph_file, app2.GRAPH_CANDIDATES)
+        routes = [
+            {'name': 'across', 'group': 'test', 'source': [0.1, 0.2], 'destination': [18.8, 10.9]},
+            {'name': 'short', 'group': 'test', 'source': [3, 3], 'destination': [5, 4]},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'grid.pkl')
+            with open(path, 'wb') as f:
+                pickle.dump((grid_graph(), {'parameters': {'spacing': 1.0}}), f)
+            report = run_benchmark([('grid', path), ('missing', None)], routes, repeat=2,
+                                   methods=('default', 'astar'))
+        self.assertEqual((app2.graph, app2.graph_file, app2.GRAPH_CANDIDATES), saved)
+
+        report = json.loads(json.dumps(report))
+        self.assertIn('error', report['graphs']['missing'])
+        result = report['graphs']['grid']
+        self.assertEqual(result['nodes'], 240)
+        self.assertEqual(result['spacing'], 1.0)
+        self.assertEqual(result['load_graph']['latency_ms']['count'], 2)
+        self.assertEqual(result['find_nearest_water_node']['latency_ms']['count'], 8)
+        self.assertIn('peak_alloc_mb', result['find_nearest_water_node']['memory'])
+        for method in ('default', 'astar'):
+            search = result['search'][method]
+            self.assertEqual(search['found'], 2)
+            self.assertEqual(search['latency_ms']['count'], 4)
+            self.assertGreater(search['routes']['across']['expanded'], search['routes']['short']['expanded'])
+        self.assertAlmostEqual(result['search']['default']['routes']['across']['cost'],
+                               result['search']['astar']['routes']['across']['cost'], places=6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import unittest
+import os
+import json
+import tempfile
+import numpy as np
+import networkx as nx
+from shapely.geometry import Point, box, mapping
+from build_1deg_graph import (water_mask, is_water_node, build_ocean_graph_chunk, grid_edges, haversine,
+                              build_chunks, merge_chunks, load_ocean_data, load_ports, prune_small_components,
+                              add_grid_edges, chunk_bounds, lon_cells, scaled_grid_points, scaled_grid_edges)
+
+class TestWaterMask(unittest.TestCase):
+    def setUp(self):
+        # A ring-shaped "ocean" with an island hole, plus a separate rectangular sea
+        self.polygons = [
+            Point(0, 0).buffer(30).difference(box(-5, -5, 5, 5)),
+            box(40, 0, 60, 20),
+        ]
+
+    def test_matches_point_loop(self):
+        """The vectorised mask should agree with is_water_node everywhere, including edges"""
+        lons, lats = np.meshgrid(np.arange(-40, 70, 2.5), np.arange(-40, 40, 2.5))
+        lons, lats = lons.ravel(), lats.ravel()
+        mask = water_mask(lons, lats, self.polygons)
+        expected = [is_water_node((lon, lat), self.polygons) for lon, lat in zip(lons, lats)]
+        self.assertEqual(mask.tolist(), expected)
+
+    def test_chunk_nodes(self):
+        """Chunk nodes should be the water cells, numbered latitude row by row"""
+        G = build_ocean_graph_chunk(self.polygons, [], [], 0, 20, 30, 70, spacing=5, node_id_offset=10)
+        coords = [G.nodes[f'node_{i}']['coordinates'] for i in range(10, 10 + G.number_of_nodes())]
+        expected = [(lon, lat) for lat in range(0, 20, 5) for lon in range(30, 70, 5)
+                    if is_water_node((lon, lat), self.polygons)]
+        self.assertEqual(coords, expected)
+        self.assertTrue(all(G.nodes[n]['type'] == 'ocean' for n in G.nodes))
+
+class TestGridEdges(unittest.TestCase):
+    def test_matches_pair_scan(self):
+        """Cell lookups should find exactly the pairs the old all-pairs box test found"""
+        rng = np.random.RandomState(4)
+        spacing = 0.3
+        # Two misaligned grids (like chunks starting off the lattice) plus scattered ports
+        grid_a = [(lon, lat) for lat in np.arange(0, 3, spacing) for lon in np.arange(0, 3, spacing)]
+        grid_b = [(lon, lat) for lat in np.arange(0.1, 3, spacing) for lon in np.arange(3.05, 6, spacing)]
+        ports = [tuple(p) for p in rng.uniform(0, 6, size=(40, 2))]
+        coords = grid_a + grid_b + ports
+
+        expected = {}
+        for a in range(len(coords)):
+            for b in range(a + 1, len(coords)):
+                if abs(coords[a][0] - coords[b][0]) <= spacing * 1.1 and abs(coords[a][1] - coords[b][1]) <= spacing * 1.1:
+                    expected[(a, b)] = haversine(coords[a], coords[b])
+
+        i, j, dist = grid_edges(coords, spacing)
+        found = dict(zip(zip(i.tolist(), j.tolist()), dist.tolist()))
+        self.assertEqual(len(found), len(i))
+        self.assertEqual(set(found), set(expected))
+        for pair, d in expected.items():
+            self.assertAlmostEqual(found[pair], d, places=6)
+
+    def test_regular_grid_has_eight_neighbours(self):
+        """An interior cell of a regular grid should link to exactly its 8 neighbours"""
+        coords = [(float(lon), float(lat)) for lat in range(5) for lon in range(5)]
+        i, j, _ = grid_edges(coords, 1.0)
+        degree = np.bincount(np.concatenate([i, j]), minlength=len(coords))
+        self.assertEqual(degree[12], 8)
+        self.assertEqual(degree[0], 3)
+
+    def test_wraps_across_antimeridian(self):
+        """Longitude is cyclic: the -180 and 179 columns of a global grid are neighbours"""
+        coords = [(float(lon), float(lat)) for lat in range(3) for lon in range(-180, 180)]
+        i, j, dist = grid_edges(coords, 1.0)
+        degree = np.bincount(np.concatenate([i, j]), minlength=len(coords))
+        # Every middle-row cell, seam included, has all 8 neighbours
+        self.assertTrue((degree[360:720] == 8).all())
+        found = dict(zip(zip(i.tolist(), j.tolist()), dist.tolist()))
+        seam = (360, 719)  # (-180, 1) and (179, 1)
+        self.assertAlmostEqual(found[seam], haversine(coords[360], coords[719]), places=6)
+        self.assertLess(found[seam], 112)
+
+        # Without wrap the seam is open
+        i, j, _ = grid_edges(coords, 1.0, wrap=False)
+        self.assertNotIn(seam, set(zip(i.tolist(), j.tolist())))
+
+    def test_flags_date_line_edges(self):
+        G = nx.Graph()
+        for k, lon in enumerate((178.0, 179.0, -180.0, -179.0)):
+            G.add_node(f'node_{k}', coordinates=(lon, 0.0), type='ocean')
+        self.assertEqual(add_grid_edges(G, 1.0), 3)
+        self.assertTrue(G.edges['node_1', 'node_2']['date_line_crossing'])
+        self.assertNotIn('date_line_crossing', G.edges['node_0', 'node_1'])
+
+class TestScaledGrid(unittest.TestCase):
+    def test_points(self):
+        """Rows thin out with cos(lat), and chunks of the grid line up with the whole"""
+        self.assertEqual(lon_cells([0, 60, 90], 1.0).tolist(), [360, 180, 1])
+        lons, lats = scaled_grid_points(-80, 86, -180, 180, 5.0)
+        self.assertEqual(np.sum(lats == 60), 36)
+        self.assertEqual(np.sum(lats == 0), 72)
+        self.assertLess(len(lons), 0.7 * 34 * 72)
+
+        pieces = [scaled_grid_points(*chunk, 5.0) for chunk in chunk_bounds(-80, 85, -180, 180, chunk_size=20)]
+        merged = sorted(zip(np.concatenate([lat for _, lat in pieces]), np.concatenate([lon for lon, _ in pieces])))
+        self.assertEqual(merged, sorted(zip(lats, lons)))
+
+    def test_edges_match_pair_scan(self):
+        """Binary search should find the pairs an all-pairs scan with the local longitude step finds"""
+        rng = np.random.RandomState(2)
+        lons, lats = scaled_grid_points(40, 90, -180, 180, 5.0)
+        ports = rng.uniform([-180, 40], [180, 89], size=(30, 2))
+        coords = np.concatenate([np.stack([lons, lats], axis=1), ports])
+        steps = 360.0 / lon_cells(coords[:, 1], 5.0)
+
+        expected = set()
+        for a in range(len(coords)):
+            for b in range(a + 1, len(coords)):
+                dlon = abs(coords[a, 0] - coords[b, 0])
+                if (abs(coords[a, 1] - coords[b, 1]) <= 5.5
+                        and min(dlon, 360 - dlon) <= 1.1 * max(steps[a], steps[b])):
+                    expected.add((a, b))
+
+        i, j, dist = scaled_grid_edges(coords, 5.0)
+        self.assertEqual(len(i), len(expected))
+        self.assertEqual(set(zip(i.tolist(), j.tolist())), expected)
+        for a, b, d in zip(i.tolist(), j.tolist(), dist.tolist()):
+            self.assertAlmostEqual(d, haversine(coords[a], coords[b]), places=6)
+
+    def test_global_grid(self):
+        """A full-globe grid is one component with roughly even edge lengths away from the poles"""
+        lons, lats = scaled_grid_points(-80, 81, -180, 180, 5.0)
+        G = nx.Graph()
+        for k, (lon, lat) in enumerate(zip(lons, lats)):
+            G.add_node(f'node_{k}', coordinates=(lon, lat), type='ocean')
+        add_grid_edges(G, 5.0, lon_scaled=True)
+        self.assertTrue(nx.is_connected(G))
+        self.assertTrue(any(d.get('date_line_crossing') for _, _, d in G.edges(data=True)))
+        degrees = [G.degree(n) for n in G if abs(G.nodes[n]['coordinates'][1]) <= 60]
+        self.assertGreaterEqual(min(degrees), 6)
+        weights = [d['weight'] for u, v, d in G.edges(data=True)
+                   if max(abs(G.nodes[u]['coordinates'][1]), abs(G.nodes[v]['coordinates'][1])) <= 60]
+        self.assertLess(max(weights), 1.6 * 5 * 111.2)
+
+class TestPruneComponents(unittest.TestCase):
+    def test_drops_small_water_components(self):
+        """Small water components go; the main one and any holding a port stay"""
+        G = nx.grid_2d_graph(5, 5)
+        G.add_edges_from([('lake_a', 'lake_b'), ('bay', 'port_Test')])
+        G.add_node('pond')
+        for n in G:
+            G.nodes[n]['type'] = 'port' if str(n).startswith('port_') else 'ocean'
+        self.assertEqual(prune_small_components(G, 3), 3)
+        self.assertEqual(G.number_of_nodes(), 27)
+        self.assertIn('port_Test', G)
+        self.assertNotIn('lake_a', G)
+
+class TestChunkBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = []
+        ocean = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {}, 'geometry': mapping(Point(0, 0).buffer(25).difference(box(-5, -5, 5, 5)))},
+        ]}
+        ports = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {'PORT_NAME': 'Test Port'}, 'geometry': {'type': 'Point', 'coordinates': [5.5, 0.2]}},
+        ]}
+        lanes = {'type': 'FeatureCollection', 'features': []}
+        for name, data in (('ocean', ocean), ('lanes', lanes), ('ports', ports)):
+            path = os.path.join(self.tmp.name, f'{name}.geojson')
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            self.files.append(path)
+        self.chunks = [(lat, lat + 10, lon, lon + 10) for lat in range(-30, 30, 10) for lon in range(-30, 30, 10)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameGraph(self, a, b):
+        self.assertEqual(list(a.nodes(data=True)), list(b.nodes(data=True)))
+        self.assertEqual(sorted(map(sorted, a.edges())), sorted(map(sorted, b.edges())))
+
+    def test_workers_give_same_ids(self):
+        """Node ids should not depend on the number of worker processes"""
+        serial = merge_chunks(build_chunks(self.chunks, 2.0, *self.files))
+        parallel = merge_chunks(build_chunks(self.chunks, 2.0, *self.files, workers=2))
+        self.assertSameGraph(serial, parallel)
+
+        # Same numbering as the old sequential loop with running offsets
+        expected = nx.Graph()
+        offset = 0
+        polygons, ports = load_ocean_data(self.files[0]), load_ports(self.files[2])
+        for lat_min, lat_max, lon_min, lon_max in self.chunks:
+            chunk = build_ocean_graph_chunk(polygons, [], ports, lat_min, lat_max, lon_min, lon_max, 2.0, node_id_offset=offset)
+            offset += chunk.number_of_nodes()
+            expected.add_nodes_from(chunk.nodes(data=True))
+            expected.add_edges_from(chunk.edges(data=True))
+        self.assertEqual(list(serial.nodes), list(expected.nodes))
+
+    def test_resume(self):
+        """Checkpointed chunks should be reused and missing ones rebuilt"""
+        checkpoint_dir = os.path.join(self.tmp.name, 'chunks')
+        first = merge_chunks(build_chunks(self.chunks, 2.0, *self.files, checkpoint_dir=checkpoint_dir))
+        self.assertEqual(len([f for f in os.listdir(checkpoint_dir) if f.endswith('.pkl')]), len(self.chunks))
+
+        os.remove(os.path.join(checkpoint_dir, 'chunk_0003.pkl'))
+        resumed = merge_chunks(build_chunks(self.chunks, 2.0, *self.files, workers=2, checkpoint_dir=checkpoint_dir))
+        self.assertTrue(os.path.exists(os.path.join(checkpoint_dir, 'chunk_0003.pkl')))
+        self.assertSameGraph(first, resumed)
+
+        # A different spacing must not reuse the old chunks
+        coarse = merge_chunks(build_chunks(self.chunks, 5.0, *self.files, checkpoint_dir=checkpoint_dir))
+        self.assertLess(coarse.number_of_nodes(), first.number_of_nodes())
+
+    def test_edited_inputs_discard_checkpoints(self):
+        """Checkpoints built from an older ports file should not be reused"""
+        checkpoint_dir = os.path.join(self.tmp.name, 'chunks')
+        first = merge_chunks(build_chunks(self.chunks, 2.0, *self.files, checkpoint_dir=checkpoint_dir))
+        ports = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {'PORT_NAME': 'Other Port'}, 'geometry': {'type': 'Point', 'coordinates': [-5.5, 0.2]}},
+        ]}
+        with open(self.files[2], 'w') as f:
+            json.dump(ports, f)
+        rebuilt = merge_chunks(build_chunks(self.chunks, 2.0, *self.files, checkpoint_dir=checkpoint_dir))
+        self.assertIn('port_Test_Port', first)
+        self.assertIn('port_Other_Port', rebuilt)
+        self.assertNotIn('port_Test_Port', rebuilt)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+import networkx as nx
+from scipy.spatial import SphericalVoronoi
+from shapely.geometry import box
+from build_1deg_graph import haversine
+from build_hex_graph import geodesic_mesh, build_hex_ocean_graph, frequency_for_spacing, xyz_to_lonlat
+from graph_utils import CSRGraph
+from spatial_index import chord_to_km
+
+class TestGeodesicMesh(unittest.TestCase):
+    def test_topology(self):
+        """Shared face edges and corners are merged: 6 neighbours everywhere but the 12 corners"""
+        for frequency in (1, 2, 7):
+            vertices, edges = geodesic_mesh(frequency)
+            self.assertEqual(len(vertices), 10 * frequency ** 2 + 2)
+            self.assertEqual(len(edges), 30 * frequency ** 2)
+            degree = np.bincount(edges.ravel())
+            self.assertEqual(np.sum(degree == 5), 12)
+            self.assertEqual(np.sum(degree == 6), len(vertices) - 12)
+
+    def test_uniform_cells(self):
+        """Cell areas and edge lengths should be close to uniform"""
+        vertices, edges = geodesic_mesh(frequency_for_spacing(5.0))
+        areas = SphericalVoronoi(vertices).calculate_areas()
+        self.assertLess(areas.max() / areas.min(), 1.2)
+        lengths = chord_to_km(np.linalg.norm(vertices[edges[:, 0]] - vertices[edges[:, 1]], axis=1))
+        self.assertAlmostEqual(lengths.mean() / (5.0 * 111.195), 1.0, delta=0.05)
+        self.assertLess(lengths.max() / lengths.min(), 1.4)
+
+class TestHexOceanGraph(unittest.TestCase):
+    def test_clipped_to_water(self):
+        """Only water nodes are kept, mesh edges across the date line are flagged, and ports join the mesh"""
+        polygons = [box(150, -30, 180, 30), box(-180, -30, -150, 30)]
+        ports = [{'name': 'Test Port', 'coordinates': (170.2, 0.3), 'properties': {}}]
+        G = build_hex_ocean_graph(polygons, ports, 3.0, polar_limits=(-20, 20))
+
+        lons, lats = xyz_to_lonlat(geodesic_mesh(frequency_for_spacing(3.0))[0])
+        inside = (np.abs(lats) <= 20) & (np.abs(lons) >= 150)
+        self.assertEqual(G.number_of_nodes(), int(inside.sum()) + 1)
+        self.assertTrue(nx.is_connected(G))
+        self.assertGreater(G.degree('port_Test_Port'), 0)
+
+        crossings = [(u, v) for u, v, d in G.edges(data=True) if d.get('date_line_crossing')]
+        self.assertTrue(crossings)
+        for u, v in crossings:
+            a, b = G.nodes[u]['coordinates'], G.nodes[v]['coordinates']
+            self.assertGreater(abs(a[0] - b[0]), 180)
+            self.assertAlmostEqual(G.edges[u, v]['weight'], haversine(a, b), places=3)
+
+        degrees = [G.degree(n) for n in G if n.startswith('node_') and abs(G.nodes[n]['coordinates'][1]) < 10
+                   and 160 < abs(G.nodes[n]['coordinates'][0]) < 175]
+        self.assertTrue(degrees)
+        self.assertTrue(all(d >= 6 for d in degrees))
+
+        # Same compact format the server loads
+        csr = CSRGraph.from_networkx(G)
+        self.assertEqual(csr.number_of_nodes(), G.number_of_nodes())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import numpy as np
+import networkx as nx
+from shapely.geometry import LineString, Point, box
+from build_1deg_graph import haversine
+from build_quadtree_graph import quadtree_cells, quadtree_depth, quadtree_edges, build_quadtree_ocean_graph
+from graph_utils import CSRGraph
+
+class TestQuadtree(unittest.TestCase):
+    def setUp(self):
+        # Ocean over every longitude with a round island and a continent
+        self.polygons = [box(-180, -40, 180, 40).difference(Point(20, 0).buffer(6)).difference(box(-100, -30, -60, 30))]
+
+    def test_cells(self):
+        """Coastal leaves are fine, open water stays coarse, and the leaves tile the water without overlap"""
+        levels, ix, iy = quadtree_cells(self.polygons, 6.0, 0.375, (-40, 40))
+        size = 6.0 / 2.0 ** levels
+        centres = np.stack([-180 + (ix + 0.5) * size, -90 + (iy + 0.5) * size], axis=1)
+        self.assertEqual(levels.max(), 4)
+        coastal = [Point(c).distance(Point(20, 0)) < 6.5 for c in centres]
+        self.assertTrue(all(level == 4 for level, near in zip(levels, coastal) if near))
+        self.assertGreater(np.sum(levels == 0), 0)
+        # 0.375 x 0.375 finest units, no unit covered twice
+        units = set()
+        for level, x, y in zip(levels.tolist(), ix.tolist(), iy.tolist()):
+            scale = 2 ** (4 - level)
+            cell = {(x * scale + a, y * scale + b) for a in range(scale) for b in range(scale)}
+            self.assertFalse(units & cell)
+            units |= cell
+        self.assertLess(len(levels), len(units) / 5)
+
+    def test_edges_match_touching_cells(self):
+        """Leaves are linked exactly when their squares share an edge or a corner, across the date line too"""
+        levels, ix, iy = quadtree_cells(self.polygons, 6.0, 0.75, (-40, 40))
+        scale = 2 ** (3 - levels)
+        x0, y0 = ix * scale, iy * scale
+        x1, y1 = x0 + scale, y0 + scale
+        columns = 60 * 8
+
+        expected = set()
+        for a in range(len(levels)):
+            for b in range(a + 1, len(levels)):
+                if y0[a] > y1[b] or y0[b] > y1[a]:
+                    continue
+                for shift in (-columns, 0, columns):
+                    if x0[a] <= x1[b] + shift and x0[b] + shift <= x1[a]:
+                        expected.add((a, b))
+        i, j = quadtree_edges(levels, ix, iy, 6.0, 0.75)
+        self.assertEqual(len(i), len(expected))
+        self.assertEqual(set(zip(i.tolist(), j.tolist())), expected)
+
+    def test_refine_lines(self):
+        """Cells along a passage are refined even in open water"""
+        line = LineString([(150, 10), (160, 12)])
+        levels, ix, iy = quadtree_cells(self.polygons, 6.0, 0.375, (-40, 40), refine_lines=[line])
+        size = 6.0 / 2.0 ** levels
+        cells = [box(-180 + x * s, -90 + y * s, -180 + (x + 1) * s, -90 + (y + 1) * s)
+                 for x, y, s in zip(ix.tolist(), iy.tolist(), size.tolist())]
+        on_line = [level for level, cell in zip(levels, cells) if cell.intersects(line)]
+        self.assertTrue(on_line)
+        self.assertTrue(all(level == 4 for level in on_line))
+
+    def test_graph(self):
+        ports = [{'name': 'Test Port', 'coordinates': (26.5, 0.1), 'properties': {}}]
+        G = build_quadtree_ocean_graph(self.polygons, ports, 6.0, 0.375, (-40, 40))
+        self.assertTrue(nx.is_connected(G))
+        self.assertGreater(G.degree('port_Test_Port'), 0)
+        crossings = [(u, v) for u, v, d in G.edges(data=True) if d.get('date_line_crossing')]
+        self.assertTrue(crossings)
+        for u, v in crossings:
+            a, b = G.nodes[u]['coordinates'], G.nodes[v]['coordinates']
+            self.assertAlmostEqual(G.edges[u, v]['weight'], haversine(a, b), places=3)
+        self.assertEqual(CSRGraph.from_networkx(G).number_of_nodes(), G.number_of_nodes())
+
+    def test_cell_sizes_must_tile_the_globe(self):
+        """max_cell must divide 180 and min_cell must be max_cell / 2^k"""
+        self.assertEqual(quadtree_depth(4.0, 0.25), 4)
+        self.assertEqual(quadtree_depth(4.0, 4.0), 0)
+        for max_cell, min_cell in ((7.0, 7.0), (4.0, 0.3), (4.0, 8.0), (0, 1.0), (4.0, 0)):
+            with self.assertRaises(ValueError):
+                quadtree_depth(max_cell, min_cell)
+        with self.assertRaises(ValueError):
+            quadtree_cells(self.polygons, 7.0, 0.875)
+
+if __name__ == '__main__':
+    unittest.main()
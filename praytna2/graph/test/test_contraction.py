@@ -0,0 +1,76 @@
+import unittest
+import os
+import random
+import tempfile
+from unittest import mock
+import contraction
+from graph_utils import CSRGraph, save_csr_graph, load_csr_graph
+from pathfinder import RoutingEngine, get_routing_engine, find_path
+from contraction import build_contraction_hierarchy, build_overlay, load_overlay, ContractionHierarchy, CH_ARRAY_NAMES
+from fixtures import grid_graph
+
+class TestContractionHierarchy(unittest.TestCase):
+    def setUp(self):
+        # A wall with a single gap forces long detours around "land"
+        wall = {(r, 15) for r in range(1, 15)}
+        self.G = grid_graph(rows=15, cols=30, land=wall)
+        self.g = CSRGraph.from_networkx(self.G)
+
+    def test_matches_dijkstra(self):
+        """CH distances should equal plain Dijkstra and unpack to real edge paths"""
+        self.check_against_dijkstra(RoutingEngine(self.g, water_only=True))
+
+    def test_core(self):
+        """Stopping contraction early should leave a core that queries still search correctly"""
+        with mock.patch.object(contraction, 'CORE_DEGREE_LIMIT', 4):
+            self.check_against_dijkstra(RoutingEngine(self.g))
+
+    def test_goal_directed(self):
+        """Great-circle bounds should only prune the core search, never change the answer"""
+        with mock.patch.object(contraction, 'CORE_DEGREE_LIMIT', 4):
+            self.check_against_dijkstra(RoutingEngine(self.g, water_only=True), heuristic=True)
+
+    def check_against_dijkstra(self, engine, heuristic=False):
+        arrays = build_contraction_hierarchy(engine)
+        ch = ContractionHierarchy(**{name: arrays[name] for name in CH_ARRAY_NAMES})
+
+        rng = random.Random(11)
+        n = self.g.number_of_nodes()
+        for _ in range(200):
+            s, t = rng.randrange(n), rng.randrange(n)
+            expected = engine.astar(s, t, heuristic_scale=0)
+            if heuristic:
+                result = ch.query(s, t, engine.heuristic_table(t), engine.heuristic_table(s))
+            else:
+                result = ch.query(s, t)
+            if expected is None:
+                self.assertIsNone(result)
+                continue
+            self.assertAlmostEqual(result.cost, expected.cost, places=6)
+            self.assertEqual((result.path[0], result.path[-1]), (s, t))
+
+            # The unpacked path must only use original edges and add up to the cost
+            total = 0.0
+            for u, v in zip(result.path[:-1], result.path[1:]):
+                edges = [e for e in range(engine._offsets[u], engine._offsets[u + 1]) if engine._targets[e] == v]
+                self.assertTrue(edges, f"{u}-{v} is not an original edge")
+                total += min(engine._costs[e] for e in edges)
+            self.assertAlmostEqual(total, result.cost, places=6)
+
+    def test_overlay_round_trip(self):
+        """A saved overlay should attach to find_path, and be ignored for a different graph"""
+        with tempfile.TemporaryDirectory() as tmp:
+            graph_path = os.path.join(tmp, 'grid.csr')
+            save_csr_graph(self.g, graph_path)
+            build_overlay(graph_path)
+
+            g = load_csr_graph(graph_path)
+            self.assertIsNotNone(load_overlay(g, graph_path))
+            self.assertIsNotNone(get_routing_engine(g).hierarchy)
+            self.assertEqual(find_path(g, 'node_0', 'node_449'), find_path(self.g, 'node_0', 'node_449'))
+
+            other = CSRGraph.from_networkx(grid_graph(rows=15, cols=31))
+            self.assertIsNone(load_overlay(other, graph_path))
+
+if __name__ == '__main__':
+    unittest.main()
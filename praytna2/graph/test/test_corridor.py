@@ -0,0 +1,82 @@
+import unittest
+import random
+import networkx as nx
+from app2 import haversine
+from graph_utils import CSRGraph
+from pathfinder import RoutingEngine
+from corridor import CorridorRouter, coarsen_graph, _densify
+from fixtures import grid_graph
+
+class TestCorridorRouting(unittest.TestCase):
+    def setUp(self):
+        # Land wall with a gap at the bottom; water_only routing has to go round it
+        wall = {(r, 12) for r in range(1, 20)}
+        self.G = grid_graph(rows=20, cols=30, land=wall)
+        self.g = CSRGraph.from_networkx(self.G)
+        self.engine = RoutingEngine(self.g, water_only=True)
+
+    def test_coarsen_splits_cells_cut_by_land(self):
+        """Cells the wall cuts in two should become two unconnected coarse nodes"""
+        coarse = coarsen_graph(CSRGraph.from_networkx(self.G.subgraph(
+            n for n, d in self.G.nodes(data=True) if d['type'] == 'ocean').copy()))
+        C = coarse.to_networkx()
+        # The wall at lon 12 runs through the lon 10-15 cells, splitting all but the bottom row
+        self.assertTrue(nx.is_connected(C))
+        coords = {n: C.nodes[n]['coordinates'] for n in C}
+        for lat_min in (5, 10, 15):
+            pieces = [c for c in coords.values() if 10 <= c[0] < 15 and lat_min <= c[1] < lat_min + 5]
+            self.assertEqual(sorted(c[0] < 12 for c in pieces), [False, True])
+        # Only the bottom row, where the gap is, joins the two sides of the wall
+        for u, v in C.edges():
+            (lon_u, lat_u), (lon_v, lat_v) = coords[u], coords[v]
+            if (lon_u < 12) != (lon_v < 12):
+                self.assertLess(min(lat_u, lat_v), 5, f"coarse edge {coords[u]} - {coords[v]} crosses the wall")
+
+    def test_routes_close_to_full_search(self):
+        """Corridor routes should be valid and stay close to the full-resolution optimum"""
+        router = CorridorRouter(self.engine, coarsen_graph(self.g), corridor_km=300, endpoint_km=200)
+        rng = random.Random(2)
+        water = [i for i in range(self.g.number_of_nodes()) if self.g.node_type(i) == 'ocean']
+        for _ in range(40):
+            s, t = rng.sample(water, 2)
+            full = self.engine.astar(s, t)
+            result = router.query(s, t)
+            self.assertEqual((result.path[0], result.path[-1]), (s, t))
+            self.assertGreaterEqual(result.cost, full.cost - 1e-6)
+            self.assertLess(result.cost, full.cost * 1.05)
+            total = sum(haversine(self.g.coords[u], self.g.coords[v]) for u, v in zip(result.path[:-1], result.path[1:]))
+            self.assertAlmostEqual(total, result.cost, places=4)
+
+    def test_falls_back_when_corridor_blocked(self):
+        """A coarse graph that cuts straight through the wall must not lose the route"""
+        C = nx.Graph()
+        C.add_node('node_0', coordinates=(2.0, 10.0), type='ocean')
+        C.add_node('node_1', coordinates=(25.0, 10.0), type='ocean')
+        C.add_edge('node_0', 'node_1', weight=2500.0)
+        router = CorridorRouter(self.engine, CSRGraph.from_networkx(C), corridor_km=200, endpoint_km=100)
+        s, t = self.g.index_of('node_302'), self.g.index_of('node_325')
+        result = router.query(s, t)
+        self.assertEqual(result.method, 'astar')
+        self.assertAlmostEqual(result.cost, self.engine.astar(s, t).cost, places=6)
+
+    def test_route_across_the_date_line(self):
+        """A coarse route that wraps should give a corridor along the date line, not round the globe"""
+        dense = _densify([(178.0, 10.0), (-178.0, 10.0)], 100)
+        self.assertGreater(len(dense), 2)
+        self.assertTrue(all(abs(lon) >= 178.0 for lon, _ in dense))
+
+        # 30 columns from lon 165 east, wrapping to -166 past the date line
+        G = grid_graph(rows=10, cols=30)
+        for n in G:
+            lon, lat = G.nodes[n]['coordinates']
+            G.nodes[n]['coordinates'] = ((lon + 345.0) % 360.0 - 180.0, lat)
+        g = CSRGraph.from_networkx(G)
+        engine = RoutingEngine(g)
+        router = CorridorRouter(engine, coarsen_graph(g), corridor_km=300, endpoint_km=100)
+        s, t = g.index_of('node_121'), g.index_of('node_148')
+        result = router.query(s, t)
+        self.assertEqual(result.method, 'corridor')
+        self.assertAlmostEqual(result.cost, engine.astar(s, t).cost, places=6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import os
+import json
+import tempfile
+from shapely.geometry import Point, LineString, box, mapping
+from geojson_stream import iter_geometries, load_geometries, geometry_cache_path
+
+class TestGeojsonStream(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.geometries = [
+            Point(0, 0).buffer(10).difference(box(-2, -2, 2, 2)),
+            LineString([(-170.5, 10.25), (-160, 12e-3), (179.999, -5)]),
+            box(40, 0, 60, 20),
+        ]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data, name='data.geojson', **dump_args):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            json.dump(data, f, **dump_args)
+        return path
+
+    def collection(self):
+        features = [{'type': 'Feature', 'properties': {'name': 'features [', 'i': i}, 'geometry': mapping(g)}
+                    for i, g in enumerate(self.geometries)]
+        features.insert(1, {'type': 'Feature', 'properties': {}, 'geometry': None})
+        return {'type': 'FeatureCollection', 'name': 'test', 'crs': {'type': 'name'}, 'features': features}
+
+    def test_matches_json_load(self):
+        """Streamed geometries should equal json.load's, whatever the read size and layout"""
+        data = json.loads(json.dumps(self.collection()))
+        expected = [f['geometry'] for f in data['features'] if f['geometry']]
+        for dump_args in ({}, {'indent': 2}):
+            path = self.write(data, **dump_args)
+            for read_size in (1, 7, 64, 1 << 20):
+                self.assertEqual(list(iter_geometries(path, read_size=read_size)), expected)
+
+    def test_other_documents(self):
+        """GeometryCollections stream too; a bare geometry or feature is yielded whole"""
+        shapes = json.loads(json.dumps([mapping(g) for g in self.geometries]))
+        path = self.write({'geometries': shapes, 'type': 'GeometryCollection'})
+        self.assertEqual(list(iter_geometries(path, read_size=16)), shapes)
+        path = self.write(shapes[2])
+        self.assertEqual(list(iter_geometries(path, read_size=16)), [shapes[2]])
+        path = self.write({'type': 'Feature', 'properties': {}, 'geometry': shapes[1]})
+        self.assertEqual(list(iter_geometries(path, read_size=16)), [shapes[1]])
+
+    def test_truncated_file(self):
+        path = os.path.join(self.tmp.name, 'truncated.geojson')
+        with open(path, 'w') as f:
+            f.write(json.dumps(self.collection())[:-40])
+        with self.assertRaises(ValueError):
+            list(iter_geometries(path, read_size=32))
+
+    def test_wkb_cache(self):
+        """The WKB sidecar should round-trip the geometries and be ignored once the source changes"""
+        path = self.write(self.collection())
+        parsed = load_geometries(path)
+        self.assertTrue(os.path.exists(geometry_cache_path(path)))
+        cached = load_geometries(path)
+        self.assertEqual(len(cached), len(self.geometries))
+        for a, b, expected in zip(parsed, cached, self.geometries):
+            self.assertTrue(a.equals_exact(expected, 0))
+            self.assertTrue(b.equals_exact(expected, 0))
+
+        # A rewritten source is parsed again rather than served from the stale sidecar
+        self.geometries = self.geometries[:1]
+        path = self.write(self.collection())
+        self.assertEqual(len(load_geometries(path)), 1)
+        self.assertEqual(len(load_geometries(path, cache=False)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
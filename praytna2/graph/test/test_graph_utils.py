@@ -0,0 +1,62 @@
+import unittest
+import os
+import tempfile
+import networkx as nx
+import numpy as np
+from graph_utils import CSRGraph, EDGE_PASSAGE, save_csr_graph, load_csr_graph
+
+class TestCSRGraph(unittest.TestCase):
+    def setUp(self):
+        self.G = nx.Graph()
+        self.G.add_node('node_0', coordinates=(0.0, 0.0), type='ocean')
+        self.G.add_node('node_1', coordinates=(1.0, 0.0), type='ocean', coastal=True)
+        self.G.add_node('node_2', coordinates=(1.0, 1.0))
+        self.G.add_node('port_Test_Harbour', coordinates=(0.5, 1.5), type='port')
+        self.G.add_edge('node_0', 'node_1', weight=111.2)
+        self.G.add_edge('node_1', 'node_2', weight=111.2, lane_distance=12.5)
+        self.G.add_edge('node_2', 'port_Test_Harbour', weight=78.6)
+        self.G.add_edge('node_0', 'port_Test_Harbour', weight=175.8, is_passage=True, passage_name='Test Strait')
+
+    def test_round_trip(self):
+        """Saving and memory-mapping a graph should preserve nodes, edges and names"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.csr')
+            save_csr_graph(CSRGraph.from_networkx(self.G, {'spacing': 1.0}), path)
+            g = load_csr_graph(path)
+
+            self.assertIsInstance(g.coords, np.memmap)
+            self.assertEqual(g.number_of_nodes(), 4)
+            self.assertEqual(g.number_of_edges(), 4)
+            self.assertEqual(list(g.nodes), list(self.G.nodes))
+            self.assertEqual(g.nodes['port_Test_Harbour'], {'coordinates': (0.5, 1.5), 'type': 'port'})
+            self.assertNotIn('type', g.nodes['node_2'])
+            self.assertEqual(g.stats, {'spacing': 1.0})
+            self.assertEqual(g.nodes['node_1'], {'coordinates': (1.0, 0.0), 'type': 'ocean', 'coastal': True})
+            self.assertEqual(g.coastal.tolist(), [False, True, False, False])
+
+            for u, v, data in self.G.edges(data=True):
+                self.assertEqual(g.get_edge_data(u, v), data)
+                self.assertEqual(g.get_edge_data(v, u), data)
+            self.assertFalse(g.has_edge('node_0', 'node_2'))
+            self.assertEqual(g.count_flagged_edges(EDGE_PASSAGE), 1)
+
+    def test_without_lane_distances(self):
+        """Graphs exported before lane distances and coastal flags existed should load without them"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.csr')
+            save_csr_graph(CSRGraph.from_networkx(self.G), path)
+            os.remove(os.path.join(path, 'lane_distances.npy'))
+            os.remove(os.path.join(path, 'coastal.npy'))
+            g = load_csr_graph(path)
+            self.assertTrue(np.isnan(g.lane_distances).all())
+            self.assertFalse(g.coastal.any())
+            self.assertEqual(g.get_edge_data('node_1', 'node_2'), {'weight': 111.2})
+
+    def test_to_networkx(self):
+        """The networkx copy should match the source graph"""
+        g = CSRGraph.from_networkx(self.G).to_networkx()
+        self.assertEqual(dict(g.nodes(data=True)), dict(self.G.nodes(data=True)))
+        self.assertEqual(sorted(map(sorted, g.edges())), sorted(map(sorted, self.G.edges())))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import os
+import random
+import tempfile
+from graph_utils import CSRGraph, save_csr_graph, load_csr_graph
+from pathfinder import RoutingEngine, get_routing_engine, find_path_result
+from landmarks import attach_landmarks, build_landmarks, ensure_landmarks, load_landmarks, select_landmarks
+from fixtures import grid_graph
+
+class TestLandmarks(unittest.TestCase):
+    def setUp(self):
+        # A wall with a gap at the bottom: the great-circle bound is badly wrong across it
+        wall = {(r, 15) for r in range(1, 15)}
+        self.g = CSRGraph.from_networkx(grid_graph(rows=15, cols=30, land=wall))
+
+    def test_alt_matches_dijkstra(self):
+        """ALT should stay optimal and never expand more than great-circle A*"""
+        engine = RoutingEngine(self.g, water_only=True)
+        attach_landmarks(engine, count=6)
+        rng = random.Random(3)
+        n = self.g.number_of_nodes()
+        for _ in range(100):
+            s, t = rng.randrange(n), rng.randrange(n)
+            expected = engine.astar(s, t, heuristic_scale=0)
+            result = engine.shortest_path(s, t, method='alt')
+            if expected is None:
+                self.assertIsNone(result)
+                continue
+            self.assertEqual(result.method, 'alt')
+            self.assertAlmostEqual(result.cost, expected.cost, places=6)
+
+        # Across the wall, landmarks beat the great-circle heuristic by a wide margin
+        s, t = self.g.index_of('node_434'), self.g.index_of('node_449')
+        astar = engine.shortest_path(s, t, method='astar')
+        alt = engine.shortest_path(s, t, method='alt')
+        self.assertAlmostEqual(alt.cost, astar.cost, places=6)
+        self.assertLess(alt.expanded, astar.expanded)
+
+    def test_farthest_point_selection(self):
+        """Landmarks should be distinct reachable nodes with a distance row each"""
+        engine = RoutingEngine(self.g, water_only=True)
+        landmarks, distances = select_landmarks(engine, count=5)
+        self.assertEqual(len(set(landmarks.tolist())), 5)
+        self.assertEqual(distances.shape, (5, self.g.number_of_nodes()))
+        for i, landmark in enumerate(landmarks):
+            self.assertEqual(distances[i, landmark], 0.0)
+
+    def test_round_trip(self):
+        """Saved tables should attach to the default engine and drive find_path's ALT mode"""
+        with tempfile.TemporaryDirectory() as tmp:
+            graph_path = os.path.join(tmp, 'grid.csr')
+            save_csr_graph(self.g, graph_path)
+            build_landmarks(graph_path, count=4)
+
+            g = load_csr_graph(graph_path)
+            self.assertIsNotNone(load_landmarks(g, graph_path))
+            self.assertIsNotNone(get_routing_engine(g).landmarks)
+            result = find_path_result(g, 'node_434', 'node_449', method='alt')
+            self.assertEqual(result.method, 'alt')
+            self.assertEqual(result.path[0], 'node_434')
+
+            # Without tables, an ALT request falls back to great-circle A*
+            fallback = find_path_result(self.g, 'node_434', 'node_449', method='alt')
+            self.assertEqual(fallback.method, 'astar')
+
+    def test_unwritable_sidecar(self):
+        """Landmarks that cannot be saved are still attached for this process"""
+        with tempfile.TemporaryDirectory() as tmp:
+            blocker = os.path.join(tmp, 'blocker')
+            with open(blocker, 'w') as f:
+                f.write('not a directory')
+            table = ensure_landmarks(self.g, os.path.join(blocker, 'graph.csr'))
+        self.assertIsNotNone(table)
+        self.assertIs(get_routing_engine(self.g).landmarks, table)
+
+if __name__ == '__main__':
+    unittest.main()
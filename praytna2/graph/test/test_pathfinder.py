@@ -0,0 +1,149 @@
+import unittest
+import random
+import numpy as np
+import networkx as nx
+from graph_utils import CSRGraph
+from pathfinder import (CostOverlay, RoutingEngine, LANE_RADIUS_KM, MAX_LANE_ENGINES, distance_matrix, path_edges,
+                        find_path, find_path_result, find_paths_batch, get_routing_engine, lane_penalty_level)
+from fixtures import grid_graph
+
+class TestRoutingEngine(unittest.TestCase):
+    def test_matches_networkx(self):
+        """A* with the great-circle heuristic should find Dijkstra-optimal routes"""
+        G = grid_graph()
+        g = CSRGraph.from_networkx(G)
+        engine = RoutingEngine(g)
+        rng = random.Random(7)
+        for _ in range(25):
+            s, t = rng.sample(list(G.nodes), 2)
+            expected = nx.shortest_path_length(G, s, t, weight='weight')
+            result = engine.astar(g.index_of(s), g.index_of(t))
+            self.assertAlmostEqual(result.cost, expected, places=6)
+            path = [g.name_of(i) for i in result.path]
+            self.assertEqual(path[0], s)
+            self.assertEqual(path[-1], t)
+            self.assertTrue(all(G.has_edge(u, v) for u, v in zip(path[:-1], path[1:])))
+
+    def test_heuristic_expands_fewer_nodes(self):
+        """The heuristic should cut the search compared to plain Dijkstra"""
+        G = grid_graph()
+        g = CSRGraph.from_networkx(G)
+        engine = RoutingEngine(g)
+        s, t = g.index_of('node_0'), g.index_of(f'node_{G.number_of_nodes() - 1}')
+        astar = engine.astar(s, t)
+        dijkstra = engine.astar(s, t, heuristic_scale=0)
+        self.assertAlmostEqual(astar.cost, dijkstra.cost, places=6)
+        self.assertLess(astar.expanded, dijkstra.expanded)
+
+    def test_water_only_mask(self):
+        """Water-only routing should avoid non-ocean nodes unless a passage crosses them"""
+        wall = {(r, 10) for r in range(12)}
+        G = grid_graph(land=wall)
+        g = CSRGraph.from_networkx(G)
+        self.assertIsNotNone(find_path(g, 'node_0', 'node_19'))
+        self.assertIsNone(find_path(g, 'node_0', 'node_19', water_only=True))
+
+        g = g.with_edges([('node_9', 'node_11', {'weight': 222.0, 'is_passage': True, 'passage_name': 'Test Canal'})])
+        path = find_path(g, 'node_0', 'node_19', water_only=True, passage_factor=0.8)
+        self.assertIn('node_9', path)
+        self.assertIn('node_11', path)
+        self.assertFalse(any(G.nodes[n]['type'] != 'ocean' for n in path))
+
+    def test_batch_shares_trees(self):
+        """Batch routing should give the same costs as single searches, for every pair"""
+        G = grid_graph(land={(r, 10) for r in range(1, 12)})
+        g = CSRGraph.from_networkx(G)
+        pairs = [('node_0', 'node_19'), ('node_5', 'node_231'), ('node_0', 'node_239'), ('node_0', 'node_0')]
+        results = dict(find_paths_batch(g, pairs, water_only=True))
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        engine = RoutingEngine(g, water_only=True)
+        for i, (s, t) in enumerate(pairs):
+            expected = engine.astar(g.index_of(s), g.index_of(t))
+            self.assertAlmostEqual(results[i].cost, expected.cost, places=6)
+            self.assertEqual((results[i].path[0], results[i].path[-1]), (s, t))
+        self.assertEqual(results[3].path, ['node_0'])
+
+        # Pairs the water-only mask disconnects come back as None
+        self.assertIsNone(dict(find_paths_batch(g, [('node_0', 'node_30')], water_only=True))[0])
+
+    def test_distance_matrix(self):
+        """Matrix entries should be shortest-path costs, with the cap pruning longer ones"""
+        G = grid_graph()
+        g = CSRGraph.from_networkx(G)
+        nodes = ['node_0', 'node_19', 'node_120', 'node_239']
+        matrix = distance_matrix(g, nodes)
+        self.assertEqual(matrix.shape, (4, 4))
+        for i, s in enumerate(nodes):
+            for j, t in enumerate(nodes):
+                self.assertAlmostEqual(matrix[i, j], nx.shortest_path_length(G, s, t, weight='weight'), places=6)
+
+        capped = distance_matrix(g, nodes, max_distance=1500)
+        self.assertTrue(np.array_equal(np.isinf(capped), matrix > 1500))
+        self.assertEqual(distance_matrix(g, ['node_0'], ['node_19', 'node_0']).shape, (1, 2))
+
+    def test_cost_overlay(self):
+        """Re-pricing a path through an overlay should reroute without touching the engine's costs"""
+        engine = RoutingEngine(CSRGraph.from_networkx(grid_graph()))
+        base_costs = engine.costs.copy()
+        first = engine.astar(0, 239)
+        overlay = CostOverlay(engine)
+        edges = path_edges(engine, first.path)
+        overlay.update({e: 3.0 for e in edges})
+        self.assertAlmostEqual(overlay.path_cost(edges), 3 * first.cost, places=6)
+
+        second = engine.astar(0, 239, costs=overlay.costs())
+        self.assertNotEqual(second.path, first.path)
+        self.assertLess(second.cost, 3 * first.cost)
+        self.assertAlmostEqual(second.cost, overlay.path_cost(path_edges(engine, second.path)), places=6)
+        self.assertTrue(np.array_equal(engine.costs, base_costs))
+        self.assertEqual(engine.astar(0, 239).cost, first.cost)
+
+    def test_component_labels(self):
+        """Reachability should be a label comparison that agrees with search"""
+        wall = {(r, 10) for r in range(12)}
+        engine = RoutingEngine(CSRGraph.from_networkx(grid_graph(land=wall)), water_only=True)
+        labels = engine.component_labels()
+        self.assertTrue(engine.reachable(0, 9))
+        self.assertFalse(engine.reachable(0, 19))
+        self.assertIsNone(engine.astar(0, 19))
+        # Two water halves, plus each wall cell on its own once its edges are masked out
+        self.assertEqual(len(set(labels.tolist())), 2 + len(wall))
+
+    def test_lane_preference(self):
+        """A lane penalty should pull the route onto a lane without changing plain routing"""
+        G = grid_graph()
+        # A lane along row 8: edges on it are 0 km away, the rest one radius or more per row
+        for u, v in G.edges():
+            rows = [G.nodes[n]['coordinates'][1] for n in (u, v)]
+            G.edges[u, v]['lane_distance'] = LANE_RADIUS_KM * min(abs(r - 8) for r in rows)
+        g = CSRGraph.from_networkx(G)
+        plain = find_path_result(g, 'node_0', 'node_19')
+        self.assertTrue(all(g.nodes[n]['coordinates'][1] == 0 for n in plain.path))
+
+        laned = find_path_result(g, 'node_0', 'node_19', lane_penalty=4.0)
+        rows = [g.nodes[n]['coordinates'][1] for n in laned.path]
+        self.assertEqual(max(rows), 8)
+        self.assertGreater(laned.cost, plain.cost)
+        self.assertEqual(find_path_result(g, 'node_0', 'node_19', method='astar').path, plain.path)
+
+        # Dijkstra over the same lane-weighted costs agrees with the heuristic search
+        engine = RoutingEngine(g, lane_penalty=4.0)
+        self.assertAlmostEqual(engine.astar(0, 19, heuristic_scale=0).cost, laned.cost, places=6)
+        self.assertTrue(np.all(engine.costs >= RoutingEngine(g).costs))
+
+    def test_lane_engine_cache_is_bounded(self):
+        """Close lane penalties share an engine, and only a few lane engines are kept"""
+        g = CSRGraph.from_networkx(grid_graph())
+        self.assertIs(get_routing_engine(g, lane_penalty=0.5), get_routing_engine(g, lane_penalty=0.51))
+        self.assertEqual(lane_penalty_level(1e9), 10.0)
+        plain = get_routing_engine(g)
+        for step in range(20):
+            engine = get_routing_engine(g, lane_penalty=0.5 + step * 0.37)
+            self.assertEqual(engine.lane_penalty, lane_penalty_level(0.5 + step * 0.37))
+        from pathfinder import _engine_cache
+        lane_engines = [key for key in _engine_cache[g] if key[2]]
+        self.assertEqual(len(lane_engines), MAX_LANE_ENGINES)
+        self.assertIs(get_routing_engine(g), plain)
+
+if __name__ == '__main__':
+    unittest.main()
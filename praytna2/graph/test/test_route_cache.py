@@ -0,0 +1,78 @@
+import unittest
+import os
+import tempfile
+import time
+import sqlite3
+from unittest import mock
+from route_cache import RouteCache, graph_file_version, profile_key
+
+class TestRouteCache(unittest.TestCase):
+    def test_lru_eviction_and_counters(self):
+        """The least recently used route should be evicted first"""
+        cache = RouteCache(max_size=2)
+        cache.set_version('v1')
+        cache.put('node_1', 'node_2', 'p', {'path': ['node_1', 'node_2']})
+        cache.put('node_1', 'node_3', 'p', {'path': ['node_1', 'node_3']})
+        self.assertIsNotNone(cache.get('node_1', 'node_2', 'p'))  # now most recent
+        cache.put('node_4', 'node_5', 'p', {'path': ['node_4', 'node_5']})
+
+        self.assertIsNone(cache.get('node_1', 'node_3', 'p'))
+        self.assertIsNotNone(cache.get('node_1', 'node_2', 'p'))
+        self.assertIsNone(cache.get('node_1', 'node_2', 'other profile'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (2, 2, 1, 2))
+
+    def test_shared_backend_and_versions(self):
+        """Workers sharing a SQLite file should see each other's routes, but only for their graph version"""
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, 'routes.db')
+            a, b = RouteCache(db_path=db), RouteCache(db_path=db)
+            a.set_version('v1')
+            b.set_version('v1')
+            a.put('node_1', 'node_2', 'p', {'cost': 12.5})
+            self.assertEqual(b.get('node_1', 'node_2', 'p'), {'cost': 12.5})
+
+            a.set_version('v2')
+            self.assertIsNone(a.get('node_1', 'node_2', 'p'))
+            self.assertIsNone(RouteCache(db_path=db).get('node_1', 'node_2', 'p'))
+
+    def test_connections_are_closed(self):
+        """Every SQLite connection the cache opens should be closed again"""
+        opened = []
+        connect = sqlite3.connect
+
+        def tracking_connect(*args, **kwargs):
+            opened.append(connect(*args, **kwargs))
+            return opened[-1]
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch('sqlite3.connect', tracking_connect):
+            cache = RouteCache(db_path=os.path.join(tmp, 'routes.db'))
+            cache.set_version('v1')
+            cache.put('node_1', 'node_2', 'p', {'cost': 1.0})
+            cache._entries.clear()
+            self.assertEqual(cache.get('node_1', 'node_2', 'p'), {'cost': 1.0})
+            cache.clear()
+            self.assertEqual(len(opened), 5)
+            for db in opened:
+                with self.assertRaises(sqlite3.ProgrammingError):
+                    db.execute('SELECT 1')
+
+    def test_graph_file_version(self):
+        """Rewriting a graph file should change its version"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.pkl')
+            self.assertIsNone(graph_file_version(path))
+            with open(path, 'wb') as f:
+                f.write(b'one')
+            before = graph_file_version(path)
+            time.sleep(0.01)
+            with open(path, 'wb') as f:
+                f.write(b'three')
+            self.assertNotEqual(graph_file_version(path), before)
+
+    def test_profile_key_is_canonical(self):
+        self.assertEqual(profile_key(vessel={'a': 1, 'b': 2}, search=None),
+                         profile_key(search=None, vessel={'b': 2, 'a': 1}))
+
+if __name__ == '__main__':
+    unittest.main()
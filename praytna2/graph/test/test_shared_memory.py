@@ -0,0 +1,73 @@
+import unittest
+import os
+import gc
+import json
+import random
+import app2
+
+SMAPS = '/proc/self/smaps_rollup'
+PORTS = [[-74.0060, 40.7128], [-118.2426, 34.0522], [-9.1393, 38.7223], [103.8198, 1.2000],
+         [139.6917, 35.6000], [-43.1729, -22.9068], [18.4241, -33.9249], [72.8777, 18.9000]]
+
+
+def private_kb():
+    """Memory only this process maps (USS): its RSS minus pages shared with other processes"""
+    fields = {}
+    with open(SMAPS) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3:
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def worker_private_kb(own_graph):
+    """
+    Fork a worker the way gunicorn does, route some lanes in it and return its
+    private memory. With own_graph the worker loads its own copy of the graph,
+    as every worker did before the app was preloaded.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            if own_graph:
+                app2.graph = None
+                app2.load_graph()
+            client = app2.app.test_client()
+            rng = random.Random(2)
+            for _ in range(20):
+                source, destination = rng.sample(PORTS, 2)
+                client.post('/shortest_ocean_path', content_type='application/json', data=json.dumps({
+                    'source': source, 'destination': destination,
+                    'search': rng.choice(['astar', 'alt', 'ch', 'corridor'])
+                }))
+            os.write(write_fd, str(private_kb()).encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        result = f.read()
+    os.waitpid(pid, 0)
+    return int(result)
+
+
+@unittest.skipUnless(os.path.exists(SMAPS) and hasattr(os, 'fork'), "needs Linux /proc smaps_rollup")
+class TestSharedGraphMemory(unittest.TestCase):
+    def test_preloaded_workers_share_the_graph(self):
+        """Workers forked after the graph is loaded should keep far less private memory than ones with their own copy"""
+        self.assertIsNotNone(app2.load_graph())
+        gc.freeze()  # as gunicorn.conf.py does before forking
+        try:
+            shared = worker_private_kb(own_graph=False)
+            own = worker_private_kb(own_graph=True)
+        finally:
+            gc.unfreeze()
+
+        self.assertLess(shared, 0.75 * own, f"worker private memory: {shared / 1024:.0f}MB preloaded, "
+                                            f"{own / 1024:.0f}MB with its own graph")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+import json
+import tempfile
+import numpy as np
+from shapely.geometry import LineString, MultiLineString, mapping
+from graph_utils import CSRGraph, save_csr_graph, load_csr_graph
+from shipping_lanes import LaneIndex, add_lane_distances, annotate_lane_distances, edge_lane_distances, haversine_km
+from fixtures import grid_graph
+
+class TestLaneIndex(unittest.TestCase):
+    def setUp(self):
+        self.lanes = [
+            MultiLineString([[(0, 5), (10, 5), (19, 5)], [(5, 0), (5, 11)]]),
+            LineString([(175, -10), (179.99, -10)]),
+        ]
+        self.index = LaneIndex(self.lanes)
+
+    def test_segments(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertTrue(self.index.near((12, 5.02)))
+        self.assertFalse(self.index.near((12, 5.2)))
+
+    def test_segment_distances(self):
+        """Distances should be great-circle km to the closest point of the nearest lane"""
+        starts = [(0, 7), (8, 1), (12, 5), (-179, -11), (30, 30)]
+        ends = [(1, 8), (9, 1.5), (13, 6), (-178, -11), (31, 30)]
+        distances = self.index.segment_distances(starts, ends)
+        self.assertAlmostEqual(distances[0], haversine_km(0, 7, 0, 5), places=6)
+        self.assertAlmostEqual(distances[1], haversine_km(8, 1, 5, 1), places=6)
+        self.assertEqual(distances[2], 0.0)
+        self.assertAlmostEqual(distances[4], haversine_km(30, 30, 19, 5), places=6)
+
+    def test_antimeridian_edges(self):
+        """An edge across the date line should be measured from whichever side is near a lane"""
+        coords = [(179.5, -10.5), (-179.5, -10.5), (-179.5, 30)]
+        distances = edge_lane_distances(coords, np.array([0, 1, 1]), np.array([1, 0, 2]), self.index)
+        self.assertAlmostEqual(distances[0], haversine_km(179.5, -10.5, 179.5, -10), places=6)
+        self.assertEqual(distances[0], distances[1])
+        self.assertGreater(distances[2], 1000)
+
+    def test_graph_lane_distances(self):
+        """Builder annotations and the compact-graph CLI should agree edge for edge"""
+        G = grid_graph()
+        self.assertEqual(annotate_lane_distances(G, self.index), G.number_of_edges())
+        self.assertEqual(G.edges['node_100', 'node_101']['lane_distance'], 0.0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            lanes_file = os.path.join(tmp, 'lanes.geojson')
+            with open(lanes_file, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': [
+                    {'type': 'Feature', 'properties': {}, 'geometry': mapping(lane)} for lane in self.lanes]}, f)
+            path = os.path.join(tmp, 'graph.csr')
+            annotated = CSRGraph.from_networkx(G)
+            plain = CSRGraph.from_networkx(grid_graph())
+            save_csr_graph(plain, path)
+            self.assertTrue(np.isnan(load_csr_graph(path).lane_distances).all())
+
+            add_lane_distances(path, lanes_file)
+            self.assertTrue(np.allclose(load_csr_graph(path).lane_distances, annotated.lane_distances))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import random
+import networkx as nx
+from graph_utils import CSRGraph
+from app2 import haversine
+from spatial_index import NodeIndex, date_line_pairs
+
+class TestNodeIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.coords = [(rng.uniform(-180, 180), rng.uniform(-80, 80)) for _ in range(2000)]
+        self.nodes = [f'node_{i}' for i in range(len(self.coords))]
+        self.types = ['port' if i % 10 == 0 else 'ocean' for i in range(len(self.coords))]
+        self.coastal = [i % 7 == 0 for i in range(len(self.coords))]
+        self.index = NodeIndex(self.nodes, self.coords, self.types, self.coastal)
+        self.points = [[-74.0060, 40.7128], [179.9, -10.0], [-179.9, 10.0], [0.0, 89.0]]
+
+    def brute_force(self, point, keep=lambda i: True):
+        return sorted((haversine(point, c), self.nodes[i]) for i, c in enumerate(self.coords) if keep(i))
+
+    def test_nearest_matches_brute_force(self):
+        """Nearest node should match a full haversine scan, including across the date line"""
+        for point in self.points:
+            dist, node = self.brute_force(point)[0]
+            found_node, found_dist = self.index.nearest(point)
+            self.assertEqual(found_node, node)
+            self.assertAlmostEqual(found_dist, dist, places=3)
+
+    def test_type_filter(self):
+        """Type filters should only ever return nodes of the requested types"""
+        for point in self.points:
+            dist, node = self.brute_force(point, lambda i: self.types[i] == 'port')[0]
+            found_node, found_dist = self.index.nearest(point, types=('port',))
+            self.assertEqual(found_node, node)
+            self.assertAlmostEqual(found_dist, dist, places=3)
+
+    def test_radius_query(self):
+        """Radius query should return every node within the radius, nearest first"""
+        for point in self.points:
+            expected = [n for d, n in self.brute_force(point) if d <= 1500]
+            found = self.index.query_radius(point, 1500)
+            self.assertEqual([n for n, _ in found], expected)
+
+    def test_coastal_preference(self):
+        """Coastal nodes should have their distance scaled by the 0.8 preference"""
+        for point in self.points:
+            scored = sorted(
+                (haversine(point, c) * (0.8 if self.coastal[i] else 1.0), self.nodes[i])
+                for i, c in enumerate(self.coords)
+            )
+            found_node, found_dist = self.index.nearest(point, coastal_factor=0.8)
+            self.assertEqual(found_node, scored[0][1])
+            self.assertAlmostEqual(found_dist, scored[0][0], places=3)
+
+    def test_coastal_flags_from_csr(self):
+        """An index built from a CSRGraph should keep the graph's coastal flags"""
+        G = nx.Graph()
+        for node, coordinates, coastal in zip(self.nodes, self.coords, self.coastal):
+            G.add_node(node, coordinates=coordinates, type='ocean', coastal=coastal)
+        index = NodeIndex.from_graph(CSRGraph.from_networkx(G))
+        self.assertEqual(index.coastal.tolist(), self.coastal)
+        for point in self.points:
+            self.assertEqual(index.nearest(point, coastal_factor=0.8), self.index.nearest(point, coastal_factor=0.8))
+
+class TestDateLinePairs(unittest.TestCase):
+    def test_matches_pair_scan(self):
+        """Binary search should find the same pairs as comparing every west point with every east point"""
+        rng = random.Random(7)
+        coords = [(rng.choice((-1, 1)) * rng.uniform(170, 180), rng.uniform(-60, 60)) for _ in range(500)]
+        expected = {(a, b) for a, (lon_a, lat_a) in enumerate(coords) for b, (lon_b, lat_b) in enumerate(coords)
+                    if lon_a <= -175 and lon_b >= 175 and abs(lat_a - lat_b) <= 1.0}
+        i, j, km = date_line_pairs(coords, 5.0, 1.0)
+        self.assertEqual(set(zip(i.tolist(), j.tolist())), expected)
+        self.assertEqual(len(i), len(expected))
+        for a, b, d in zip(i.tolist(), j.tolist(), km.tolist()):
+            self.assertAlmostEqual(d, haversine(coords[a], coords[b]), places=3)
+            self.assertLess(d, 1200)
+
+if __name__ == '__main__':
+    unittest.main()
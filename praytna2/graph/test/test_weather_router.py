@@ -0,0 +1,135 @@
+import unittest
+import os
+import tempfile
+import random
+import numpy as np
+from graph_utils import CSRGraph
+from pathfinder import RoutingEngine
+from weather_router import (EdgeWeather, VoyageTimes, WeatherClient, WeatherRaster, edge_weather_factors, fetch_weather_raster, load_weather_raster,
+                            save_weather_raster, wave_factor)
+from weather_stub import START_TIME, WeatherStub
+from fixtures import grid_graph
+
+class TestWeatherRaster(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with WeatherStub() as stub:
+            cls.raster = fetch_weather_raster((-10.0, 40.0, 10.0, 60.0), resolution=5.0, base_url=stub.url, batch_size=7)
+            cls.requests = list(stub.requests)
+
+    def test_fetch_batches_whole_grid(self):
+        """The 5x5 grid should come back in batched requests, not one per point"""
+        self.assertEqual(sum(self.requests), 25)
+        self.assertEqual(len(self.requests), 4)
+        self.assertEqual(self.raster.fields['wave_height'].shape, (6, 5, 5))
+        self.assertEqual(self.raster.times[0], START_TIME)
+
+    def test_bilinear_and_time_interpolation(self):
+        """Linear fields should be reproduced exactly between grid points and forecast hours"""
+        lons, lats = np.array([-7.3, 0.0, 8.9]), np.array([41.2, 45.5, 47.1])
+        expected = 1 + 0.1 * lats + 0.05 * lons
+        self.assertTrue(np.allclose(self.raster.sample('wave_height', lons, lats), expected))
+        self.assertTrue(np.allclose(self.raster.sample('wind_wave_height', lons, lats, hours=2.5), 4.5))
+        self.assertTrue(np.allclose(self.raster.sample('wind_wave_direction', lons, lats), 90.0))
+
+    def test_land_cells_are_skipped(self):
+        """Points next to land use only the water corners; all-land points are NaN"""
+        self.assertAlmostEqual(float(self.raster.sample('wave_height', 0.0, 52.0)), 1 + 0.1 * 50, places=6)
+        self.assertTrue(np.isnan(self.raster.sample('wave_height', 0.0, 58.0)))
+
+    def test_save_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.weather')
+            save_weather_raster(self.raster, path)
+            loaded = load_weather_raster(path)
+            self.assertTrue(np.array_equal(loaded.times, self.raster.times))
+            self.assertAlmostEqual(float(loaded.sample('wave_height', 3.3, 44.4)),
+                                   float(self.raster.sample('wave_height', 3.3, 44.4)), places=5)
+
+    def test_directions_interpolate_across_north(self):
+        """Averaging 350 and 10 degrees should give north, not south"""
+        fields = {'wind_wave_direction': np.array([[[350.0, 10.0], [350.0, 10.0]]])}
+        raster = WeatherRaster([START_TIME], [0.0, 1.0], [0.0, 1.0], fields)
+        direction = float(raster.sample('wind_wave_direction', 0.5, 0.5))
+        self.assertLess(min(direction, 360 - direction), 1e-6)
+
+    def test_edge_factors(self):
+        """Steaming east into easterly waves should cost more than steaming west"""
+        self.assertGreater(wave_factor(3.0, 90.0, 90.0), 1.0)
+        self.assertEqual(wave_factor(3.0, 90.0, 270.0), 1.0)
+        self.assertEqual(wave_factor(np.nan, 90.0, 90.0), 1.0)
+
+        engine = RoutingEngine(CSRGraph.from_networkx(grid_graph(rows=3, cols=3)))
+        factors = edge_weather_factors(engine, self.raster)
+        self.assertEqual(len(factors), len(engine.targets))
+        self.assertTrue(np.all(factors >= 1.0))
+
+class TestTimeDependentRouting(unittest.TestCase):
+    def setUp(self):
+        self.engine = RoutingEngine(CSRGraph.from_networkx(grid_graph(rows=8, cols=12)))
+        # Easterly waves that build up through the forecast, strongest in the north
+        hours, lats, lons = 12, np.arange(-1.0, 9.0), np.arange(-1.0, 13.0)
+        height = np.arange(hours)[:, None, None] * np.clip(lats, 0, None)[None, :, None] * np.ones(len(lons)) / 4.0
+        fields = {'wind_wave_height': height, 'wind_wave_direction': np.full(height.shape, 90.0)}
+        raster = WeatherRaster(START_TIME + 3600 * np.arange(hours), lats, lons, fields)
+        self.edge_weather = EdgeWeather(self.engine, raster, step_hours=3)
+
+    def test_voyage_times_are_fifo(self):
+        """Leaving an edge one step later must never arrive earlier"""
+        voyage = VoyageTimes(self.edge_weather, self.engine.costs, speed=20.0)
+        for k in range(self.edge_weather.last_slice + 2):
+            now, later = np.asarray(voyage[k]), np.asarray(voyage[k + 1])
+            self.assertTrue(np.all(later >= now - voyage.step_hours - 1e-9))
+            self.assertTrue(np.all(now >= self.engine.costs / 20.0 - 1e-9))
+
+    def test_matches_static_search_in_calm_seas(self):
+        """With no waves the voyage time is the shortest distance over the speed"""
+        raster = self.edge_weather.raster
+        fields = {name: np.zeros_like(values) for name, values in raster.fields.items()}
+        calm = WeatherRaster(raster.times, raster.lats, raster.lons, fields)
+        voyage = VoyageTimes(EdgeWeather(self.engine, calm), self.engine.costs, speed=20.0)
+        result = self.engine.time_dependent_astar(0, 95, 20.0, voyage)
+        self.assertEqual(result.method, 'time_dependent')
+        self.assertAlmostEqual(result.cost, self.engine.astar(0, 95).cost / 20.0, places=6)
+
+    def test_astar_agrees_with_dijkstra(self):
+        """The great-circle bound at vessel speed should keep time-dependent A* exact"""
+        rng = random.Random(5)
+        n = len(self.engine.offsets) - 1
+        for _ in range(30):
+            s, t = rng.randrange(n), rng.randrange(n)
+            departure = rng.uniform(0, 10)
+            voyage = VoyageTimes(self.edge_weather, self.engine.costs, speed=15.0)
+            expected = self.engine.time_dependent_astar(s, t, 15.0, voyage, departure, heuristic_scale=0)
+            result = self.engine.time_dependent_astar(s, t, 15.0, voyage, departure)
+            self.assertAlmostEqual(result.cost, expected.cost, places=6)
+            self.assertLessEqual(result.expanded, expected.expanded)
+            self.assertGreaterEqual(result.cost, self.engine.astar(s, t).cost / 15.0 - 1e-9)
+
+class TestWeatherClient(unittest.TestCase):
+    def test_dedup_batching_and_cache(self):
+        """Points in one grid cell share a lookup, and cached cells make no requests"""
+        with WeatherStub() as stub:
+            client = WeatherClient(stub.url, grid_degrees=0.25, batch_size=2, max_workers=4)
+            points = [(10.01, 20.02), (10.02, 19.99), (11.0, 21.0), (12.0, 22.0), (60.0, 0.0)]
+            series = client.get_many(points)
+            self.assertEqual(stub.requests, [2, 2])  # 4 distinct cells in batches of 2
+            self.assertEqual(series[0]['wave_height'], series[1]['wave_height'])
+            self.assertAlmostEqual(series[2]['wave_height'][0], 1 + 0.1 * 11.0 + 0.05 * 21.0)
+            self.assertIsNone(series[4]['wave_height'][0])  # land
+
+            client.get_many(points[:3])
+            self.assertEqual(client.requests_made, 2)
+
+    def test_ttl_expiry_and_failures(self):
+        with WeatherStub() as stub:
+            client = WeatherClient(stub.url, ttl=0)
+            client.get(10.0, 20.0)
+            client.get(10.0, 20.0)
+            self.assertEqual(len(stub.requests), 2)
+
+        # The stub has shut down: lookups fail softly and are not cached
+        self.assertIsNone(client.get(30.0, 40.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Local stand-in for the Open-Meteo marine API, so weather tests never touch
+the network. Fields are simple functions of position and hour, which
+bilinear / linear interpolation reproduces exactly:
+
+    wave_height         = 1 + 0.1 * lat + 0.05 * lon
+    wind_wave_height    = 2 + hour
+    wind_wave_direction = 90 (waves from the east)
+    wind_wave_period    = 8
+
+Points with lat > LAND_LAT are "land" and get nulls, like the real API.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+START_TIME = 1700000000 - 1700000000 % 3600
+HOURS = 6
+LAND_LAT = 50.0
+
+
+def stub_point(lat, lon, hours=HOURS):
+    """The response body for one location"""
+    land = lat > LAND_LAT
+    values = lambda f: [None if land else f(h) for h in range(hours)]
+    return {
+        'latitude': lat,
+        'longitude': lon,
+        'hourly': {
+            'time': [START_TIME + 3600 * h for h in range(hours)],
+            'wave_height': values(lambda h: 1 + 0.1 * lat + 0.05 * lon),
+            'wind_wave_height': values(lambda h: 2.0 + h),
+            'wind_wave_direction': values(lambda h: 90.0),
+            'wind_wave_period': values(lambda h: 8.0),
+        }
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        lats = [float(v) for v in query['latitude'][0].split(',')]
+        lons = [float(v) for v in query['longitude'][0].split(',')]
+        self.server.requests.append(len(lats))
+        body = [stub_point(lat, lon) for lat, lon in zip(lats, lons)]
+        data = json.dumps(body[0] if len(body) == 1 else body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class WeatherStub:
+    """Context manager running the stub on a free local port; .url is its base URL"""
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/marine"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
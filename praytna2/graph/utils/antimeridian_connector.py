@@ -4,6 +4,7 @@ This ensures proper handling of routes that cross the ±180° longitude line
 """
 import networkx as nx
 from math import radians, sin, cos, sqrt, atan2
+from spatial_index import date_line_pairs
 
 def haversine_with_wrap(coord1, coord2, wrap_threshold=180):
     """
@@ -66,52 +67,22 @@ def connect_across_antimeridian(G, buffer_degrees=5.0, max_lat_diff=2.0):
     """
     print("Adding antimeridian crossing connections...")
     
-    # Find nodes near the antimeridian
-    west_nodes = []  # Nodes near -180°
-    east_nodes = []  # Nodes near +180°
+    # Pair nodes near -180 with nodes near +180 at similar latitudes
+    nodes = [node for node, data in G.nodes(data=True) if 'coordinates' in data]
+    coords = [G.nodes[node]['coordinates'][:2] for node in nodes]
+    west, east, dist = date_line_pairs(coords, buffer_degrees, max_lat_diff)
     
-    for node, data in G.nodes(data=True):
-        if 'coordinates' not in data:
-            continue
-            
-        lon = data['coordinates'][0]
-        if -180 <= lon <= -180 + buffer_degrees:
-            west_nodes.append((node, data))
-        elif 180 - buffer_degrees <= lon <= 180:
-            east_nodes.append((node, data))
-    
-    print(f"Found {len(west_nodes)} western and {len(east_nodes)} eastern nodes near antimeridian")
-    
-    # Connect matching nodes across the antimeridian
     edges_added = 0
-    
-    for west_node, west_data in west_nodes:
-        west_lon, west_lat = west_data['coordinates']
-        
-        for east_node, east_data in east_nodes:
-            east_lon, east_lat = east_data['coordinates']
-            
-            try:
-                # Only connect nodes at similar latitudes
-                if abs(west_lat - east_lat) <= max_lat_diff:
-                    # Calculate wrapped distance
-                    dist, crosses = haversine_with_wrap(
-                        west_data['coordinates'], 
-                        east_data['coordinates']
-                    )
-                    
-                    if crosses and not G.has_edge(west_node, east_node):
-                        G.add_edge(
-                            west_node, 
-                            east_node,
-                            weight=dist,
-                            antimeridian=True,
-                            edge_type='antimeridian_crossing'
-                        )
-                        edges_added += 1
-            except Exception as e:
-                print(f"Warning: Failed to connect nodes {west_node} and {east_node}: {e}")
-                continue
+    for i, j, d in zip(west.tolist(), east.tolist(), dist.tolist()):
+        if not G.has_edge(nodes[i], nodes[j]):
+            G.add_edge(
+                nodes[i], 
+                nodes[j],
+                weight=d,
+                antimeridian=True,
+                edge_type='antimeridian_crossing'
+            )
+            edges_added += 1
     
     print(f"Added {edges_added} antimeridian crossing connections")
     return G
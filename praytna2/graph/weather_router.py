@@ -0,0 +1,474 @@
+"""
+Gridded marine weather for weather-aware routing.
+
+Instead of one Open-Meteo request per path edge, the marine forecast for the
+graph's whole bounding box is fetched once into a regular lon/lat grid with
+an hourly time axis, and routing samples it by bilinear interpolation. The
+raster is saved next to the graph as a directory of .npy arrays (one
+(time, lat, lon) array per field) plus meta.json, like the CSR sidecar, so
+it is memory-mapped and shared between workers.
+
+Usage:
+    python weather_router.py ocean_graph_connected.pkl [--resolution 2] [--days 7]
+"""
+import os
+import sys
+import json
+import time
+import weakref
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from graph_utils import export_pickle, fresh_csr_path, load_csr_graph
+from pathfinder import flat_array
+from spatial_index import to_unit_xyz
+
+BASE_URL = "https://marine-api.open-meteo.com/v1/marine"
+WEATHER_FIELDS = ('wave_height', 'wind_wave_height', 'wind_wave_direction', 'wind_wave_period')
+WEATHER_SUFFIX = '.weather'
+WEATHER_FORMAT_VERSION = 1
+
+DEFAULT_RESOLUTION = 2.0
+DEFAULT_FORECAST_DAYS = 7
+REQUEST_BATCH_SIZE = 100  # Open-Meteo accepts comma-separated coordinate lists
+
+# Live lookups: coordinates are snapped to the forecast model's grid, so nearby
+# points share one cache entry and one request
+LIVE_GRID_DEGREES = 0.25
+LIVE_CACHE_TTL = 3600
+LIVE_CACHE_SIZE = 100000
+LIVE_MAX_WORKERS = 8
+
+# Time-dependent routing reads the forecast every few hours along the voyage
+TIME_STEP_HOURS = 3
+
+# Head seas of this wind-wave height (m) double an edge's cost
+WAVE_HEIGHT_SCALE = 10.0
+
+
+def weather_path_for(graph_path):
+    """Return the weather raster directory that sits next to a graph file or directory"""
+    base, _ = os.path.splitext(graph_path.rstrip('/'))
+    return base + WEATHER_SUFFIX
+
+
+def _interp_index(axis, values):
+    """Lower grid index and fraction of values along a regular ascending axis (clamped)"""
+    values = np.asarray(values, dtype=float)
+    if len(axis) < 2:
+        return np.zeros(values.shape, dtype=np.int64), np.zeros(values.shape)
+    pos = np.interp(values, axis, np.arange(len(axis)))
+    i = np.minimum(np.floor(pos).astype(np.int64), len(axis) - 2)
+    return i, pos - i
+
+
+class WeatherRaster:
+    """Hourly marine fields on a regular lon/lat grid"""
+
+    def __init__(self, times, lats, lons, fields, meta=None):
+        self.meta = meta or {}
+        self.times = np.asarray(times, dtype=np.int64)  # unix seconds, hourly
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.fields = {name: np.asarray(values) for name, values in fields.items()}
+
+    def hours_since_start(self, when=None):
+        """Forecast hour (fractional) of a unix time, now by default"""
+        when = time.time() if when is None else when
+        return (when - self.times[0]) / 3600.0
+
+    def corners(self, lons, lats):
+        """(row, col, weight) of the four grid points around each [lon, lat] point"""
+        lat_i, lat_t = _interp_index(self.lats, lats)
+        lon_i, lon_t = _interp_index(self.lons, lons)
+        return [
+            (np.minimum(lat_i + di, len(self.lats) - 1), np.minimum(lon_i + dj, len(self.lons) - 1), wi * wj)
+            for di, wi in ((0, 1 - lat_t), (1, lat_t))
+            for dj, wj in ((0, 1 - lon_t), (1, lon_t))
+        ]
+
+    def bilinear(self, name, t, corners, transform=None):
+        """Bilinear interpolation within time slices t, skipping missing (land) corners"""
+        grid = self.fields[name]
+        total = np.zeros(np.shape(corners[0][2]))
+        weight = np.zeros(np.shape(corners[0][2]))
+        for row, col, w in corners:
+            value = np.asarray(grid[t, row, col], dtype=float)
+            w = np.where(np.isfinite(value), w, 0.0)
+            if transform is not None:
+                value = transform(value)
+            total += np.where(w > 0, value, 0.0) * w
+            weight += w
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(weight > 0, total / weight, np.nan)
+
+    def direction(self, name, t, corners):
+        """Like bilinear, for compass directions (interpolated as unit vectors)"""
+        east = self.bilinear(name, t, corners, lambda d: np.sin(np.radians(d)))
+        north = self.bilinear(name, t, corners, lambda d: np.cos(np.radians(d)))
+        return np.degrees(np.arctan2(east, north)) % 360
+
+    def sample(self, name, lons, lats, hours=0.0):
+        """
+        Interpolate a field at [lon, lat] points and forecast hours (scalar or
+        per point): bilinear in space, linear in time. Directions are
+        interpolated as unit vectors. NaN where every surrounding cell is land.
+        """
+        lons, lats = np.broadcast_arrays(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        corners = self.corners(lons, lats)
+        hours = np.broadcast_to(np.asarray(hours, dtype=float), lons.shape)
+        time_i, time_t = _interp_index((self.times - self.times[0]) / 3600.0, hours)
+        next_i = np.minimum(time_i + 1, len(self.times) - 1)
+
+        def interpolate(transform=None):
+            before = self.bilinear(name, time_i, corners, transform)
+            after = self.bilinear(name, next_i, corners, transform)
+            return before * (1 - time_t) + after * time_t
+
+        if name.endswith('_direction'):
+            east = interpolate(lambda d: np.sin(np.radians(d)))
+            north = interpolate(lambda d: np.cos(np.radians(d)))
+            return np.degrees(np.arctan2(east, north)) % 360
+        return interpolate()
+
+
+def leg_geometry(start, end):
+    """Great-circle midpoints (lons, lats) and initial compass bearings of legs between [lon, lat] points"""
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    mid = to_unit_xyz(start[:, 0], start[:, 1]) + to_unit_xyz(end[:, 0], end[:, 1])
+    mid /= np.maximum(np.linalg.norm(mid, axis=1, keepdims=True), 1e-12)
+    lons = np.degrees(np.arctan2(mid[:, 1], mid[:, 0]))
+    lats = np.degrees(np.arcsin(np.clip(mid[:, 2], -1.0, 1.0)))
+
+    lon1, lat1, lon2, lat2 = np.radians([start[:, 0], start[:, 1], end[:, 0], end[:, 1]])
+    x = np.sin(lon2 - lon1) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return lons, lats, np.degrees(np.arctan2(x, y)) % 360
+
+
+def wave_factor(wind_wave_height, wind_wave_direction, bearing):
+    """
+    Cost multiplier for steaming on a bearing through wind waves coming from
+    wind_wave_direction: 1 in calm or following seas, growing with the
+    head-on component of the wave height. Missing weather counts as calm,
+    and the factor never drops below 1 so the great-circle heuristic stays
+    admissible.
+    """
+    head_on = np.cos(np.radians(np.asarray(bearing) - np.asarray(wind_wave_direction)))
+    penalty = np.nan_to_num(np.asarray(wind_wave_height, dtype=float) * head_on)
+    return 1.0 + np.maximum(penalty, 0.0) / WAVE_HEIGHT_SCALE
+
+
+def weather_factors(raster, start, end, hours=0.0):
+    """Cost multipliers for legs from start to end [lon, lat] points at the given forecast hours"""
+    lons, lats, bearings = leg_geometry(start, end)
+    return wave_factor(
+        raster.sample('wind_wave_height', lons, lats, hours),
+        raster.sample('wind_wave_direction', lons, lats, hours),
+        bearings
+    )
+
+
+def edge_weather_factors(engine, raster, hours=0.0):
+    """Cost multiplier for every edge of a routing engine, in one vectorised pass"""
+    coords = np.asarray(engine.graph.coords)
+    sources = np.repeat(np.arange(len(engine.offsets) - 1), np.diff(engine.offsets))
+    return weather_factors(raster, coords[sources], coords[engine.targets], hours)
+
+
+class EdgeWeather:
+    """
+    Weather cost factors for every edge of a routing engine, one forecast
+    slice every step_hours, each computed the first time a search reaches
+    it. Edge midpoints, bearings and interpolation corners never change, so
+    a slice is only a few vectorised gathers.
+    """
+
+    def __init__(self, engine, raster, step_hours=TIME_STEP_HOURS):
+        self.raster = raster
+        self.step_hours = step_hours
+        coords = np.asarray(engine.graph.coords)
+        sources = np.repeat(np.arange(len(engine.offsets) - 1), np.diff(engine.offsets))
+        lons, lats, self.bearings = leg_geometry(coords[sources], coords[engine.targets])
+        self.corners = raster.corners(lons, lats)
+        self.last_slice = int((len(raster.times) - 1) // step_hours)
+        self._slices = {}
+
+    def factors(self, k):
+        """Cost multiplier of every edge at forecast hour k * step_hours (the last slice beyond the forecast)"""
+        k = min(max(k, 0), self.last_slice)
+        if k not in self._slices:
+            t = int(k * self.step_hours)
+            height = self.raster.bilinear('wind_wave_height', t, self.corners)
+            direction = self.raster.direction('wind_wave_direction', t, self.corners)
+            self._slices[k] = wave_factor(height, direction, self.bearings).astype(np.float32)
+        return self._slices[k]
+
+
+# One EdgeWeather per routing engine, rebuilt when the raster is refreshed
+_edge_weather_cache = weakref.WeakKeyDictionary()
+
+
+def get_edge_weather(engine, raster):
+    """Return the EdgeWeather for an engine and raster, building it once"""
+    edge_weather = _edge_weather_cache.get(engine)
+    if edge_weather is None or edge_weather.raster is not raster:
+        edge_weather = _edge_weather_cache[engine] = EdgeWeather(engine, raster)
+    return edge_weather
+
+
+class VoyageTimes:
+    """
+    Travel time in hours of every edge at a vessel speed, per forecast slice,
+    for one time-dependent search (see RoutingEngine.time_dependent_astar).
+    Each slice is raised to at least the previous slice minus the step, so
+    leaving later never arrives earlier (FIFO) and the search stays exact.
+    """
+
+    def __init__(self, edge_weather, costs, speed):
+        self.edge_weather = edge_weather
+        self.step_hours = edge_weather.step_hours
+        self.base = np.asarray(costs, dtype=np.float64) / speed
+        self._slices = []
+        self._previous = None
+
+    def __getitem__(self, k):
+        k = min(max(k, 0), self.edge_weather.last_slice)
+        while len(self._slices) <= k:
+            times = self.base * self.edge_weather.factors(len(self._slices))
+            if self._previous is not None:
+                times = np.maximum(times, self._previous - self.step_hours)
+            self._previous = times
+            self._slices.append(flat_array(times, 'd'))
+        return self._slices[k]
+
+
+def save_weather_raster(raster, path):
+    """Write a raster to a directory of .npy arrays plus meta.json"""
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'times.npy'), raster.times)
+    np.save(os.path.join(path, 'lats.npy'), raster.lats)
+    np.save(os.path.join(path, 'lons.npy'), raster.lons)
+    for name, values in raster.fields.items():
+        np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(values, dtype=np.float32))
+    meta = dict(raster.meta, version=WEATHER_FORMAT_VERSION, fields=list(raster.fields))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def load_weather_raster(path, mmap=True):
+    """Load a raster written by save_weather_raster, memory-mapping the fields by default"""
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != WEATHER_FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {WEATHER_FORMAT_VERSION} weather raster")
+    mode = 'r' if mmap else None
+    return WeatherRaster(
+        np.load(os.path.join(path, 'times.npy')),
+        np.load(os.path.join(path, 'lats.npy')),
+        np.load(os.path.join(path, 'lons.npy')),
+        {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode) for name in meta['fields']},
+        meta
+    )
+
+
+def graph_bbox(graph, resolution=DEFAULT_RESOLUTION):
+    """(west, south, east, north) of a graph's nodes, widened to whole grid cells"""
+    coords = np.asarray(graph.coords)
+    coords = coords[np.isfinite(coords).all(axis=1)]
+    west, south = np.floor(coords.min(axis=0) / resolution) * resolution
+    east, north = np.ceil(coords.max(axis=0) / resolution) * resolution
+    return (max(float(west), -180.0), max(float(south), -90.0), min(float(east), 180.0), min(float(north), 90.0))
+
+
+def fetch_weather_raster(bbox, resolution=DEFAULT_RESOLUTION, forecast_days=DEFAULT_FORECAST_DAYS,
+                         base_url=BASE_URL, session=None, batch_size=REQUEST_BATCH_SIZE):
+    """
+    Fetch the hourly marine forecast on a regular grid over bbox (west, south,
+    east, north), batch_size grid points per request. Points the API has no
+    data for (land) and batches that fail are left as NaN.
+    """
+    west, south, east, north = bbox
+    lats = np.arange(south, north + resolution / 2, resolution)
+    lons = np.arange(west, east + resolution / 2, resolution)
+    grid_lats, grid_lons = (a.ravel() for a in np.meshgrid(lats, lons, indexing='ij'))
+    session = session or requests.Session()
+    times, fields = None, None
+
+    start = time.time()
+    for first in range(0, len(grid_lats), batch_size):
+        batch = slice(first, first + batch_size)
+        params = {
+            'latitude': ','.join(f'{v:.4f}' for v in grid_lats[batch]),
+            'longitude': ','.join(f'{v:.4f}' for v in grid_lons[batch]),
+            'hourly': ','.join(WEATHER_FIELDS),
+            'timezone': 'GMT',
+            'timeformat': 'unixtime',
+            'forecast_days': forecast_days,
+        }
+        try:
+            response = session.get(base_url, params=params, timeout=30)
+            response.raise_for_status()
+            results = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Warning: weather batch at point {first} failed: {e}")
+            continue
+
+        for k, result in enumerate(results if isinstance(results, list) else [results]):
+            hourly = result.get('hourly', {})
+            if times is None and 'time' in hourly:
+                times = np.asarray(hourly['time'], dtype=np.int64)
+                fields = {name: np.full((len(times), len(grid_lats)), np.nan, dtype=np.float32) for name in WEATHER_FIELDS}
+            if times is None:
+                continue
+            for name in WEATHER_FIELDS:
+                values = np.array(hourly.get(name, [None] * len(times)), dtype=float)[:len(times)]
+                fields[name][:len(values), first + k] = values
+        done = min(first + batch_size, len(grid_lats))
+        if done == len(grid_lats) or (first // batch_size) % 20 == 19:
+            print(f"Fetched weather for {done}/{len(grid_lats)} grid points")
+
+    if times is None:
+        raise RuntimeError("No weather data could be fetched")
+
+    meta = {'resolution': resolution, 'bbox': list(bbox), 'fetched_at': time.time(), 'fetch_time': time.time() - start}
+    shaped = {name: values.reshape(len(times), len(lats), len(lons)) for name, values in fields.items()}
+    return WeatherRaster(times, lats, lons, shaped, meta)
+
+
+def _parse_points(results, count):
+    """Per-point hourly series from an Open-Meteo response (one object or a list)"""
+    results = results if isinstance(results, list) else [results]
+    series = []
+    for result in results[:count]:
+        hourly = result.get('hourly', {})
+        series.append({name: hourly.get(name) for name in ('time',) + WEATHER_FIELDS})
+    return series + [None] * (count - len(series))
+
+
+class WeatherClient:
+    """
+    Live marine weather lookups for when no raster is available. Points are
+    snapped to the forecast grid and deduplicated, cached cells are answered
+    from a TTL cache, and the rest are fetched in multi-point requests run
+    concurrently over one pooled session.
+    """
+
+    def __init__(self, base_url=BASE_URL, grid_degrees=LIVE_GRID_DEGREES, ttl=LIVE_CACHE_TTL,
+                 max_workers=LIVE_MAX_WORKERS, max_size=LIVE_CACHE_SIZE, batch_size=REQUEST_BATCH_SIZE):
+        self.base_url = base_url
+        self.grid_degrees = grid_degrees
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.requests_made = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def cell(self, lat, lon):
+        """The forecast grid point a coordinate is looked up at"""
+        q = self.grid_degrees
+        return (round(round(lat / q) * q, 4), round(round(lon / q) * q, 4))
+
+    def _cached(self, key, now):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] < now:
+                return None
+            return entry[1]
+
+    def _fetch(self, cells):
+        """One multi-point request; returns hourly series per cell (None on failure)"""
+        params = {
+            'latitude': ','.join(f'{lat:.4f}' for lat, _ in cells),
+            'longitude': ','.join(f'{lon:.4f}' for _, lon in cells),
+            'hourly': ','.join(WEATHER_FIELDS),
+            'timezone': 'GMT',
+            'timeformat': 'unixtime',
+        }
+        try:
+            response = self.session.get(self.base_url, params=params, timeout=10)
+            response.raise_for_status()
+            return _parse_points(response.json(), len(cells))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"!! Weather API Error for {len(cells)} points: {e}")
+            return [None] * len(cells)
+        finally:
+            with self._lock:
+                self.requests_made += 1
+
+    def get_many(self, points):
+        """
+        Hourly series for a list of (lat, lon) points, in order; None where the
+        API had no answer. Every uncached grid cell is fetched in one parallel batch.
+        """
+        now = time.monotonic()
+        keys = [self.cell(lat, lon) for lat, lon in points]
+        found = {}
+        for key in set(keys):
+            value = self._cached(key, now)
+            if value is not None:
+                found[key] = value
+
+        missing = sorted(set(keys) - set(found))
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        for batch, results in zip(batches, self._pool.map(self._fetch, batches)):
+            with self._lock:
+                for key, value in zip(batch, results):
+                    found[key] = value
+                    if value is None:
+                        continue
+                    self._cache[key] = (now + self.ttl, value)
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+
+        return [found.get(key) for key in keys]
+
+    def get(self, lat, lon):
+        """Hourly series for one point, or None"""
+        return self.get_many([(lat, lon)])[0]
+
+
+def load_weather(graph_path):
+    """Load the raster saved next to a graph, or None when there is none"""
+    path = weather_path_for(graph_path)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    return load_weather_raster(path)
+
+
+def build_weather(graph_path, resolution=DEFAULT_RESOLUTION, forecast_days=DEFAULT_FORECAST_DAYS, base_url=BASE_URL):
+    """Fetch the forecast over a graph's bounding box and save it next to the graph"""
+    csr_path = fresh_csr_path(graph_path)
+    graph = load_csr_graph(csr_path) if csr_path else export_pickle(graph_path)[0]
+
+    raster = fetch_weather_raster(graph_bbox(graph, resolution), resolution, forecast_days, base_url)
+    path = weather_path_for(graph_path)
+    save_weather_raster(raster, path)
+    print(f"Saved {len(raster.times)} hours of weather on a {len(raster.lats)}x{len(raster.lons)} grid "
+          f"to {path} in {raster.meta['fetch_time']:.1f}s")
+    return path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    resolution = DEFAULT_RESOLUTION
+    if '--resolution' in sys.argv:
+        resolution = float(sys.argv[sys.argv.index('--resolution') + 1])
+    days = DEFAULT_FORECAST_DAYS
+    if '--days' in sys.argv:
+        days = int(sys.argv[sys.argv.index('--days') + 1])
+    build_weather(sys.argv[1], resolution, days)
@@ -1,4 +1,15 @@
-from api import app2
+"""
+WSGI entry point for gunicorn (see gunicorn.conf.py):
+
+    gunicorn --config gunicorn.conf.py wsgi:app
+
+The graph is loaded at import time. With preload_app the master process
+imports this module once and the workers are forked from it, so they all
+route over the same physical pages instead of each loading a copy.
+"""
+from app2 import app, load_graph
+
+load_graph()
 
 if __name__ == "__main__":
     app.run()